@@ -4,12 +4,15 @@ from app.extensions import db
 import os
 from dotenv import load_dotenv
 from flask_jwt_extended import JWTManager
-from app.models.token_blocklist import TokenBlocklist
+from app.utils.revocacion import cache_revocacion
+from app.utils.pool import opciones_engine
+from app.utils.json_provider import configurar_json
+from app.utils import auditoria_automatica  # Registra los eventos de sesión que capturan los cambios
 
 # Cargar variables de entorno del archivo .env
 load_dotenv()
 
-def create_app():
+def create_app(iniciar_tareas=True):
     app = Flask(__name__)
     
     # ============================================
@@ -19,7 +22,7 @@ def create_app():
         r"/api/*": {
             "origins": ["http://localhost:5173", "http://localhost:3000"],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
+            "allow_headers": ["Content-Type", "Authorization", "Last-Event-ID"],
             "supports_credentials": True
         }
     })
@@ -32,20 +35,83 @@ def create_app():
     
     app.config['SQLALCHEMY_DATABASE_URI'] = uri
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Pool de conexiones (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opciones_engine(uri)
 
     # --- CONFIGURACIÓN JWT ---
     app.config["JWT_SECRET_KEY"] = "clave-super-secreta-cambiala-en-produccion"
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = 3600 * 24  # Token dura 24 horas
+    # Cada cuántos segundos un worker consulta TokenBlocklist para conocer logouts hechos en otros workers
+    app.config['JWT_REVOCATION_POLL_SECONDS'] = int(os.getenv('JWT_REVOCATION_POLL_SECONDS', 5))
+    # Purga de TokenBlocklist: filas de tokens ya expirados, en lotes (0 = desactivada)
+    app.config['TOKEN_BLOCKLIST_PURGE_SECONDS'] = int(os.getenv('TOKEN_BLOCKLIST_PURGE_SECONDS', 3600))
+    app.config['TOKEN_BLOCKLIST_PURGE_BATCH'] = int(os.getenv('TOKEN_BLOCKLIST_PURGE_BATCH', 1000))
+
+    # --- HASH DE CONTRASEÑAS ---
+    # Procesos dedicados por worker (0 = calcular en el hilo de la petición)
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    # Hashes en curso/en cola permitidos por worker; por encima se responde 503
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32))
+    app.config['PASSWORD_HASH_TIMEOUT'] = int(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+    # --- TAREAS EN SEGUNDO PLANO ---
+    # Cada cuántos segundos se recalcula el snapshot del dashboard SaaS (0 = calcular en cada petición)
+    app.config['SAAS_DASHBOARD_REFRESH_SECONDS'] = int(os.getenv('SAAS_DASHBOARD_REFRESH_SECONDS', 30))
+    # Usuario.ultimo_acceso se escribe en lotes cada N segundos (retraso máximo del dato; 0 = en cada login)
+    app.config['ULTIMO_ACCESO_FLUSH_SECONDS'] = int(os.getenv('ULTIMO_ACCESO_FLUSH_SECONDS', 10))
+    app.config['ULTIMO_ACCESO_BATCH'] = int(os.getenv('ULTIMO_ACCESO_BATCH', 500))
+    # Checkpoints de stock para consultas históricas (por defecto diarios; 0 = desactivado)
+    app.config['STOCK_CHECKPOINT_SECONDS'] = int(os.getenv('STOCK_CHECKPOINT_SECONDS', 86400))
+
+    # --- AUDITORÍA ---
+    # Los registros se encolan y se escriben en lote cada N ms o cada AUDITORIA_BATCH registros (0 = en el momento)
+    app.config['AUDITORIA_FLUSH_MS'] = int(os.getenv('AUDITORIA_FLUSH_MS', 200))
+    app.config['AUDITORIA_BATCH'] = int(os.getenv('AUDITORIA_BATCH', 500))
+    # Contrapresión: con la cola llena se espera hasta AUDITORIA_ESPERA_MAX_MS y luego se responde 503
+    app.config['AUDITORIA_MAX_COLA'] = int(os.getenv('AUDITORIA_MAX_COLA', 20000))
+    app.config['AUDITORIA_ESPERA_MAX_MS'] = int(os.getenv('AUDITORIA_ESPERA_MAX_MS', 2000))
+    # Particiones mensuales (PostgreSQL): meses creados por adelantado y retención (0 = conservar todo)
+    app.config['AUDITORIA_PARTICIONES_ADELANTE'] = int(os.getenv('AUDITORIA_PARTICIONES_ADELANTE', 2))
+    app.config['AUDITORIA_PARTICIONES_SECONDS'] = int(os.getenv('AUDITORIA_PARTICIONES_SECONDS', 86400))
+    app.config['AUDITORIA_RETENCION_MESES'] = int(os.getenv('AUDITORIA_RETENCION_MESES', 0))
+    # Rango por defecto de GET /api/auditoria/buscar sin 'desde'
+    app.config['AUDITORIA_RANGO_DIAS'] = int(os.getenv('AUDITORIA_RANGO_DIAS', 30))
+    # Auditoría automática de los cambios hechos con el ORM (eventos de flush de SQLAlchemy)
+    app.config['AUDITORIA_AUTOMATICA'] = os.getenv('AUDITORIA_AUTOMATICA', '1') == '1'
+    # UPDATE como diff: sin valores anteriores (se reconstruyen) y fila completa cada N cambios del registro
+    app.config['AUDITORIA_COMPACTA'] = os.getenv('AUDITORIA_COMPACTA', '1') == '1'
+    app.config['AUDITORIA_SNAPSHOT_CADA'] = int(os.getenv('AUDITORIA_SNAPSHOT_CADA', 20))
+    # También fila completa si el último snapshot del registro es más viejo que esto
+    app.config['AUDITORIA_SNAPSHOT_MAX_DIAS'] = int(os.getenv('AUDITORIA_SNAPSHOT_MAX_DIAS', 30))
+
+    # --- NOTIFICACIONES EN VIVO (SSE) ---
+    # postgres: LISTEN/NOTIFY reparte los eventos entre workers; local: solo el worker que crea la notificación
+    app.config['NOTIF_PUSH_BACKEND'] = os.getenv(
+        'NOTIF_PUSH_BACKEND', 'postgres' if uri and uri.startswith('postgresql') else 'local')
+    # Con gthread cada stream abierto ocupa un hilo del worker: por defecto la mitad de GUNICORN_THREADS.
+    # En el servidor SSE (gunicorn_sse.conf.py, gevent) cada stream es una greenlet: el límite es worker_connections
+    if os.getenv('GUNICORN_WORKER_CLASS') == 'gevent':
+        max_streams = int(os.getenv('GUNICORN_SSE_CONEXIONES', 1000))
+    else:
+        max_streams = max(int(os.getenv('GUNICORN_THREADS', 4)) // 2, 1)
+    app.config['NOTIF_SSE_MAX_CONEXIONES'] = int(os.getenv('NOTIF_SSE_MAX_CONEXIONES', max_streams))
+    app.config['NOTIF_SSE_MAX_PENDIENTES'] = int(os.getenv('NOTIF_SSE_MAX_PENDIENTES', 100))
+    app.config['NOTIF_SSE_HEARTBEAT_SECONDS'] = int(os.getenv('NOTIF_SSE_HEARTBEAT_SECONDS', 15))
+    app.config['NOTIF_SSE_MAX_SECONDS'] = int(os.getenv('NOTIF_SSE_MAX_SECONDS', 300))
+    
+    # --- JSON ---
+    # orjson si está instalado (JSON_PROVIDER=default para usar el encoder estándar de Flask)
+    app.config['JSON_PROVIDER'] = os.getenv('JSON_PROVIDER', 'orjson')
+    configurar_json(app)
     
     db.init_app(app)
     jwt = JWTManager(app)
     
-    # Callback para verificar si un token está en la lista de bloqueo
+    # Callback para verificar si un token está en la lista de bloqueo.
+    # Se responde desde la caché en memoria; la BD solo se sondea cada JWT_REVOCATION_POLL_SECONDS.
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload):
-        jti = jwt_payload["jti"]
-        token = db.session.query(TokenBlocklist.id).filter_by(jti=jti).scalar()
-        return token is not None
+        return cache_revocacion.esta_revocado(jwt_payload["jti"])
     
     # --- REGISTRO DE BLUEPRINTS ---
     from app.routes.empresa_routes import empresa_bp
@@ -55,6 +121,7 @@ def create_app():
     from app.routes.compras_routes import compras_bp
     from app.routes.soporte_routes import soporte_bp
     from app.routes.saas_routes import saas_bp
+    from app.routes.internal_routes import internal_bp
     
     app.register_blueprint(empresa_bp, url_prefix='/api')
     app.register_blueprint(seguridad_bp, url_prefix='/api')
@@ -63,7 +130,72 @@ def create_app():
     app.register_blueprint(compras_bp, url_prefix='/api')
     app.register_blueprint(soporte_bp, url_prefix='/api')
     app.register_blueprint(saas_bp, url_prefix='/api')
+    app.register_blueprint(internal_bp, url_prefix='/api')
+
+    # --- TAREAS EN SEGUNDO PLANO ---
+    # Con gunicorn + preload_app se arrancan en cada worker (post_fork), no en el master:
+    # los hilos no sobreviven al fork.
+    if iniciar_tareas:
+        iniciar_tareas_segundo_plano(app)
     
     print("✅ Flask app inicializada correctamente con CORS habilitado")
     
-    return app
\ No newline at end of file
+    return app
+
+
+def iniciar_tareas_segundo_plano(app):
+    """
+    Hilos del proceso actual: snapshot SaaS, purga de blocklist, ultimo_acceso, checkpoints
+    de stock, escucha de notificaciones (LISTEN), escritor de auditoría y particiones de auditoría.
+    """
+    from app.services.saas_service import iniciar_refresco_dashboard
+    from app.utils.revocacion import iniciar_purga_blocklist
+    from app.utils.ultimo_acceso import iniciar_escritura_ultimo_acceso
+    from app.services.inventario_service import iniciar_checkpoints_stock
+    from app.utils.notificaciones_push import iniciar_escucha_notificaciones
+    from app.utils.auditoria_async import iniciar_escritor_auditoria
+    from app.services.soporte_service import iniciar_mantenimiento_auditoria
+    iniciar_refresco_dashboard(app)
+    iniciar_purga_blocklist(app)
+    iniciar_escritura_ultimo_acceso(app)
+    iniciar_checkpoints_stock(app)
+    iniciar_escucha_notificaciones(app)
+    iniciar_escritor_auditoria(app)
+    iniciar_mantenimiento_auditoria(app)
+
+
+def vaciar_pendientes(app):
+    """
+    Escribe lo que los buffers del proceso tienen en memoria (auditoría y ultimo_acceso).
+    Lo llaman los hooks de salida del worker de gunicorn y, como respaldo, atexit.
+    """
+    from app.utils.ultimo_acceso import buffer_ultimo_acceso
+    from app.utils.auditoria_async import escritor_auditoria
+    with app.app_context():
+        for nombre, vaciar in (('auditoría', lambda: escritor_auditoria.vaciar(todo=True)),
+                               ('ultimo_acceso', buffer_ultimo_acceso.vaciar)):
+            try:
+                vaciar()
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar {nombre} pendiente al apagar: {e}")
+
+
+def crear_tablas(app):
+    """Crea las tablas que no existen (db.create_all). No modifica tablas existentes."""
+    with app.app_context():
+        # --- IMPORTANTE: Importar TODOS los modelos aquí ---
+        # Si no los importas, SQLAlchemy no sabrá que existen y no creará las tablas.
+        from app.models import saas        # <--- ¡CRÍTICO! Para las tablas nuevas
+        from app.models import empresa     # Configuración y Empresa
+        from app.models import seguridad   # Usuarios y Roles
+        from app.models import inventario  # Productos, Proveedores, Categorías
+        from app.models import ventas      # Clientes, Ventas, Pagos
+        from app.models import compras     # Compras
+        from app.models import soporte     # Notificaciones, Auditoría
+        from app.models import token_blocklist
+
+        db.create_all()
+
+        # auditoria es una tabla particionada (PostgreSQL): necesita sus particiones para aceptar filas
+        from app.services.soporte_service import mantener_particiones_auditoria
+        mantener_particiones_auditoria()
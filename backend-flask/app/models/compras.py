@@ -1,5 +1,6 @@
 from app.extensions import db
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 from app.models.inventario import Producto
 
 class Compra(db.Model):
@@ -22,11 +23,19 @@ class Compra(db.Model):
     estado = db.Column(db.String(50))
     observaciones = db.Column(db.Text)
 
-    __table_args__ = (db.UniqueConstraint('id_empresa', 'numero_compra', name='uk_compra_empresa'),)
+    __table_args__ = (
+        db.UniqueConstraint('id_empresa', 'numero_compra', name='uk_compra_empresa'),
+        db.Index('ix_compra_empresa_fecha', 'id_empresa', 'fecha_compra', 'id_compra'),
+    )
 
     proveedor = db.relationship('app.models.inventario.Proveedor', backref='compras')
     usuario = db.relationship('app.models.seguridad.Usuario', backref='compras_registradas')
 
+    @classmethod
+    def opciones_carga(cls):
+        """Proveedor y usuario de nombre_proveedor / nombre_usuario."""
+        return (joinedload(cls.proveedor), joinedload(cls.usuario))
+
     def to_dict(self):
         # Construir nombre usuario
         nombre_usuario = None
@@ -62,6 +71,11 @@ class DetalleCompra(db.Model):
 
     producto = db.relationship('Producto', backref='detalles_compras')
 
+    @classmethod
+    def opciones_carga(cls):
+        """Producto de nombre_producto."""
+        return (joinedload(cls.producto),)
+
     def to_dict(self):
         return {
             'id_detalle_compra': self.id_detalle_compra,
@@ -1,5 +1,6 @@
 from app.extensions import db
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 
 class Categoria(db.Model):
     __tablename__ = 'categoria'
@@ -63,7 +64,10 @@ class Producto(db.Model):
 
     proveedores_vinculados = db.relationship('ProductoProveedor', backref='producto', lazy=True, cascade="all, delete-orphan")
 
-    __table_args__ = (db.UniqueConstraint('id_empresa', 'codigo_producto', name='uk_codigo_empresa'),)
+    __table_args__ = (
+        db.UniqueConstraint('id_empresa', 'codigo_producto', name='uk_codigo_empresa'),
+        db.Index('ix_producto_empresa_fecha', 'id_empresa', 'fecha_creacion', 'id_producto'),
+    )
 
     def to_dict(self):
         return {
@@ -91,6 +95,11 @@ class ProductoProveedor(db.Model):
     tiempo_entrega_dias = db.Column(db.Integer)
     proveedor_preferido = db.Column(db.Boolean, default=False)
 
+    @classmethod
+    def opciones_carga(cls):
+        """Proveedor de nombre_proveedor."""
+        return (joinedload(cls.proveedor),)
+
     def to_dict(self):
         return {
             'id_producto': self.id_producto,
@@ -116,6 +125,17 @@ class Inventario(db.Model):
 
     producto = db.relationship('Producto', backref=db.backref('inventario_items', cascade="all, delete-orphan"))
 
+    # Índice parcial: solo contiene los registros en o bajo su mínimo (listado de stock bajo)
+    __table_args__ = (
+        db.Index('ix_inventario_bajo_minimo', 'id_producto', 'id_inventario',
+                 postgresql_where=db.text('cantidad_actual <= stock_minimo')),
+    )
+
+    @classmethod
+    def opciones_carga(cls):
+        """Producto de nombre_producto."""
+        return (joinedload(cls.producto),)
+
     def to_dict(self):
         return {
             'id_inventario': self.id_inventario,
@@ -126,4 +146,45 @@ class Inventario(db.Model):
             'stock_maximo': self.stock_maximo,
             'ubicacion_fisica': self.ubicacion_fisica,
             'ultima_actualizacion': self.ultima_actualizacion.isoformat() if self.ultima_actualizacion else None
-        }
\ No newline at end of file
+        }
+
+class MovimientoStock(db.Model):
+    """
+    Libro de movimientos de stock: solo se insertan filas, nunca se modifican.
+    Lo alimentan ventas, compras recibidas, ajustes, conteos y el stock inicial.
+    """
+    __tablename__ = 'movimiento_stock'
+
+    id_movimiento = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    id_inventario = db.Column(db.String(50), db.ForeignKey('inventario.id_inventario', ondelete='CASCADE'), nullable=False)
+    id_producto = db.Column(db.String(50), db.ForeignKey('producto.id_producto', ondelete='CASCADE'), nullable=False)
+
+    tipo = db.Column(db.String(20), nullable=False) # INICIAL, VENTA, COMPRA, AJUSTE, CONTEO
+    cantidad = db.Column(db.Integer, nullable=False) # Delta: positivo entra, negativo sale
+    referencia = db.Column(db.String(50)) # id_venta / id_compra que originó el movimiento
+    # Reloj de la BD al insertar la fila (UTC), no el del servidor de la app: el corte de los
+    # checkpoints se calcula con el mismo reloj
+    fecha = db.Column(db.DateTime, nullable=False, server_default=db.text("timezone('utc', clock_timestamp())"))
+
+    # Stock a una fecha: rango de movimientos de un registro entre su checkpoint y la fecha pedida
+    __table_args__ = (db.Index('ix_movimiento_stock_inventario_fecha', 'id_inventario', 'fecha'),)
+
+    def to_dict(self):
+        return {
+            'id_movimiento': self.id_movimiento,
+            'id_inventario': self.id_inventario,
+            'id_producto': self.id_producto,
+            'tipo': self.tipo,
+            'cantidad': self.cantidad,
+            'referencia': self.referencia,
+            'fecha': self.fecha.isoformat() if self.fecha else None
+        }
+
+
+class CheckpointStock(db.Model):
+    """Foto periódica de cantidad_actual por registro de inventario (incluye movimientos con fecha <= fecha_corte)."""
+    __tablename__ = 'checkpoint_stock'
+
+    id_inventario = db.Column(db.String(50), db.ForeignKey('inventario.id_inventario', ondelete='CASCADE'), primary_key=True)
+    fecha_corte = db.Column(db.DateTime, primary_key=True)
+    cantidad = db.Column(db.Integer, nullable=False)
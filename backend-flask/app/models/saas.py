@@ -73,6 +73,12 @@ class Suscripcion(db.Model):
     fecha_fin = db.Column(db.DateTime)
     estado = db.Column(db.Boolean, default=True)
 
+    # 'plan' llega como backref desde Plan.suscripciones
+    empresa = db.relationship('Empresa', lazy=True)
+
+    # Búsqueda por lote de la suscripción activa de cada empresa (panel SaaS)
+    __table_args__ = (db.Index('ix_suscripcion_empresa_estado', 'id_empresa', 'estado'),)
+
     def to_dict(self):
         return {
             'id_suscripcion': self.id_suscripcion,
@@ -1,5 +1,6 @@
 from app.extensions import db
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 from sqlalchemy.dialects.postgresql import JSONB
 
 class Rol(db.Model):
@@ -38,6 +39,14 @@ class Usuario(db.Model):
     token_recuperacion = db.Column(db.String(255))
     token_expiracion = db.Column(db.DateTime)
 
+    # Propietario y conteo de usuarios por empresa (panel SaaS, listados por empresa)
+    __table_args__ = (db.Index('ix_usuario_empresa_rol', 'id_empresa', 'id_rol'),)
+
+    @classmethod
+    def opciones_carga(cls):
+        """Rol de nombre_rol."""
+        return (joinedload(cls.rol),)
+
     def to_dict(self):
         return {
             'id_usuario': self.id_usuario, 
@@ -20,6 +20,19 @@ class Notificacion(db.Model):
     fecha_lectura = db.Column(db.DateTime)
     datos_adicionales_json = db.Column(JSONB) # Datos extra flexibles
 
+    __table_args__ = (
+        db.Index('ix_notificacion_empresa_fecha', 'id_empresa', 'fecha_creacion', 'id_notificacion'),
+        # Bandeja del usuario: no leídas en orden y "marcar como leídas hasta ..."
+        db.Index('ix_notificacion_usuario_leida_fecha', 'id_usuario', 'leida', 'fecha_creacion'),
+        # De-duplicación de alertas de stock: alertas sin leer por usuario y registro de inventario
+        db.Index('ix_notificacion_alerta_pendiente', 'id_usuario',
+                 db.text("(datos_adicionales_json ->> 'id_inventario')"),
+                 postgresql_where=db.text("categoria = 'INVENTARIO' AND leida = false")),
+        # Búsqueda por contención (@>) en los datos adicionales
+        db.Index('ix_notificacion_datos_gin', 'datos_adicionales_json', postgresql_using='gin',
+                 postgresql_ops={'datos_adicionales_json': 'jsonb_path_ops'}),
+    )
+
     def to_dict(self):
         return {
             'id_notificacion': self.id_notificacion,
@@ -34,6 +47,16 @@ class Notificacion(db.Model):
             'datos_adicionales_json': self.datos_adicionales_json
         }
 
+class ContadorNotificacion(db.Model):
+    """
+    Cantidad de notificaciones sin leer por usuario, mantenida en la misma transacción
+    que crea, marca o borra notificaciones. El badge de la bandeja lee una sola fila.
+    """
+    __tablename__ = 'contador_notificacion'
+
+    id_usuario = db.Column(db.String(50), db.ForeignKey('usuario.id_usuario', ondelete='CASCADE'), primary_key=True)
+    no_leidas = db.Column(db.Integer, nullable=False, default=0)
+
 class Auditoria(db.Model):
     __tablename__ = 'auditoria'
     
@@ -47,7 +70,22 @@ class Auditoria(db.Model):
     accion = db.Column(db.String(50)) # INSERT, UPDATE, DELETE
     datos_anteriores_json = db.Column(JSONB)
     datos_nuevos_json = db.Column(JSONB)
-    fecha_hora = db.Column(db.DateTime, default=datetime.utcnow)
+    # Parte de la PK: en PostgreSQL la tabla se particiona por mes sobre esta columna
+    fecha_hora = db.Column(db.DateTime, primary_key=True, default=datetime.utcnow)
+    # True: datos_nuevos_json es la fila completa; False: solo los campos que cambiaron (diff)
+    es_snapshot = db.Column(db.Boolean, default=False)
+
+    __table_args__ = (
+        db.Index('ix_auditoria_empresa_fecha', 'id_empresa', 'fecha_hora', 'id_auditoria'),
+        db.Index('ix_auditoria_tabla_fecha', 'tabla_afectada', 'fecha_hora'),
+        # Búsqueda por contención (@>) en los datos: "todo lo que tocó id_producto = X"
+        db.Index('ix_auditoria_anteriores_gin', 'datos_anteriores_json', postgresql_using='gin',
+                 postgresql_ops={'datos_anteriores_json': 'jsonb_path_ops'}),
+        db.Index('ix_auditoria_nuevos_gin', 'datos_nuevos_json', postgresql_using='gin',
+                 postgresql_ops={'datos_nuevos_json': 'jsonb_path_ops'}),
+        # Particiones auditoria_AAAA_MM: las crea y elimina soporte_service (mantenimiento de auditoría)
+        {'postgresql_partition_by': 'RANGE (fecha_hora)'},
+    )
 
     def to_dict(self):
         return {
@@ -58,5 +96,6 @@ class Auditoria(db.Model):
             'accion': self.accion,
             'datos_anteriores_json': self.datos_anteriores_json,
             'datos_nuevos_json': self.datos_nuevos_json,
+            'es_snapshot': self.es_snapshot,
             'fecha_hora': self.fecha_hora.isoformat() if self.fecha_hora else None
         }
\ No newline at end of file
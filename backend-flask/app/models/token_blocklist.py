@@ -7,10 +7,14 @@ class TokenBlocklist(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String(36), nullable=False, index=True) # ID único del token
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True) # Sondeo incremental de la caché de revocación
+    # Momento en que el token revocado expira por sí solo; desde entonces la fila ya no sirve
+    # y la purga periódica la borra (índice para el DELETE por rango)
+    expires_at = db.Column(db.DateTime, index=True)
 
     def to_dict(self):
         return {
             "jti": self.jti,
-            "created_at": self.created_at
+            "created_at": self.created_at,
+            "expires_at": self.expires_at
         }
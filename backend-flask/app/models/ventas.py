@@ -1,5 +1,6 @@
 from app.extensions import db
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 from app.models.inventario import Producto
 
 class Cliente(db.Model):
@@ -18,6 +19,9 @@ class Cliente(db.Model):
     total_compras = db.Column(db.Integer, default=0)
     monto_total_historico = db.Column(db.Numeric(15, 2), default=0.00)
 
+    # Índice para listados por empresa (ver app/utils/tenant.py y paginación por cursor)
+    __table_args__ = (db.Index('ix_cliente_empresa_fecha', 'id_empresa', 'fecha_registro', 'id_cliente'),)
+
     def to_dict(self):
         return {
             'id_cliente': self.id_cliente,
@@ -54,11 +58,19 @@ class Venta(db.Model):
     tipo_venta = db.Column(db.String(50)) 
     observaciones = db.Column(db.Text)
 
-    __table_args__ = (db.UniqueConstraint('id_empresa', 'numero_factura', name='uk_factura_empresa'),)
+    __table_args__ = (
+        db.UniqueConstraint('id_empresa', 'numero_factura', name='uk_factura_empresa'),
+        db.Index('ix_venta_empresa_fecha', 'id_empresa', 'fecha_venta', 'id_venta'),
+    )
 
     cliente = db.relationship('Cliente', backref=db.backref('ventas', cascade="all, delete-orphan"))
     usuario = db.relationship('app.models.seguridad.Usuario', backref='ventas_realizadas')
 
+    @classmethod
+    def opciones_carga(cls):
+        """Cliente y vendedor de nombre_cliente / nombre_vendedor."""
+        return (joinedload(cls.cliente), joinedload(cls.usuario))
+
     def to_dict(self):
         # Construir nombre completo del vendedor para mostrar
         nombre_vendedor = None
@@ -95,6 +107,11 @@ class DetalleVenta(db.Model):
 
     producto = db.relationship('Producto', backref='detalles_ventas')
 
+    @classmethod
+    def opciones_carga(cls):
+        """Producto de nombre_producto."""
+        return (joinedload(cls.producto),)
+
     def to_dict(self):
         return {
             'id_detalle_venta': self.id_detalle_venta,
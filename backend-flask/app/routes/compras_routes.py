@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
 # Importamos el decorador de seguridad
 from app.utils.security import role_required
+from app.utils.streaming import responder
 from app.services.compras_service import (
-    crear_compra_service, obtener_compras_service, obtener_compra_id_service,
+    crear_compra_service, obtener_compras_service, exportar_compras_service, obtener_compra_id_service,
     actualizar_compra_service, eliminar_compra_service,
     crear_detalle_compra_service, obtener_detalles_por_compra_service, eliminar_detalle_compra_service
 )
@@ -21,9 +22,20 @@ def create_compra():
 @compras_bp.route('/compras', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN'])
 def get_compras():
-    response, status = obtener_compras_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_compras_service(limit, cursor)
     return jsonify(response), status
 
+@compras_bp.route('/compras/exportar', methods=['GET'])
+@role_required(['PROPIETARIO', 'ADMIN'])
+def export_compras():
+    # ?formato=ndjson|csv&desde=AAAA-MM-DD&hasta=AAAA-MM-DD
+    response, status = exportar_compras_service(
+        request.args.get('desde'), request.args.get('hasta'), request.args.get('formato', 'ndjson')
+    )
+    return responder(response, status)
+
 @compras_bp.route('/compras/<id_compra>', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN'])
 def get_compra(id_compra):
@@ -55,7 +67,9 @@ def create_detalle_compra():
 @compras_bp.route('/compras/<id_compra>/detalles', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN'])
 def get_detalles_de_compra(id_compra):
-    response, status = obtener_detalles_por_compra_service(id_compra)
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_detalles_por_compra_service(id_compra, limit, cursor)
     return jsonify(response), status
 
 @compras_bp.route('/detalles-compra/<id_detalle>', methods=['DELETE'])
@@ -25,7 +25,9 @@ def create_empresa():
 @empresa_bp.route('/empresas', methods=['GET'])
 @role_required(['SUPER_ADMIN']) 
 def get_empresas():
-    response, status = obtener_empresas_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_empresas_service(limit, cursor)
     return jsonify(response), status
 
 @empresa_bp.route('/empresas/<id_empresa>', methods=['GET'])
@@ -63,7 +65,9 @@ def create_config():
 @empresa_bp.route('/configuracion', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
 def get_configs():
-    response, status = obtener_configs_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_configs_service(limit, cursor)
     return jsonify(response), status
 
 @empresa_bp.route('/configuracion/<id_config>', methods=['GET'])
@@ -0,0 +1,31 @@
+from flask import Blueprint, jsonify
+from app.utils.security import role_required
+from app.extensions import db
+from app.utils.hashing import ejecutor_hashing
+from app.utils.pool import metricas_pool
+from app.utils.notificaciones_push import hub_notificaciones
+from app.utils.auditoria_async import escritor_auditoria
+
+internal_bp = Blueprint('internal_bp', __name__)
+
+# ================= MÉTRICAS INTERNAS (por worker) =================
+
+@internal_bp.route('/_internal/hashing', methods=['GET'])
+@role_required(['SUPER_ADMIN'])
+def get_metricas_hashing():
+    return jsonify(ejecutor_hashing.metricas()), 200
+
+@internal_bp.route('/_internal/pool', methods=['GET'])
+@role_required(['SUPER_ADMIN'])
+def get_metricas_pool():
+    return jsonify(metricas_pool.a_dict(db.engine.pool)), 200
+
+@internal_bp.route('/_internal/notificaciones', methods=['GET'])
+@role_required(['SUPER_ADMIN'])
+def get_metricas_notificaciones():
+    return jsonify(hub_notificaciones.metricas()), 200
+
+@internal_bp.route('/_internal/auditoria', methods=['GET'])
+@role_required(['SUPER_ADMIN'])
+def get_metricas_auditoria():
+    return jsonify(escritor_auditoria.metricas()), 200
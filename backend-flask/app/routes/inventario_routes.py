@@ -11,13 +11,15 @@ from app.services.inventario_service import (
     # Producto
     crear_producto_service, obtener_productos_service, obtener_producto_id_service,
     actualizar_producto_service, eliminar_producto_service,
+    importar_productos_service, leer_csv_productos,
     # Relaciones
     asignar_proveedor_a_producto_service, desvincular_proveedor_producto_service,
     actualizar_relacion_service, obtener_productos_por_proveedor_service,
     obtener_todas_las_relaciones_service,
     # Inventario
     crear_inventario_service, obtener_inventarios_service, obtener_inventario_id_service,
-    actualizar_inventario_service, eliminar_inventario_service
+    actualizar_inventario_service, eliminar_inventario_service, ajustar_inventario_service,
+    obtener_stock_en_fecha_service, obtener_stock_bajo_minimo_service
 )
 
 inventario_bp = Blueprint('inventario_bp', __name__)
@@ -33,7 +35,9 @@ def create_categoria():
 @inventario_bp.route('/categorias', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR']) 
 def get_categorias():
-    response, status = obtener_categorias_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_categorias_service(limit, cursor)
     return jsonify(response), status
 
 @inventario_bp.route('/categorias/<id_categoria>', methods=['GET'])
@@ -66,7 +70,9 @@ def create_proveedor():
 @inventario_bp.route('/proveedores', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN'])
 def get_proveedores():
-    response, status = obtener_proveedores_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_proveedores_service(limit, cursor)
     return jsonify(response), status
 
 @inventario_bp.route('/proveedores/<id_prov>', methods=['GET'])
@@ -99,7 +105,28 @@ def create_producto():
 @inventario_bp.route('/productos', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR']) 
 def get_productos():
-    response, status = obtener_productos_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_productos_service(limit, cursor)
+    return jsonify(response), status
+
+@inventario_bp.route('/productos/importar', methods=['POST'])
+@role_required(['PROPIETARIO', 'ADMIN'])
+def import_productos():
+    # Acepta un archivo CSV (multipart, campo 'archivo'), un cuerpo text/csv
+    # o JSON: [{...}, ...] / {"productos": [...]}. SUPER_ADMIN indica ?id_empresa=
+    archivo = request.files.get('archivo')
+    try:
+        if archivo:
+            filas = leer_csv_productos(archivo.read().decode('utf-8-sig'))
+        elif request.mimetype == 'text/csv':
+            filas = leer_csv_productos(request.get_data().decode('utf-8-sig'))
+        else:
+            cuerpo = request.get_json(silent=True)
+            filas = cuerpo.get('productos') if isinstance(cuerpo, dict) else cuerpo
+    except UnicodeDecodeError:
+        return jsonify({"error": "El CSV debe estar en UTF-8 (en Excel: guardar como 'CSV UTF-8')"}), 400
+    response, status = importar_productos_service(filas, request.args)
     return jsonify(response), status
 
 @inventario_bp.route('/productos/<id_prod>', methods=['GET'])
@@ -144,13 +171,17 @@ def update_product_provider_link(id_prod, id_prov):
 @inventario_bp.route('/proveedores/<id_prov>/productos', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN'])
 def get_products_by_provider(id_prov):
-    response, status = obtener_productos_por_proveedor_service(id_prov)
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_productos_por_proveedor_service(id_prov, limit, cursor)
     return jsonify(response), status
 
 @inventario_bp.route('/relaciones-compras', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN'])
 def get_all_purchase_relations():
-    response, status = obtener_todas_las_relaciones_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_todas_las_relaciones_service(limit, cursor)
     return jsonify(response), status
 
 
@@ -165,7 +196,35 @@ def create_inventario():
 @inventario_bp.route('/inventarios', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
 def get_inventarios():
-    response, status = obtener_inventarios_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_inventarios_service(limit, cursor)
+    return jsonify(response), status
+
+@inventario_bp.route('/inventarios/ajustes', methods=['POST'])
+@role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
+def ajustar_inventarios():
+    # Ajustes relativos (delta) en lote; no requiere leer el stock antes
+    response, status = ajustar_inventario_service(request.get_json())
+    return jsonify(response), status
+
+@inventario_bp.route('/inventarios/historico', methods=['GET'])
+@role_required(['PROPIETARIO', 'ADMIN'])
+def get_stock_historico():
+    # ?fecha=AAAA-MM-DD[&id_producto=...]: stock de cada registro al final de ese día
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_stock_en_fecha_service(
+        request.args.get('fecha'), request.args.get('id_producto'), limit, cursor
+    )
+    return jsonify(response), status
+
+@inventario_bp.route('/inventarios/bajo-minimo', methods=['GET'])
+@role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
+def get_stock_bajo_minimo():
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_stock_bajo_minimo_service(limit, cursor)
     return jsonify(response), status
 
 @inventario_bp.route('/inventarios/<id_inv>', methods=['GET'])
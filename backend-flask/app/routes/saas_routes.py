@@ -14,7 +14,7 @@ from app.services.saas_service import (
     actualizar_suscripcion_service, obtener_todas_suscripciones_service,
     # Estadísticas
     obtener_estadisticas_dashboard_service, obtener_empresas_recientes_service,
-    obtener_pagos_pendientes_service
+    obtener_pagos_pendientes_service, obtener_empresas_con_propietarios_service
 )
 
 saas_bp = Blueprint('saas_bp', __name__)
@@ -40,7 +40,9 @@ def logout_saas():
 @saas_bp.route('/saas/admins', methods=['GET'])
 @role_required(['SUPER_ADMIN'])
 def get_admins_saas():
-    response, status = obtener_admins_saas_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_admins_saas_service(limit, cursor)
     return jsonify(response), status
 
 @saas_bp.route('/saas/admins/<id_admin>', methods=['GET'])
@@ -70,7 +72,9 @@ def activate_admin_saas(id_admin):
 @saas_bp.route('/saas/admins/inactivos', methods=['GET'])
 @role_required(['SUPER_ADMIN'])
 def get_admins_saas_inactivos():
-    response, status = obtener_admins_saas_inactivos_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_admins_saas_inactivos_service(limit, cursor)
     return jsonify(response), status
 
 # ================= PLANES (Catálogo Global) =================
@@ -84,7 +88,9 @@ def create_plan():
 
 @saas_bp.route('/planes', methods=['GET'])
 def get_planes():
-    response, status = obtener_planes_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_planes_service(limit, cursor)
     return jsonify(response), status
 
 @saas_bp.route('/planes/<id_plan>', methods=['GET'])
@@ -114,13 +120,17 @@ def create_suscripcion():
 @saas_bp.route('/suscripciones', methods=['GET'])
 @role_required(['SUPER_ADMIN'])
 def get_todas_suscripciones():
-    response, status = obtener_todas_suscripciones_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_todas_suscripciones_service(limit, cursor)
     return jsonify(response), status
 
 @saas_bp.route('/empresas/<id_empresa>/suscripcion', methods=['GET'])
 @role_required(['SUPER_ADMIN', 'PROPIETARIO'])
 def get_suscripcion_empresa(id_empresa):
-    response, status = obtener_suscripcion_por_empresa_service(id_empresa)
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_suscripcion_por_empresa_service(id_empresa, limit, cursor)
     return jsonify(response), status
 
 @saas_bp.route('/suscripciones/<id_suscripcion>', methods=['PUT'])
@@ -147,15 +157,15 @@ def get_empresas_recientes():
 @saas_bp.route('/saas/dashboard/pagos-pendientes', methods=['GET'])
 @role_required(['SUPER_ADMIN'])
 def get_pagos_pendientes():
-    response, status = obtener_pagos_pendientes_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_pagos_pendientes_service(limit, cursor)
     return jsonify(response), status
 
-# Agregar esta ruta al archivo saas_routes.py existente
-# Después de las rutas de estadísticas
-
 @saas_bp.route('/saas/empresas', methods=['GET'])
 @role_required(['SUPER_ADMIN'])
 def get_empresas_con_propietarios():
-    from app.services.saas_service import obtener_empresas_con_propietarios_service
-    response, status = obtener_empresas_con_propietarios_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_empresas_con_propietarios_service(limit, cursor)
     return jsonify(response), status
\ No newline at end of file
@@ -46,7 +46,9 @@ def create_rol():
 @seguridad_bp.route('/roles', methods=['GET'])
 @role_required(['SUPER_ADMIN', 'PROPIETARIO', 'ADMIN'])
 def get_roles():
-    response, status = obtener_roles_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_roles_service(limit, cursor)
     return jsonify(response), status
 
 @seguridad_bp.route('/roles/<id_rol>', methods=['GET'])
@@ -79,13 +81,17 @@ def create_usuario():
 @seguridad_bp.route('/usuarios', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN'])
 def get_usuarios():
-    response, status = obtener_usuarios_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_usuarios_service(limit, cursor)
     return jsonify(response), status
 
 @seguridad_bp.route('/usuarios/inactivos', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN'])
 def get_usuarios_inactivos():
-    response, status = obtener_usuarios_inactivos_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_usuarios_inactivos_service(limit, cursor)
     return jsonify(response), status
 
 @seguridad_bp.route('/usuarios/<id_usuario>', methods=['GET'])
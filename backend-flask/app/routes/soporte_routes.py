@@ -1,9 +1,12 @@
 from flask import Blueprint, request, jsonify
 from app.utils.security import role_required
+from app.utils.streaming import responder
 from app.services.soporte_service import (
     crear_notificacion_service, obtener_notificaciones_service, obtener_notificacion_id_service,
     actualizar_notificacion_service, eliminar_notificacion_service,
-    crear_auditoria_service, obtener_auditorias_service, obtener_auditoria_id_service,
+    contar_no_leidas_service, marcar_leidas_service, stream_notificaciones_service,
+    crear_auditoria_service, obtener_auditorias_service, exportar_auditoria_service, obtener_auditoria_id_service,
+    buscar_auditoria_service, buscar_notificaciones_service, obtener_version_service,
     eliminar_auditoria_service
 )
 
@@ -22,8 +25,46 @@ def create_noti():
 @soporte_bp.route('/notificaciones', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
 def get_notis():
-    # Nota: El servicio debe encargarse de filtrar por empresa/usuario
-    response, status = obtener_notificaciones_service()
+    # Nota: El servicio filtra por la empresa del token (app/utils/tenant.py)
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_notificaciones_service(limit, cursor)
+    return jsonify(response), status
+
+@soporte_bp.route('/notificaciones/stream', methods=['GET'])
+@role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
+def stream_notis():
+    # Server-Sent Events; al reconectar el navegador envía Last-Event-ID
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('ultimo_id')
+    response, status = stream_notificaciones_service(ultimo_id)
+    return responder(response, status)
+
+@soporte_bp.route('/notificaciones/no-leidas', methods=['GET'])
+@role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
+def count_notis_no_leidas():
+    # Badge de la bandeja del usuario del token
+    response, status = contar_no_leidas_service()
+    return jsonify(response), status
+
+@soporte_bp.route('/notificaciones/marcar-leidas', methods=['POST'])
+@role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
+def mark_notis_leidas():
+    # Body opcional: {"hasta_id": "..."} o {"hasta": "AAAA-MM-DDTHH:MM:SS"}
+    response, status = marcar_leidas_service(request.get_json(silent=True))
+    return jsonify(response), status
+
+@soporte_bp.route('/notificaciones/buscar', methods=['GET'])
+@role_required(['PROPIETARIO', 'ADMIN'])
+def search_notis():
+    # ?contiene={"id_inventario":"..."} o &ruta=id_inventario&valor=... (repetibles, &valor_texto=1 sin interpretar JSON); &categoria=&tipo=&id_usuario=&leida=0|1
+    filtros = {clave: request.args.get(clave)
+               for clave in ('contiene', 'categoria', 'tipo', 'id_usuario', 'leida')}
+    filtros['rutas'] = request.args.getlist('ruta')
+    filtros['valores'] = request.args.getlist('valor')
+    filtros['valor_texto'] = request.args.get('valor_texto') == '1'
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = buscar_notificaciones_service(filtros, limit, cursor)
     return jsonify(response), status
 
 @soporte_bp.route('/notificaciones/<id_noti>', methods=['GET'])
@@ -60,7 +101,43 @@ def create_audit():
 @role_required(['PROPIETARIO', 'ADMIN'])
 # Vendedor no ve logs
 def get_audits():
-    response, status = obtener_auditorias_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    stream = request.args.get('stream') == '1'
+    response, status = obtener_auditorias_service(limit, cursor, stream)
+    return responder(response, status)
+
+@soporte_bp.route('/auditoria/exportar', methods=['GET'])
+@role_required(['PROPIETARIO', 'ADMIN'])
+def export_auditoria():
+    # ?formato=ndjson|csv&desde=AAAA-MM-DD&hasta=AAAA-MM-DD
+    response, status = exportar_auditoria_service(
+        request.args.get('desde'), request.args.get('hasta'), request.args.get('formato', 'ndjson')
+    )
+    return responder(response, status)
+
+@soporte_bp.route('/auditoria/buscar', methods=['GET'])
+@role_required(['PROPIETARIO', 'ADMIN'])
+def search_auditoria():
+    # ?desde=&hasta=&tabla=&id_usuario=&accion=&limit=&cursor=
+    # Datos: &contiene={"id_producto":"P1"} o &ruta=id_producto&valor=P1 (repetibles, &valor_texto=1), &en=anteriores|nuevos|ambos
+    filtros = {clave: request.args.get(clave)
+               for clave in ('desde', 'hasta', 'tabla', 'id_usuario', 'accion', 'contiene', 'en')}
+    filtros['rutas'] = request.args.getlist('ruta')
+    filtros['valores'] = request.args.getlist('valor')
+    filtros['valor_texto'] = request.args.get('valor_texto') == '1'
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = buscar_auditoria_service(filtros, limit, cursor)
+    return jsonify(response), status
+
+@soporte_bp.route('/auditoria/version', methods=['GET'])
+@role_required(['PROPIETARIO', 'ADMIN'])
+def get_audit_version():
+    # ?tabla=producto&id=P1&fecha=2024-05-01T12:00 (o &pk={"id_a":..,"id_b":..} si la PK es compuesta)
+    response, status = obtener_version_service(
+        request.args.get('tabla'), request.args.get('id'), request.args.get('pk'), request.args.get('fecha')
+    )
     return jsonify(response), status
 
 @soporte_bp.route('/auditoria/<id_audit>', methods=['GET'])
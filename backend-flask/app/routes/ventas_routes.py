@@ -1,9 +1,11 @@
 from flask import Blueprint, request, jsonify
 from app.utils.security import role_required
+from app.utils.streaming import responder
 from app.services.ventas_service import (
     crear_cliente_service, obtener_clientes_service, obtener_cliente_id_service,
     actualizar_cliente_service, eliminar_cliente_service,
-    crear_venta_service, obtener_ventas_service, obtener_venta_id_service,
+    crear_venta_service, obtener_ventas_service, exportar_ventas_service, obtener_venta_id_service,
+    registrar_checkout_service,
     eliminar_venta_service,
     crear_detalle_venta_service, obtener_detalles_por_venta_service, eliminar_detalle_venta_service,
     crear_pago_service, obtener_pagos_service, obtener_pago_id_service, eliminar_pago_service
@@ -24,7 +26,9 @@ def create_cliente():
 @ventas_bp.route('/clientes', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
 def get_clientes():
-    response, status = obtener_clientes_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_clientes_service(limit, cursor)
     return jsonify(response), status
 
 @ventas_bp.route('/clientes/<id_cli>', methods=['GET'])
@@ -56,11 +60,30 @@ def create_venta():
     response, status = crear_venta_service(request.get_json())
     return jsonify(response), status
 
+@ventas_bp.route('/ventas/checkout', methods=['POST'])
+@role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
+def checkout_venta():
+    # Venta + detalles + pagos + descuento de stock en una sola transacción
+    response, status = registrar_checkout_service(request.get_json())
+    return jsonify(response), status
+
 @ventas_bp.route('/ventas', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
 def get_ventas():
-    response, status = obtener_ventas_service()
-    return jsonify(response), status
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    stream = request.args.get('stream') == '1'
+    response, status = obtener_ventas_service(limit, cursor, stream)
+    return responder(response, status)
+
+@ventas_bp.route('/ventas/exportar', methods=['GET'])
+@role_required(['PROPIETARIO', 'ADMIN'])
+def export_ventas():
+    # ?formato=ndjson|csv&desde=AAAA-MM-DD&hasta=AAAA-MM-DD
+    response, status = exportar_ventas_service(
+        request.args.get('desde'), request.args.get('hasta'), request.args.get('formato', 'ndjson')
+    )
+    return responder(response, status)
 
 @ventas_bp.route('/ventas/<id_venta>', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
@@ -89,7 +112,9 @@ def create_detalle():
 @ventas_bp.route('/ventas/<id_venta>/detalles', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
 def get_detalles_de_venta(id_venta):
-    response, status = obtener_detalles_por_venta_service(id_venta)
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_detalles_por_venta_service(id_venta, limit, cursor)
     return jsonify(response), status
 
 @ventas_bp.route('/detalles-venta/<id_detalle>', methods=['DELETE'])
@@ -112,7 +137,9 @@ def create_pago():
 @ventas_bp.route('/pagos', methods=['GET'])
 @role_required(['PROPIETARIO', 'ADMIN', 'VENDEDOR'])
 def get_pagos():
-    response, status = obtener_pagos_service()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    response, status = obtener_pagos_service(limit, cursor)
     return jsonify(response), status
 
 @ventas_bp.route('/pagos/<id_pago>', methods=['GET'])
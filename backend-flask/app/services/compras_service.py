@@ -1,5 +1,12 @@
 from app.extensions import db
 from app.models.compras import Compra, DetalleCompra
+from app.models.inventario import Producto, Proveedor
+from app.models.seguridad import Usuario
+from app.utils.pagination import paginar_keyset, CursorInvalidoError
+from app.utils.streaming import ExportacionStream, rango_fechas, filtrar_rango
+from app.utils.tenant import consulta_empresa, obtener_de_empresa, id_empresa_para_crear
+from app.services.inventario_service import aplicar_deltas_stock
+from sqlalchemy import func
 import uuid
 from datetime import datetime
 
@@ -7,9 +14,15 @@ def crear_compra_service(data):
     try:
         # Validamos lo esencial.
         # Nota: id_usuario es requerido al crear, aunque luego la BD permita que sea NULL si se borra el usuario.
-        required = ['id_empresa', 'id_proveedor', 'id_usuario']
+        required = ['id_proveedor', 'id_usuario']
         for campo in required:
             if campo not in data: return {"error": f"Falta {campo}"}, 400
+        id_empresa = id_empresa_para_crear(data)
+        if not id_empresa: return {"error": "Falta id_empresa"}, 400
+        if not obtener_de_empresa(Proveedor, data['id_proveedor'], id_empresa=id_empresa):
+            return {"error": "Proveedor no encontrado"}, 404
+        if not obtener_de_empresa(Usuario, data['id_usuario'], id_empresa=id_empresa):
+            return {"error": "Usuario no encontrado"}, 404
 
         nuevo_id = data.get('id_compra', str(uuid.uuid4()))
         
@@ -24,7 +37,7 @@ def crear_compra_service(data):
 
         compra = Compra(
             id_compra=nuevo_id,
-            id_empresa=data['id_empresa'],
+            id_empresa=id_empresa,
             id_proveedor=data['id_proveedor'],
             id_usuario=data['id_usuario'],
             numero_compra=data.get('numero_compra'),
@@ -42,19 +55,46 @@ def crear_compra_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_compras_service():
+def obtener_compras_service(limit=None, cursor=None):
     # Gracias al cambio en el Modelo, to_dict() ya trae razon_social y nombres atomizados
-    compras = Compra.query.all()
-    return [c.to_dict() for c in compras], 200
+    try:
+        query = consulta_empresa(Compra).options(*Compra.opciones_carga())
+        pagina = paginar_keyset(query, (Compra.fecha_compra, Compra.id_compra),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
+
+def exportar_compras_service(desde=None, hasta=None, formato='ndjson'):
+    """Exportación completa (NDJSON o CSV) de un rango de fechas, en streaming."""
+    try:
+        inicio, fin = rango_fechas(desde, hasta)
+        query = filtrar_rango(consulta_empresa(Compra).options(*Compra.opciones_carga()), Compra.fecha_compra, inicio, fin)
+        query = query.order_by(Compra.fecha_compra.asc(), Compra.id_compra.asc())
+        return ExportacionStream(query, formato, f"compras_{desde or 'inicio'}_{hasta or 'hoy'}"), 200
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
 def obtener_compra_id_service(id_compra):
-    compra = Compra.query.get(id_compra)
+    compra = obtener_de_empresa(Compra, id_compra, *Compra.opciones_carga())
     return (compra.to_dict(), 200) if compra else ({"error": "No encontrado"}, 404)
 
 def actualizar_compra_service(id_compra, data):
-    compra = Compra.query.get(id_compra)
+    compra = obtener_de_empresa(Compra, id_compra, *Compra.opciones_carga())
     if not compra: return {"error": "Compra no encontrada"}, 404
     try:
+        # Al pasar a RECIBIDA la mercadería entra al stock y al salir de RECIBIDA se revierte
+        # (movimiento COMPRA negativo). El estado se relee con bloqueo: dos cambios concurrentes
+        # no aplican la misma transición dos veces.
+        signo = 0
+        if 'estado' in data:
+            estado_actual = db.session.query(Compra.estado) \
+                .filter(Compra.id_compra == compra.id_compra).with_for_update().scalar()
+            if data['estado'] == 'RECIBIDA' and estado_actual != 'RECIBIDA':
+                signo = 1
+            elif data['estado'] != 'RECIBIDA' and estado_actual == 'RECIBIDA':
+                signo = -1
+
         if 'estado' in data: compra.estado = data['estado']
         if 'numero_compra' in data: compra.numero_compra = data['numero_compra']
         if 'subtotal' in data: compra.subtotal = data['subtotal']
@@ -63,21 +103,41 @@ def actualizar_compra_service(id_compra, data):
         if 'observaciones' in data: compra.observaciones = data['observaciones']
         
         # Permitir cambiar proveedor o fecha
-        if 'id_proveedor' in data: compra.id_proveedor = data['id_proveedor']
+        if 'id_proveedor' in data:
+            if not obtener_de_empresa(Proveedor, data['id_proveedor'], id_empresa=compra.id_empresa):
+                return {"error": "Proveedor no encontrado"}, 404
+            compra.id_proveedor = data['id_proveedor']
         if 'fecha_entrega_estimada' in data and data['fecha_entrega_estimada']:
              try:
                 compra.fecha_entrega_estimada = datetime.fromisoformat(data['fecha_entrega_estimada'].replace('Z', '+00:00'))
              except:
                 pass
 
+        sin_inventario = []
+        if signo:
+            cantidades = dict(
+                db.session.query(DetalleCompra.id_producto, func.sum(DetalleCompra.cantidad))
+                .filter(DetalleCompra.id_compra == compra.id_compra)
+                .group_by(DetalleCompra.id_producto).all()
+            )
+            deltas = {p: signo * int(c) for p, c in cantidades.items() if c}
+            aplicados = aplicar_deltas_stock(deltas, por_producto=True, permitir_negativo=True,
+                                             id_empresa=compra.id_empresa,
+                                             tipo='COMPRA', referencia=compra.id_compra)
+            sin_inventario = sorted(set(deltas) - set(aplicados))
+
         db.session.commit()
-        return {"message": "Compra actualizada", "compra": compra.to_dict()}, 200
+        respuesta = {"message": "Compra actualizada", "compra": compra.to_dict()}
+        if sin_inventario:
+            # Productos sin registro de Inventario: su stock no se movió
+            respuesta["productos_sin_inventario"] = sin_inventario
+        return respuesta, 200
     except Exception as e:
         db.session.rollback()
         return {"error": str(e)}, 500
 
 def eliminar_compra_service(id_compra):
-    compra = Compra.query.get(id_compra)
+    compra = obtener_de_empresa(Compra, id_compra)
     if not compra: return {"error": "No encontrado"}, 404
     try:
         db.session.delete(compra)
@@ -92,6 +152,11 @@ def crear_detalle_compra_service(data):
     try:
         if 'id_compra' not in data or 'id_producto' not in data:
             return {"error": "Faltan datos obligatorios"}, 400
+        compra = obtener_de_empresa(Compra, data['id_compra'])
+        if not compra:
+            return {"error": "Compra no encontrada"}, 404
+        if not obtener_de_empresa(Producto, data['id_producto'], id_empresa=compra.id_empresa):
+            return {"error": "Producto no encontrado"}, 404
 
         nuevo_id = data.get('id_detalle_compra', str(uuid.uuid4()))
         detalle = DetalleCompra(
@@ -109,12 +174,17 @@ def crear_detalle_compra_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_detalles_por_compra_service(id_compra):
-    detalles = DetalleCompra.query.filter_by(id_compra=id_compra).all()
-    return [d.to_dict() for d in detalles], 200
+def obtener_detalles_por_compra_service(id_compra, limit=None, cursor=None):
+    try:
+        query = consulta_empresa(DetalleCompra).options(*DetalleCompra.opciones_carga())
+        query = query.filter(DetalleCompra.id_compra == id_compra)
+        pagina = paginar_keyset(query, (DetalleCompra.id_detalle_compra,), limit, cursor)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def eliminar_detalle_compra_service(id_detalle):
-    detalle = DetalleCompra.query.get(id_detalle)
+    detalle = obtener_de_empresa(DetalleCompra, id_detalle)
     if not detalle: return {"error": "No encontrado"}, 404
     try:
         db.session.delete(detalle)
@@ -1,6 +1,8 @@
 from app.extensions import db
 # IMPORTANTE: Ya no importamos PlanSuscripcion aquí porque se movió al módulo SaaS
 from app.models.empresa import Empresa, ConfiguracionEmpresa
+from app.utils.pagination import paginar_keyset, CursorInvalidoError
+from app.utils.tenant import consulta_empresa, obtener_de_empresa, id_empresa_para_crear
 import uuid
 
 # ==========================================
@@ -51,18 +53,22 @@ def crear_empresa_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_empresas_service():
-    empresas = Empresa.query.all()
-    return [e.to_dict() for e in empresas], 200
+def obtener_empresas_service(limit=None, cursor=None):
+    try:
+        pagina = paginar_keyset(consulta_empresa(Empresa), (Empresa.fecha_registro, Empresa.id_empresa),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def obtener_empresa_por_id_service(id_empresa):
-    empresa = Empresa.query.get(id_empresa)
+    empresa = obtener_de_empresa(Empresa, id_empresa)
     if not empresa:
         return {"error": "Empresa no encontrada"}, 404
     return empresa.to_dict(), 200
 
 def actualizar_empresa_service(id_empresa, data):
-    empresa = Empresa.query.get(id_empresa)
+    empresa = obtener_de_empresa(Empresa, id_empresa)
     if not empresa:
         return {"error": "Empresa no encontrada"}, 404
     
@@ -84,7 +90,7 @@ def actualizar_empresa_service(id_empresa, data):
         return {"error": str(e)}, 500
 
 def eliminar_empresa_service(id_empresa):
-    empresa = Empresa.query.get(id_empresa)
+    empresa = obtener_de_empresa(Empresa, id_empresa)
     if not empresa:
         return {"error": "Empresa no encontrada"}, 404
     
@@ -103,13 +109,14 @@ def eliminar_empresa_service(id_empresa):
 
 def crear_config_service(data):
     try:
-        if 'id_empresa' not in data:
+        id_empresa = id_empresa_para_crear(data)
+        if not id_empresa:
              return {"error": "Falta id_empresa"}, 400
 
         nuevo_id = data.get('id_config', str(uuid.uuid4()))
         nueva_config = ConfiguracionEmpresa(
             id_config=nuevo_id,
-            id_empresa=data['id_empresa'],
+            id_empresa=id_empresa,
             moneda_default=data.get('moneda_default', 'BOB'),
             impuesto_iva=data.get('impuesto_iva', 13.00),
             formato_factura=data.get('formato_factura', 'carta'),
@@ -124,18 +131,22 @@ def crear_config_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_configs_service():
-    configs = ConfiguracionEmpresa.query.all()
-    return [c.to_dict() for c in configs], 200
+def obtener_configs_service(limit=None, cursor=None):
+    try:
+        pagina = paginar_keyset(consulta_empresa(ConfiguracionEmpresa), (ConfiguracionEmpresa.id_config,),
+                                limit, cursor)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def obtener_config_por_id_service(id_config):
-    config = ConfiguracionEmpresa.query.get(id_config)
+    config = obtener_de_empresa(ConfiguracionEmpresa, id_config)
     if not config:
         return {"error": "Configuración no encontrada"}, 404
     return config.to_dict(), 200
 
 def actualizar_config_service(id_config, data):
-    config = ConfiguracionEmpresa.query.get(id_config)
+    config = obtener_de_empresa(ConfiguracionEmpresa, id_config)
     if not config:
         return {"error": "Configuración no encontrada"}, 404
     
@@ -154,7 +165,7 @@ def actualizar_config_service(id_config, data):
         return {"error": str(e)}, 500
 
 def eliminar_config_service(id_config):
-    config = ConfiguracionEmpresa.query.get(id_config)
+    config = obtener_de_empresa(ConfiguracionEmpresa, id_config)
     if not config:
         return {"error": "Configuración no encontrada"}, 404
     try:
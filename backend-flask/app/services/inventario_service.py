@@ -1,18 +1,36 @@
 from app.extensions import db
-from app.models.inventario import Categoria, Proveedor, Producto, ProductoProveedor, Inventario
+from app.models.inventario import Categoria, Proveedor, Producto, ProductoProveedor, Inventario, MovimientoStock, CheckpointStock
+from app.models.empresa import ConfiguracionEmpresa
+from app.models.seguridad import Usuario
+from app.models.soporte import Notificacion
+from app.services.soporte_service import insertar_notificaciones
+from app.utils.pagination import paginar_keyset, CursorInvalidoError
+from app.utils.tenant import consulta_empresa, obtener_de_empresa, id_empresa_para_crear, id_empresa_actual
+from app.utils.streaming import rango_fechas
+from app.utils.background import iniciar_tarea_periodica
+from app.utils.auditoria_automatica import auditar_filas
+from flask import current_app
+from sqlalchemy import func, literal_column, values, column, update, insert, select, case, true, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import joinedload, selectinload
+from decimal import Decimal, InvalidOperation
+from datetime import datetime, timedelta
+import csv
+import io
 import uuid
 
 # ==================== CRUD CATEGORIA ====================
 
 def crear_categoria_service(data):
     try:
-        if 'id_empresa' not in data:
+        id_empresa = id_empresa_para_crear(data)
+        if not id_empresa:
             return {"error": "id_empresa es obligatorio"}, 400
 
         nuevo_id = data.get('id_categoria', str(uuid.uuid4()))
         nueva_cat = Categoria(
             id_categoria=nuevo_id,
-            id_empresa=data['id_empresa'],
+            id_empresa=id_empresa,
             nombre=data.get('nombre'),
             descripcion=data.get('descripcion'),
             activo=data.get('activo', True),
@@ -25,19 +43,24 @@ def crear_categoria_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_categorias_service():
-    # En producción deberías filtrar por id_empresa
-    cats = Categoria.query.all()
-    return [c.to_dict() for c in cats], 200
+def obtener_categorias_service(limit=None, cursor=None):
+    # consulta_empresa filtra por el id_empresa del token JWT
+    try:
+        pagina = paginar_keyset(consulta_empresa(Categoria),
+                                (Categoria.orden_visualizacion, Categoria.id_categoria),
+                                limit, cursor)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def obtener_categoria_por_id_service(id_categoria):
-    cat = Categoria.query.get(id_categoria)
+    cat = obtener_de_empresa(Categoria, id_categoria)
     if not cat:
         return {"error": "Categoría no encontrada"}, 404
     return cat.to_dict(), 200
 
 def actualizar_categoria_service(id_categoria, data):
-    cat = Categoria.query.get(id_categoria)
+    cat = obtener_de_empresa(Categoria, id_categoria)
     if not cat:
         return {"error": "Categoría no encontrada"}, 404
     try:
@@ -53,7 +76,7 @@ def actualizar_categoria_service(id_categoria, data):
         return {"error": str(e)}, 500
 
 def eliminar_categoria_service(id_categoria):
-    cat = Categoria.query.get(id_categoria)
+    cat = obtener_de_empresa(Categoria, id_categoria)
     if not cat:
         return {"error": "Categoría no encontrada"}, 404
     try:
@@ -68,13 +91,14 @@ def eliminar_categoria_service(id_categoria):
 def crear_proveedor_service(data):
     try:
         # CAMBIO: nombre -> razon_social
-        if 'id_empresa' not in data or 'razon_social' not in data:
+        id_empresa = id_empresa_para_crear(data)
+        if not id_empresa or 'razon_social' not in data:
             return {"error": "Faltan datos obligatorios (id_empresa, razon_social)"}, 400
 
         nuevo_id = data.get('id_proveedor', str(uuid.uuid4()))
         prov = Proveedor(
             id_proveedor=nuevo_id,
-            id_empresa=data['id_empresa'],
+            id_empresa=id_empresa,
             razon_social=data.get('razon_social'), # CAMBIO
             telefono=data.get('telefono'),
             email=data.get('email'),
@@ -90,16 +114,19 @@ def crear_proveedor_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_proveedores_service():
-    provs = Proveedor.query.all()
-    return [p.to_dict() for p in provs], 200
+def obtener_proveedores_service(limit=None, cursor=None):
+    try:
+        pagina = paginar_keyset(consulta_empresa(Proveedor), (Proveedor.id_proveedor,), limit, cursor)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def obtener_proveedor_id_service(id_prov):
-    prov = Proveedor.query.get(id_prov)
+    prov = obtener_de_empresa(Proveedor, id_prov)
     return (prov.to_dict(), 200) if prov else ({"error": "No encontrado"}, 404)
 
 def actualizar_proveedor_service(id_prov, data):
-    prov = Proveedor.query.get(id_prov)
+    prov = obtener_de_empresa(Proveedor, id_prov)
     if not prov: return {"error": "No encontrado"}, 404
     try:
         # CAMBIO: nombre -> razon_social
@@ -118,7 +145,7 @@ def actualizar_proveedor_service(id_prov, data):
         return {"error": str(e)}, 500
 
 def eliminar_proveedor_service(id_prov):
-    prov = Proveedor.query.get(id_prov)
+    prov = obtener_de_empresa(Proveedor, id_prov)
     if not prov: return {"error": "No encontrado"}, 404
     try:
         db.session.delete(prov)
@@ -132,13 +159,16 @@ def eliminar_proveedor_service(id_prov):
 # ==================== CRUD PRODUCTO ====================
 def crear_producto_service(data):
     try:
-        if 'id_empresa' not in data:
+        id_empresa = id_empresa_para_crear(data)
+        if not id_empresa:
             return {"error": "id_empresa obligatorio"}, 400
+        if data.get('id_categoria') and not obtener_de_empresa(Categoria, data['id_categoria'], id_empresa=id_empresa):
+            return {"error": "Categoría no encontrada"}, 404
             
         nuevo_id = data.get('id_producto', str(uuid.uuid4()))
         prod = Producto(
             id_producto=nuevo_id,
-            id_empresa=data['id_empresa'],
+            id_empresa=id_empresa,
             id_categoria=data.get('id_categoria'),
             codigo_producto=data.get('codigo_producto'),
             nombre=data.get('nombre'),
@@ -156,12 +186,20 @@ def crear_producto_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_productos_service():
-    prods = Producto.query.all()
-    return [p.to_dict() for p in prods], 200
+def obtener_productos_service(limit=None, cursor=None):
+    try:
+        pagina = paginar_keyset(consulta_empresa(Producto), (Producto.fecha_creacion, Producto.id_producto),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def obtener_producto_id_service(id_prod):
-    prod = Producto.query.get(id_prod)
+    # Proveedores asociados en una sola consulta adicional (no una por relación)
+    prod = obtener_de_empresa(
+        Producto, id_prod,
+        selectinload(Producto.proveedores_vinculados).joinedload(ProductoProveedor.proveedor)
+    )
     if not prod: return {"error": "Producto no encontrado"}, 404
     
     # Devolver también los proveedores asociados con sus precios especiales
@@ -171,7 +209,7 @@ def obtener_producto_id_service(id_prod):
     return resultado, 200
 
 def actualizar_producto_service(id_prod, data):
-    prod = Producto.query.get(id_prod)
+    prod = obtener_de_empresa(Producto, id_prod)
     if not prod: return {"error": "No encontrado"}, 404
     try:
         if 'nombre' in data: prod.nombre = data['nombre']
@@ -180,7 +218,10 @@ def actualizar_producto_service(id_prod, data):
         if 'precio_compra' in data: prod.precio_compra = data['precio_compra']
         if 'unidad_medida' in data: prod.unidad_medida = data['unidad_medida']
         if 'imagen_url' in data: prod.imagen_url = data['imagen_url']
-        if 'id_categoria' in data: prod.id_categoria = data['id_categoria']
+        if 'id_categoria' in data:
+            if data['id_categoria'] and not obtener_de_empresa(Categoria, data['id_categoria'], id_empresa=prod.id_empresa):
+                return {"error": "Categoría no encontrada"}, 404
+            prod.id_categoria = data['id_categoria']
         
         db.session.commit()
         return {"message": "Actualizado", "producto": prod.to_dict()}, 200
@@ -189,7 +230,7 @@ def actualizar_producto_service(id_prod, data):
         return {"error": str(e)}, 500
 
 def eliminar_producto_service(id_prod):
-    prod = Producto.query.get(id_prod)
+    prod = obtener_de_empresa(Producto, id_prod)
     if not prod: return {"error": "No encontrado"}, 404
     try:
         db.session.delete(prod)
@@ -200,14 +241,262 @@ def eliminar_producto_service(id_prod):
         return {"error": str(e)}, 500
 
 
+# ==================== IMPORTACIÓN MASIVA DE PRODUCTOS ====================
+# Columnas aceptadas (CSV o JSON): codigo_producto*, nombre*, descripcion, precio_venta, precio_compra,
+# unidad_medida, imagen_url, activo, categoria (nombre) o id_categoria,
+# cantidad_inicial, stock_minimo, stock_maximo, ubicacion_fisica.   (* obligatorias)
+
+_CAMPOS_PRODUCTO_IMPORT = ('nombre', 'descripcion', 'precio_venta', 'precio_compra',
+                           'unidad_medida', 'imagen_url', 'activo', 'id_categoria')
+# Valores de los productos nuevos cuya celda viene vacía (como en crear_producto_service)
+_DEFECTOS_PRODUCTO_NUEVO = {'activo': True, 'precio_venta': Decimal('0'), 'precio_compra': Decimal('0')}
+
+
+def leer_csv_productos(texto):
+    """Filas (dict) de un CSV con encabezado; acepta ',' o ';' como separador."""
+    muestra = texto[:4096]
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;')
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.DictReader(io.StringIO(texto), dialect=dialecto)
+    return [{(k or '').strip(): v for k, v in fila.items()} for fila in lector]
+
+
+def _texto(valor):
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+
+def _decimal(valor, campo):
+    valor = _texto(valor)
+    if valor is None:
+        return None
+    try:
+        numero = Decimal(valor.replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"{campo} no es un número válido")
+    if numero < 0:
+        raise ValueError(f"{campo} no puede ser negativo")
+    return numero
+
+
+def _entero(valor, campo, por_defecto=None):
+    valor = _texto(valor)
+    if valor is None:
+        return por_defecto
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ValueError(f"{campo} debe ser un número entero")
+    if numero < 0:
+        raise ValueError(f"{campo} no puede ser negativo")
+    return numero
+
+
+def _booleano(valor):
+    """None si la celda está vacía: al actualizar conserva el valor; al insertar se usa el del modelo."""
+    if isinstance(valor, bool):
+        return valor
+    valor = _texto(valor)
+    return None if valor is None else valor.lower() in ('1', 'true', 'si', 'sí', 's', 'x', 'activo')
+
+
+def _validar_fila_producto(fila):
+    codigo = _texto(fila.get('codigo_producto'))
+    nombre = _texto(fila.get('nombre'))
+    if not codigo:
+        raise ValueError("codigo_producto es obligatorio")
+    if not nombre:
+        raise ValueError("nombre es obligatorio")
+    producto = {
+        'codigo_producto': codigo,
+        'nombre': nombre,
+        'descripcion': _texto(fila.get('descripcion')),
+        'precio_venta': _decimal(fila.get('precio_venta'), 'precio_venta'),
+        'precio_compra': _decimal(fila.get('precio_compra'), 'precio_compra'),
+        'unidad_medida': _texto(fila.get('unidad_medida')),
+        'imagen_url': _texto(fila.get('imagen_url')),
+        'activo': _booleano(fila.get('activo')),
+        'id_categoria': _texto(fila.get('id_categoria')),
+    }
+    inventario = {
+        'cantidad_actual': _entero(fila.get('cantidad_inicial', fila.get('cantidad_actual')), 'cantidad_inicial', 0),
+        'stock_minimo': _entero(fila.get('stock_minimo'), 'stock_minimo', 0),
+        'stock_maximo': _entero(fila.get('stock_maximo'), 'stock_maximo'),
+        'ubicacion_fisica': _texto(fila.get('ubicacion_fisica')),
+    }
+    return producto, _texto(fila.get('categoria')), inventario
+
+
+def _resolver_categorias(id_empresa, nombres, ids):
+    """
+    nombre -> id_categoria de la empresa, creando en un solo INSERT las que no existen.
+    Devuelve también el conjunto de id_categoria recibidos que sí pertenecen a la empresa.
+    """
+    por_nombre = {}
+    if nombres:
+        existentes = db.session.query(Categoria.nombre, Categoria.id_categoria).filter(
+            Categoria.id_empresa == id_empresa, Categoria.nombre.in_(nombres)
+        ).all()
+        por_nombre = {nombre: id_cat for nombre, id_cat in existentes}
+        nuevas = [{'id_categoria': str(uuid.uuid4()), 'id_empresa': id_empresa, 'nombre': nombre, 'activo': True}
+                  for nombre in sorted(nombres - por_nombre.keys())]
+        if nuevas:
+            db.session.execute(pg_insert(Categoria), nuevas)
+            auditar_filas(Categoria, 'INSERT', nuevas)
+            por_nombre.update({c['nombre']: c['id_categoria'] for c in nuevas})
+
+    validos = set()
+    if ids:
+        validos = {id_cat for (id_cat,) in db.session.query(Categoria.id_categoria).filter(
+            Categoria.id_empresa == id_empresa, Categoria.id_categoria.in_(ids)
+        )}
+    return por_nombre, validos
+
+
+def importar_productos_service(filas, data=None):
+    """
+    Alta/actualización masiva del catálogo.
+
+    Valida todas las filas en memoria, resuelve categorías en bloque y hace
+    INSERT ... ON CONFLICT ON CONSTRAINT uk_codigo_empresa DO UPDATE en lotes multi-fila.
+    Para los productos nuevos crea su Inventario inicial (un INSERT por lote);
+    los existentes conservan su stock. Las filas con errores se informan y no se importan.
+    """
+    id_empresa = id_empresa_para_crear(data or {})
+    if not id_empresa:
+        return {"error": "id_empresa obligatorio"}, 400
+    if not isinstance(filas, list) or not filas:
+        return {"error": "Se esperaba una lista de productos (JSON) o un CSV con encabezado"}, 400
+
+    max_filas = current_app.config.get('PRODUCTOS_IMPORT_MAX_FILAS', 50000)
+    if len(filas) > max_filas:
+        return {"error": f"Máximo {max_filas} filas por importación"}, 400
+
+    # 1. Validación (sin tocar la BD)
+    errores = []
+    validas = []  # (número de fila, producto, nombre categoría, inventario)
+    vistos = {}
+    for numero, fila in enumerate(filas, start=1):
+        try:
+            if not isinstance(fila, dict):
+                raise ValueError("La fila debe ser un objeto")
+            producto, categoria, inventario = _validar_fila_producto(fila)
+            if producto['codigo_producto'] in vistos:
+                raise ValueError(f"codigo_producto repetido (fila {vistos[producto['codigo_producto']]})")
+            vistos[producto['codigo_producto']] = numero
+            validas.append((numero, producto, categoria, inventario))
+        except ValueError as e:
+            errores.append({"fila": numero, "codigo_producto": fila.get('codigo_producto') if isinstance(fila, dict) else None,
+                            "error": str(e)})
+
+    try:
+        # 2. Categorías de todo el archivo en dos consultas
+        nombres = {cat for _, _, cat, _ in validas if cat}
+        ids = {p['id_categoria'] for _, p, _, _ in validas if p['id_categoria']}
+        por_nombre, ids_validos = _resolver_categorias(id_empresa, nombres, ids)
+
+        registros = []
+        inventario_por_codigo = {}
+        for numero, producto, categoria, inventario in validas:
+            if categoria:
+                producto['id_categoria'] = por_nombre[categoria]
+            elif producto['id_categoria'] and producto['id_categoria'] not in ids_validos:
+                errores.append({"fila": numero, "codigo_producto": producto['codigo_producto'],
+                                "error": "id_categoria no existe en la empresa"})
+                continue
+            producto['id_producto'] = str(uuid.uuid4())
+            producto['id_empresa'] = id_empresa
+            registros.append(producto)
+            inventario_por_codigo[producto['codigo_producto']] = inventario
+
+        # 3. Upsert por lotes
+        insertados = actualizados = 0
+        tamano_lote = current_app.config.get('PRODUCTOS_IMPORT_BATCH', 1000)
+        for inicio in range(0, len(registros), tamano_lote):
+            lote = registros[inicio:inicio + tamano_lote]
+            stmt = pg_insert(Producto).values(lote)
+            stmt = stmt.on_conflict_do_update(
+                constraint='uk_codigo_empresa',
+                # Una columna vacía en el archivo no borra el dato que ya tenía el producto
+                set_={campo: func.coalesce(stmt.excluded[campo], Producto.__table__.c[campo])
+                      for campo in _CAMPOS_PRODUCTO_IMPORT}
+            ).returning(
+                # La fila completa resultante: es el snapshot que se audita
+                *Producto.__table__.c,
+                # xmax = 0 solo en filas recién insertadas (no en las actualizadas por el ON CONFLICT)
+                literal_column('xmax = 0').label('insertado')
+            )
+            nuevos_inventarios = []
+            auditados = {'INSERT': [], 'UPDATE': []}
+            incompletos = []
+            for fila in db.session.execute(stmt):
+                producto = dict(fila._mapping)
+                insertado = producto.pop('insertado')
+                auditados['INSERT' if insertado else 'UPDATE'].append(producto)
+                if not insertado:
+                    actualizados += 1
+                    continue
+                insertados += 1
+                # Celdas vacías: el coalesce conserva el valor de los existentes; los nuevos toman
+                # los mismos valores por defecto que crear_producto_service (activos, precios en 0)
+                vacios = {campo: valor for campo, valor in _DEFECTOS_PRODUCTO_NUEVO.items() if producto[campo] is None}
+                if vacios:
+                    producto.update(vacios)
+                    incompletos.append(producto['id_producto'])
+                nuevos_inventarios.append({'id_inventario': str(uuid.uuid4()), 'id_producto': producto['id_producto'],
+                                           **inventario_por_codigo[producto['codigo_producto']]})
+            if incompletos:
+                db.session.execute(
+                    update(Producto).where(Producto.id_producto.in_(incompletos))
+                    .values({campo: func.coalesce(Producto.__table__.c[campo], valor)
+                             for campo, valor in _DEFECTOS_PRODUCTO_NUEVO.items()})
+                    .execution_options(synchronize_session=False)
+                )
+            for accion, productos in auditados.items():
+                auditar_filas(Producto, accion, productos)
+            if nuevos_inventarios:
+                db.session.execute(pg_insert(Inventario), nuevos_inventarios)
+                auditar_filas(Inventario, 'INSERT', nuevos_inventarios, id_empresa)
+                registrar_movimientos([{'id_inventario': i['id_inventario'], 'id_producto': i['id_producto'],
+                                        'tipo': 'INICIAL', 'cantidad': i['cantidad_actual'] or 0}
+                                       for i in nuevos_inventarios])
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return {"error": str(e)}, 500
+
+    errores.sort(key=lambda e: e['fila'])
+    respuesta = {
+        "message": "Importación finalizada",
+        "total_filas": len(filas),
+        "insertados": insertados,
+        "actualizados": actualizados,
+        "con_errores": len(errores),
+        "errores": errores
+    }
+    return respuesta, 200 if insertados or actualizados else 400
+
+
 # ==================== RELACIÓN PRODUCTO - PROVEEDOR ====================
 def asignar_proveedor_a_producto_service(id_producto, data):
     try:
         id_proveedor = data.get('id_proveedor')
         if not id_proveedor: return {"error": "id_proveedor es necesario"}, 400
+        producto = obtener_de_empresa(Producto, id_producto)
+        if not producto: return {"error": "Producto no encontrado"}, 404
+        if not obtener_de_empresa(Proveedor, id_proveedor, id_empresa=producto.id_empresa):
+            return {"error": "Proveedor no encontrado"}, 404
         
         # Verificar duplicados
-        existe = ProductoProveedor.query.filter_by(id_producto=id_producto, id_proveedor=id_proveedor).first()
+        existe = consulta_empresa(ProductoProveedor).filter(
+            ProductoProveedor.id_producto == id_producto,
+            ProductoProveedor.id_proveedor == id_proveedor
+        ).first()
         if existe: return {"error": "Relación ya existe"}, 400
 
         relacion = ProductoProveedor(
@@ -226,7 +515,10 @@ def asignar_proveedor_a_producto_service(id_producto, data):
 
 def desvincular_proveedor_producto_service(id_producto, id_proveedor):
     try:
-        relacion = ProductoProveedor.query.filter_by(id_producto=id_producto, id_proveedor=id_proveedor).first()
+        relacion = consulta_empresa(ProductoProveedor).filter(
+            ProductoProveedor.id_producto == id_producto,
+            ProductoProveedor.id_proveedor == id_proveedor
+        ).first()
         if not relacion: return {"error": "Relación no encontrada"}, 404
             
         db.session.delete(relacion)
@@ -240,7 +532,10 @@ def actualizar_relacion_service(id_producto, id_proveedor, data):
     """
     Permite editar el precio, días de entrega o preferencia de una relación existente.
     """
-    relacion = ProductoProveedor.query.filter_by(id_producto=id_producto, id_proveedor=id_proveedor).first()
+    relacion = consulta_empresa(ProductoProveedor).filter(
+        ProductoProveedor.id_producto == id_producto,
+        ProductoProveedor.id_proveedor == id_proveedor
+    ).first()
     if not relacion:
         return {"error": "La relación entre este producto y proveedor no existe"}, 404
     
@@ -260,46 +555,61 @@ def actualizar_relacion_service(id_producto, id_proveedor, data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_productos_por_proveedor_service(id_proveedor):
+def obtener_productos_por_proveedor_service(id_proveedor, limit=None, cursor=None):
     """
     Lista todos los productos que vende un proveedor específico.
     """
-    prov = Proveedor.query.get(id_proveedor)
+    prov = obtener_de_empresa(Proveedor, id_proveedor)
     if not prov:
         return {"error": "Proveedor no encontrado"}, 404
-        
-    lista_productos = []
-    # Usamos la relación definida en el modelo
-    for relacion in prov.productos_vinculados:
+
+    def serializar(relacion):
         datos_prod = relacion.producto.to_dict()
         datos_prod['datos_compra'] = {
             'precio_pactado': float(relacion.precio_compra),
             'tiempo_entrega': relacion.tiempo_entrega_dias,
             'es_preferido': relacion.proveedor_preferido
         }
-        lista_productos.append(datos_prod)
-        
-    return lista_productos, 200
+        return datos_prod
+
+    try:
+        query = consulta_empresa(ProductoProveedor).options(joinedload(ProductoProveedor.producto))
+        query = query.filter(ProductoProveedor.id_proveedor == id_proveedor)
+        pagina = paginar_keyset(query, (ProductoProveedor.id_producto,), limit, cursor,
+                                serializar=serializar)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
-def obtener_todas_las_relaciones_service():
+def obtener_todas_las_relaciones_service(limit=None, cursor=None):
     """
     Lista TODAS las relaciones (útil para reportes globales de compras).
     """
-    relaciones = ProductoProveedor.query.all()
-    resultado = []
-    for rel in relaciones:
+    def serializar(rel):
         dic = rel.to_dict()
         dic['nombre_producto'] = rel.producto.nombre
         # CAMBIO: Usamos razon_social en lugar de nombre
         dic['nombre_proveedor'] = rel.proveedor.razon_social
-        resultado.append(dic)
-    return resultado, 200
+        return dic
+
+    try:
+        query = consulta_empresa(ProductoProveedor).options(
+            *ProductoProveedor.opciones_carga(), joinedload(ProductoProveedor.producto)
+        )
+        pagina = paginar_keyset(query,
+                                (ProductoProveedor.id_producto, ProductoProveedor.id_proveedor),
+                                limit, cursor, serializar=serializar)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 # ==================== CRUD INVENTARIO ====================
 def crear_inventario_service(data):
     try:
         if 'id_producto' not in data:
             return {"error": "id_producto es obligatorio"}, 400
+        if not obtener_de_empresa(Producto, data['id_producto']):
+            return {"error": "Producto no encontrado"}, 404
             
         nuevo_id = data.get('id_inventario', str(uuid.uuid4()))
         inv = Inventario(
@@ -311,29 +621,47 @@ def crear_inventario_service(data):
             ubicacion_fisica=data.get('ubicacion_fisica')
         )
         db.session.add(inv)
+        db.session.flush()
+        registrar_movimientos([{'id_inventario': inv.id_inventario, 'id_producto': inv.id_producto,
+                                'tipo': 'INICIAL', 'cantidad': inv.cantidad_actual or 0}])
         db.session.commit()
         return {"message": "Registro de inventario creado", "inventario": inv.to_dict()}, 201
     except Exception as e:
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_inventarios_service():
-    items = Inventario.query.all()
-    return [i.to_dict() for i in items], 200
+def obtener_inventarios_service(limit=None, cursor=None):
+    # Se ordena por PK: ultima_actualizacion cambia con cada ajuste y no sirve como cursor estable
+    try:
+        query = consulta_empresa(Inventario).options(*Inventario.opciones_carga())
+        pagina = paginar_keyset(query, (Inventario.id_inventario,), limit, cursor)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def obtener_inventario_id_service(id_inv):
-    item = Inventario.query.get(id_inv)
+    item = obtener_de_empresa(Inventario, id_inv, *Inventario.opciones_carga())
     return (item.to_dict(), 200) if item else ({"error": "No encontrado"}, 404)
 
 def actualizar_inventario_service(id_inv, data):
-    item = Inventario.query.get(id_inv)
+    item = obtener_de_empresa(Inventario, id_inv, *Inventario.opciones_carga())
     if not item: return {"error": "No encontrado"}, 404
     try:
-        if 'cantidad_actual' in data: item.cantidad_actual = data['cantidad_actual']
+        cantidad_antes, minimo_antes = item.cantidad_actual, item.stock_minimo
+        if 'cantidad_actual' in data:
+            # Conteo físico: se bloquea la fila para que la diferencia registrada sea exacta
+            actual = db.session.query(Inventario.cantidad_actual) \
+                .filter(Inventario.id_inventario == item.id_inventario).with_for_update().scalar()
+            cantidad_antes = actual
+            item.cantidad_actual = data['cantidad_actual']
+            registrar_movimientos([{'id_inventario': item.id_inventario, 'id_producto': item.id_producto,
+                                    'tipo': 'CONTEO', 'cantidad': (data['cantidad_actual'] or 0) - (actual or 0)}])
         if 'stock_minimo' in data: item.stock_minimo = data['stock_minimo']
         if 'stock_maximo' in data: item.stock_maximo = data['stock_maximo']
         if 'ubicacion_fisica' in data: item.ubicacion_fisica = data['ubicacion_fisica']
-        
+
+        if _cruza_minimo(cantidad_antes, item.cantidad_actual, item.stock_minimo, minimo_antes):
+            generar_alertas_stock_minimo([item.id_inventario])
         db.session.commit()
         return {"message": "Inventario actualizado", "inventario": item.to_dict()}, 200
     except Exception as e:
@@ -341,7 +669,7 @@ def actualizar_inventario_service(id_inv, data):
         return {"error": str(e)}, 500
 
 def eliminar_inventario_service(id_inv):
-    item = Inventario.query.get(id_inv)
+    item = obtener_de_empresa(Inventario, id_inv)
     if not item: return {"error": "No encontrado"}, 404
     try:
         db.session.delete(item)
@@ -349,4 +677,345 @@ def eliminar_inventario_service(id_inv):
         return {"message": "Eliminado"}, 200
     except Exception as e:
         db.session.rollback()
-        return {"error": str(e)}, 500
\ No newline at end of file
+        return {"error": str(e)}, 500
+
+# ==================== MOVIMIENTOS DE STOCK ====================
+def registrar_movimientos(filas):
+    """Inserta movimientos de stock (un INSERT multi-fila). Cada fila: id_inventario, id_producto, tipo, cantidad[, referencia]."""
+    filas = [f for f in filas if f['cantidad']]
+    if filas:
+        db.session.execute(insert(MovimientoStock), filas)
+
+
+def aplicar_deltas_stock(deltas, por_producto=False, permitir_negativo=False, id_empresa=None,
+                         tipo='AJUSTE', referencia=None):
+    """
+    Suma un delta a cantidad_actual de varios registros en un solo
+    UPDATE inventario SET cantidad_actual = cantidad_actual + v.delta FROM (VALUES ...) AS v,
+    dentro de la transacción del llamador (no hace commit).
+
+    - deltas: {id_inventario: delta} o, con por_producto=True, {id_producto: delta}; en ese
+      caso se usa el registro de Inventario con más stock de cada producto (DISTINCT ON).
+    - Sin permitir_negativo, un registro solo se actualiza si el resultado queda >= 0. La
+      condición se evalúa con la fila bloqueada, así los ajustes concurrentes no se pisan
+      ni dejan stock negativo.
+    - id_empresa limita los registros a los productos de esa empresa.
+    - Cada registro actualizado deja su fila en MovimientoStock (tipo / referencia).
+    - Los registros que con este delta cruzan su stock_minimo generan alerta (ver
+      generar_alertas_stock_minimo).
+
+    Devuelve {clave: cantidad_actual resultante} de los registros actualizados.
+    """
+    if not deltas:
+        return {}
+
+    clave = Inventario.id_producto if por_producto else Inventario.id_inventario
+    movimiento = values(
+        column('clave', clave.type),
+        column('delta', Inventario.cantidad_actual.type),
+        name='v'
+    ).data(sorted(deltas.items()))
+
+    stmt = update(Inventario) \
+        .where(clave == movimiento.c.clave) \
+        .values(cantidad_actual=Inventario.cantidad_actual + movimiento.c.delta) \
+        .returning(clave, Inventario.cantidad_actual, Inventario.id_inventario, Inventario.id_producto,
+                   Inventario.stock_minimo) \
+        .execution_options(synchronize_session=False)
+
+    if por_producto:
+        # Un registro por producto: el de mayor stock
+        registros = db.select(Inventario.id_inventario) \
+            .where(Inventario.id_producto.in_(list(deltas))) \
+            .distinct(Inventario.id_producto) \
+            .order_by(Inventario.id_producto, Inventario.cantidad_actual.desc())
+        stmt = stmt.where(Inventario.id_inventario.in_(registros))
+    if not permitir_negativo:
+        stmt = stmt.where(Inventario.cantidad_actual + movimiento.c.delta >= 0)
+    if id_empresa:
+        stmt = stmt.where(Inventario.id_producto == Producto.id_producto, Producto.id_empresa == id_empresa)
+
+    actualizados = db.session.execute(stmt).all()
+    registrar_movimientos([
+        {'id_inventario': fila.id_inventario, 'id_producto': fila.id_producto,
+         'tipo': tipo, 'cantidad': deltas[fila[0]], 'referencia': referencia}
+        for fila in actualizados
+    ])
+    # Solo los que estaban por encima del mínimo antes del delta: quien ya estaba bajo no se re-evalúa
+    generar_alertas_stock_minimo([
+        fila.id_inventario for fila in actualizados
+        if _cruza_minimo(fila.cantidad_actual - deltas[fila[0]], fila.cantidad_actual, fila.stock_minimo)
+    ])
+    return {fila[0]: fila[1] for fila in actualizados}
+
+
+def descontar_stock(cantidades, referencia=None):
+    """
+    Descuenta {id_producto: cantidad} por una venta, solo donde alcanza el stock
+    (ver aplicar_deltas_stock). Devuelve el conjunto de id_producto descontados.
+    """
+    deltas = {id_producto: -cantidad for id_producto, cantidad in cantidades.items()}
+    return set(aplicar_deltas_stock(deltas, por_producto=True, tipo='VENTA', referencia=referencia))
+
+
+def ajustar_inventario_service(data):
+    """
+    Ajustes relativos de stock en lote: {"ajustes": [{"id_inventario": ..., "delta": -2}, ...],
+    "permitir_negativo": false, "parcial": false}.
+
+    Todos los ajustes se aplican en un solo UPDATE. Por defecto es todo o nada: si algún
+    registro no existe o quedaría negativo no se aplica ninguno (409). Con "parcial": true
+    se guardan los que sí se pudieron aplicar y se informan los rechazados.
+    """
+    data = data or {}
+    ajustes = data.get('ajustes')
+    if not isinstance(ajustes, list) or not ajustes:
+        return {"error": "Se esperaba una lista 'ajustes'"}, 400
+
+    max_ajustes = current_app.config.get('INVENTARIO_MAX_AJUSTES', 5000)
+    if len(ajustes) > max_ajustes:
+        return {"error": f"Máximo {max_ajustes} ajustes por petición"}, 400
+
+    deltas = {}
+    for i, ajuste in enumerate(ajustes, start=1):
+        if not isinstance(ajuste, dict) or not ajuste.get('id_inventario'):
+            return {"error": f"Ajuste {i}: id_inventario es obligatorio"}, 400
+        delta = ajuste.get('delta')
+        if not isinstance(delta, int) or isinstance(delta, bool):
+            return {"error": f"Ajuste {i}: delta debe ser un entero"}, 400
+        # Varios ajustes al mismo registro se suman en uno
+        deltas[ajuste['id_inventario']] = deltas.get(ajuste['id_inventario'], 0) + delta
+
+    permitir_negativo = bool(data.get('permitir_negativo', False))
+    parcial = bool(data.get('parcial', False))
+    try:
+        aplicados = aplicar_deltas_stock(deltas, permitir_negativo=permitir_negativo,
+                                         id_empresa=id_empresa_actual())
+        rechazados = sorted(set(deltas) - set(aplicados))
+        if rechazados and not parcial:
+            db.session.rollback()
+            return {
+                "error": "Ajustes rechazados: registro inexistente o stock insuficiente",
+                "rechazados": rechazados
+            }, 409
+        db.session.commit()
+        return {
+            "message": "Inventario ajustado",
+            "aplicados": [{"id_inventario": id_inv, "cantidad_actual": cantidad}
+                          for id_inv, cantidad in sorted(aplicados.items())],
+            "rechazados": rechazados
+        }, 200
+    except Exception as e:
+        db.session.rollback()
+        return {"error": str(e)}, 500
+
+
+# ==================== ALERTAS DE STOCK MÍNIMO ====================
+# Roles que reciben las alertas de stock de su empresa
+_ROLES_ALERTA_STOCK = ('PROPIETARIO', 'ADMIN')
+
+
+def _cruza_minimo(cantidad_antes, cantidad_despues, minimo, minimo_antes=None):
+    """True si el registro pasa de estar sobre su mínimo a estar en o bajo él (mínimo > 0)."""
+    minimo_antes = minimo if minimo_antes is None else minimo_antes
+    if not minimo or minimo <= 0 or cantidad_despues is None:
+        return False
+    if cantidad_despues > minimo:
+        return False
+    return cantidad_antes is None or not minimo_antes or cantidad_antes > minimo_antes
+
+
+def generar_alertas_stock_minimo(ids_inventario):
+    """
+    Crea las notificaciones de stock bajo de los registros indicados, dentro de la
+    transacción del llamador (no hace commit). Se llama solo con los registros cuyo
+    stock acaba de cambiar, así nunca se recorre todo el inventario.
+
+    Una alerta por registro y usuario PROPIETARIO/ADMIN activo de la empresa, salvo que
+    la empresa tenga notif_stock_minimo desactivado o el usuario ya tenga una alerta sin
+    leer de ese registro. Un SELECT con los candidatos y un único INSERT multi-fila, sin
+    importar cuántos productos bajaron a la vez (insertar_notificaciones).
+
+    Devuelve la cantidad de notificaciones creadas.
+    """
+    ids_inventario = list(set(ids_inventario))
+    if not ids_inventario:
+        return 0
+
+    desactivada = select(ConfiguracionEmpresa.id_config).where(
+        ConfiguracionEmpresa.id_empresa == Producto.id_empresa,
+        ConfiguracionEmpresa.notif_stock_minimo == False
+    ).exists()
+    pendiente = select(Notificacion.id_notificacion).where(
+        Notificacion.id_usuario == Usuario.id_usuario,
+        Notificacion.categoria == 'INVENTARIO',
+        Notificacion.leida == False,
+        Notificacion.datos_adicionales_json['id_inventario'].astext == Inventario.id_inventario
+    ).exists()
+
+    candidatos = db.session.query(
+        Inventario.id_inventario, Inventario.id_producto, Inventario.cantidad_actual, Inventario.stock_minimo,
+        Producto.nombre, Producto.id_empresa, Usuario.id_usuario
+    ).join(Producto, Inventario.id_producto == Producto.id_producto) \
+        .join(Usuario, Usuario.id_empresa == Producto.id_empresa) \
+        .filter(Inventario.id_inventario.in_(ids_inventario),
+                Inventario.cantidad_actual <= Inventario.stock_minimo,
+                Usuario.id_rol.in_(_ROLES_ALERTA_STOCK),
+                Usuario.activo == True,
+                ~desactivada, ~pendiente) \
+        .all()
+    if not candidatos:
+        return 0
+
+    insertar_notificaciones([
+        {
+            'id_empresa': fila.id_empresa,
+            'id_usuario': fila.id_usuario,
+            'tipo': 'ALERTA',
+            'categoria': 'INVENTARIO',
+            'titulo': 'Stock bajo el mínimo',
+            'mensaje': f"{fila.nombre or fila.id_producto}: quedan {fila.cantidad_actual} (mínimo {fila.stock_minimo})",
+            'datos_adicionales_json': {
+                'evento': 'STOCK_MINIMO',
+                'id_inventario': fila.id_inventario,
+                'id_producto': fila.id_producto,
+                'cantidad_actual': fila.cantidad_actual,
+                'stock_minimo': fila.stock_minimo,
+            },
+        }
+        for fila in candidatos
+    ])
+    return len(candidatos)
+
+
+def obtener_stock_bajo_minimo_service(limit=None, cursor=None):
+    """Registros de inventario en o bajo su stock mínimo (usa el índice parcial ix_inventario_bajo_minimo)."""
+    try:
+        query = consulta_empresa(Inventario).options(*Inventario.opciones_carga()) \
+            .filter(Inventario.cantidad_actual <= Inventario.stock_minimo)
+        pagina = paginar_keyset(query, (Inventario.id_inventario,), limit, cursor)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
+
+
+# ==================== HISTÓRICO DE STOCK (CHECKPOINTS) ====================
+# Margen hacia atrás del corte, además del límite por transacciones abiertas (_corte_checkpoint)
+_MARGEN_CHECKPOINT = timedelta(minutes=1)
+# Clave de pg_try_advisory_xact_lock: un solo worker genera los checkpoints a la vez
+_LOCK_CHECKPOINT = 0x5743484B
+
+
+def _suma_movimientos(desde=None, hasta=None):
+    """SUM(cantidad) de los movimientos del registro de inventario de la fila externa en (desde, hasta]."""
+    condiciones = [MovimientoStock.id_inventario == Inventario.id_inventario]
+    if desde is not None:
+        condiciones.append(MovimientoStock.fecha > desde)
+    if hasta is not None:
+        condiciones.append(MovimientoStock.fecha <= hasta)
+    return select(func.coalesce(func.sum(MovimientoStock.cantidad), 0)).where(*condiciones).scalar_subquery()
+
+
+def _corte_checkpoint():
+    """
+    Fecha de corte de los checkpoints, con el reloj de la BD (el mismo que estampa
+    MovimientoStock.fecha). Un movimiento sin confirmar tiene fecha posterior al inicio de
+    su transacción: el corte no pasa del inicio de la transacción de escritura más antigua
+    todavía abierta, así ningún movimiento anterior al corte aparece después de la foto.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return datetime.utcnow() - _MARGEN_CHECKPOINT
+    return db.session.execute(text(
+        "SELECT LEAST(timezone('utc', clock_timestamp()) - :margen, "
+        "(SELECT timezone('utc', min(xact_start)) FROM pg_stat_activity "
+        "WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid() AND datname = current_database()))"
+    ), {"margen": _MARGEN_CHECKPOINT}).scalar()
+
+
+def generar_checkpoints_stock():
+    """
+    Guarda en CheckpointStock la cantidad de cada registro de inventario a la fecha de corte,
+    con un único INSERT ... SELECT. Solo incluye registros sin checkpoint o con movimientos
+    desde el último, así el rango a recorrer para una fecha queda acotado por el intervalo.
+    La cantidad se obtiene de cantidad_actual menos los movimientos posteriores al corte.
+    Devuelve la cantidad de checkpoints creados.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        libre = db.session.execute(select(func.pg_try_advisory_xact_lock(_LOCK_CHECKPOINT))).scalar()
+        if not libre:
+            return 0
+
+    corte = _corte_checkpoint()
+    ultimo = select(func.max(CheckpointStock.fecha_corte)) \
+        .where(CheckpointStock.id_inventario == Inventario.id_inventario).scalar_subquery()
+    con_movimientos = db.exists().where(
+        MovimientoStock.id_inventario == Inventario.id_inventario,
+        MovimientoStock.fecha > ultimo,
+        MovimientoStock.fecha <= corte
+    )
+    origen = select(
+        Inventario.id_inventario,
+        db.literal(corte, CheckpointStock.fecha_corte.type),
+        Inventario.cantidad_actual - _suma_movimientos(desde=corte)
+    ).where(db.or_(ultimo.is_(None), con_movimientos))
+
+    resultado = db.session.execute(
+        insert(CheckpointStock).from_select(['id_inventario', 'fecha_corte', 'cantidad'], origen)
+    )
+    db.session.commit()
+    return resultado.rowcount
+
+
+def iniciar_checkpoints_stock(app):
+    """Genera checkpoints cada STOCK_CHECKPOINT_SECONDS (0 = desactivado)."""
+    intervalo = app.config.get('STOCK_CHECKPOINT_SECONDS', 0)
+    return iniciar_tarea_periodica(app, 'checkpoints-stock', intervalo, generar_checkpoints_stock)
+
+
+def obtener_stock_en_fecha_service(fecha, id_producto=None, limit=None, cursor=None):
+    """
+    Stock de cada registro de inventario de la empresa al final de 'fecha' (ISO 8601;
+    con solo AAAA-MM-DD se toma el día completo).
+
+    Por registro: último checkpoint <= fecha + movimientos entre ese checkpoint y la fecha.
+    Si la fecha es anterior al primer checkpoint se parte del siguiente (o del stock actual)
+    y se restan los movimientos posteriores. Cada caso es un rango acotado por
+    ix_movimiento_stock_inventario_fecha, no un recorrido de todo el historial.
+    """
+    if not fecha:
+        return {"error": "El parámetro 'fecha' es obligatorio"}, 400
+    try:
+        _, fin = rango_fechas(None, fecha)
+        momento = fin - timedelta(microseconds=1) if len(fecha) == 10 else fin
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    anterior = select(CheckpointStock.cantidad, CheckpointStock.fecha_corte) \
+        .where(CheckpointStock.id_inventario == Inventario.id_inventario, CheckpointStock.fecha_corte <= momento) \
+        .order_by(CheckpointStock.fecha_corte.desc()).limit(1).lateral('anterior')
+    siguiente = select(CheckpointStock.cantidad, CheckpointStock.fecha_corte) \
+        .where(CheckpointStock.id_inventario == Inventario.id_inventario, CheckpointStock.fecha_corte > momento) \
+        .order_by(CheckpointStock.fecha_corte.asc()).limit(1).lateral('siguiente')
+
+    cantidad = case(
+        (anterior.c.fecha_corte.isnot(None),
+         anterior.c.cantidad + _suma_movimientos(desde=anterior.c.fecha_corte, hasta=momento)),
+        (siguiente.c.fecha_corte.isnot(None),
+         siguiente.c.cantidad - _suma_movimientos(desde=momento, hasta=siguiente.c.fecha_corte)),
+        else_=Inventario.cantidad_actual - _suma_movimientos(desde=momento)
+    ).label('cantidad')
+
+    try:
+        query = consulta_empresa(Inventario) \
+            .with_entities(Inventario.id_inventario, Inventario.id_producto, cantidad) \
+            .outerjoin(anterior, true()).outerjoin(siguiente, true())
+        if id_producto:
+            query = query.filter(Inventario.id_producto == id_producto)
+        pagina = paginar_keyset(query, (Inventario.id_inventario,), limit, cursor,
+                                serializar=lambda fila: {'id_inventario': fila.id_inventario,
+                                                         'id_producto': fila.id_producto,
+                                                         'cantidad': int(fila.cantidad)})
+        pagina['fecha'] = momento.isoformat()
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
@@ -2,8 +2,18 @@ from app.extensions import db
 from app.models.saas import AdminSaas, Plan, Suscripcion
 from app.models.token_blocklist import TokenBlocklist
 from app.models.empresa import Empresa
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.models.seguridad import Usuario
+from app.utils.revocacion import cache_revocacion, expiracion_desde_claims
+from app.utils.pagination import paginar_keyset, normalizar_limite, CursorInvalidoError
+from app.utils.tenant import consulta_empresa
+from app.utils.background import iniciar_tarea_periodica
+from app.utils.hashing import generar_hash_password, verificar_hash_password, HashingSaturadoError
+from flask import current_app
 from flask_jwt_extended import create_access_token, get_jwt
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+import threading
+import time
 import uuid
 from datetime import datetime
 
@@ -22,7 +32,7 @@ def crear_admin_saas_service(data):
             return {"error": "El email ya está registrado como administrador"}, 400
         
         # Encriptar contraseña
-        pass_hash = generate_password_hash(data['password'])
+        pass_hash = generar_hash_password(data['password'])
         
         nuevo_admin = AdminSaas(
             nombre=data.get('nombre'),
@@ -36,6 +46,9 @@ def crear_admin_saas_service(data):
         db.session.commit()
         
         return {"message": "Administrador SaaS creado", "admin": nuevo_admin.to_dict()}, 201
+    except HashingSaturadoError as e:
+        db.session.rollback()
+        return {"error": str(e)}, 503
     except Exception as e:
         db.session.rollback()
         return {"error": str(e)}, 500
@@ -49,7 +62,12 @@ def login_admin_saas_service(data):
     
     admin = AdminSaas.query.filter_by(email=email).first()
     
-    if admin and check_password_hash(admin.password_hash, password):
+    try:
+        password_valido = admin is not None and verificar_hash_password(admin.password_hash, password)
+    except HashingSaturadoError as e:
+        return {"error": str(e)}, 503
+    
+    if password_valido:
         if not admin.activo:
             return {"error": "Cuenta desactivada"}, 401
         
@@ -70,20 +88,28 @@ def login_admin_saas_service(data):
 
 def logout_admin_saas_service():
     try:
-        jti = get_jwt()["jti"]
-        revoked_token = TokenBlocklist(jti=jti)
+        claims = get_jwt()
+        jti = claims["jti"]
+        revoked_token = TokenBlocklist(jti=jti, expires_at=expiracion_desde_claims(claims))
         db.session.add(revoked_token)
         db.session.commit()
+        # Este worker deja de aceptar el token de inmediato; los demás al próximo sondeo
+        cache_revocacion.revocar(jti, claims.get("exp"))
         
         return {"message": "Admin SaaS: Sesión cerrada correctamente"}, 200
     except Exception as e:
         db.session.rollback()
         return {"error": "Error al cerrar sesión: " + str(e)}, 500
 
-def obtener_admins_saas_service():
+def obtener_admins_saas_service(limit=None, cursor=None):
     # Solo admins activos
-    admins = AdminSaas.query.filter_by(activo=True).all()
-    return [a.to_dict() for a in admins], 200
+    try:
+        query = AdminSaas.query.filter_by(activo=True)
+        pagina = paginar_keyset(query, (AdminSaas.fecha_creacion, AdminSaas.id_admin),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def obtener_admin_saas_por_id_service(id_admin):
     admin = AdminSaas.query.get(id_admin)
@@ -106,10 +132,13 @@ def actualizar_admin_saas_service(id_admin, data):
                 return {"error": "El email ya está en uso"}, 400
             admin.email = data['email']
         if 'password' in data and data['password']:
-            admin.password_hash = generate_password_hash(data['password'])
+            admin.password_hash = generar_hash_password(data['password'])
         
         db.session.commit()
         return {"message": "Administrador actualizado", "admin": admin.to_dict()}, 200
+    except HashingSaturadoError as e:
+        db.session.rollback()
+        return {"error": str(e)}, 503
     except Exception as e:
         db.session.rollback()
         return {"error": str(e)}, 500
@@ -142,10 +171,15 @@ def activar_admin_saas_service(id_admin):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_admins_saas_inactivos_service():
+def obtener_admins_saas_inactivos_service(limit=None, cursor=None):
     """Obtiene todos los admins desactivados"""
-    admins = AdminSaas.query.filter_by(activo=False).all()
-    return [a.to_dict() for a in admins], 200
+    try:
+        query = AdminSaas.query.filter_by(activo=False)
+        pagina = paginar_keyset(query, (AdminSaas.fecha_creacion, AdminSaas.id_admin),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 # ==========================================
 # PLANES (CATÁLOGO)
@@ -177,9 +211,12 @@ def crear_plan_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_planes_service():
-    planes = Plan.query.all()
-    return [p.to_dict() for p in planes], 200
+def obtener_planes_service(limit=None, cursor=None):
+    try:
+        pagina = paginar_keyset(Plan.query, (Plan.id_plan,), limit, cursor)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def obtener_plan_id_service(id_plan):
     plan = Plan.query.get(id_plan)
@@ -265,38 +302,44 @@ def crear_suscripcion_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_suscripcion_por_empresa_service(id_empresa):
-    subs = Suscripcion.query.filter_by(id_empresa=id_empresa).all()
-    return [s.to_dict() for s in subs], 200
+def obtener_suscripcion_por_empresa_service(id_empresa, limit=None, cursor=None):
+    try:
+        # Un PROPIETARIO solo puede consultar la suscripción de su propia empresa
+        query = consulta_empresa(Suscripcion).filter(Suscripcion.id_empresa == id_empresa)
+        pagina = paginar_keyset(query, (Suscripcion.id_suscripcion,), limit, cursor)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
-def obtener_todas_suscripciones_service():
+def obtener_todas_suscripciones_service(limit=None, cursor=None):
     """Obtiene todas las suscripciones con información de empresa y plan"""
-    suscripciones = Suscripcion.query.all()
-    resultado = []
+    try:
+        query = Suscripcion.query.options(joinedload(Suscripcion.empresa), joinedload(Suscripcion.plan))
+        pagina = paginar_keyset(query, (Suscripcion.id_suscripcion,), limit, cursor,
+                                serializar=_serializar_suscripcion_con_detalle)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
+
+def _serializar_suscripcion_con_detalle(sub):
+    sub_dict = sub.to_dict()
     
-    for sub in suscripciones:
-        sub_dict = sub.to_dict()
-        
-        # Agregar información de empresa
-        empresa = Empresa.query.get(sub.id_empresa)
-        if empresa:
-            sub_dict['empresa'] = {
-                'nombre_comercial': empresa.nombre_comercial,
-                'razon_social': empresa.razon_social,
-                'email': empresa.email
-            }
-        
-        # Agregar información de plan
-        plan = Plan.query.get(sub.id_plan)
-        if plan:
-            sub_dict['plan'] = {
-                'nombre': plan.nombre,
-                'precio_mensual': float(plan.precio_mensual) if plan.precio_mensual else 0
-            }
-        
-        resultado.append(sub_dict)
+    # Agregar información de empresa (cargada con joinedload)
+    if sub.empresa:
+        sub_dict['empresa'] = {
+            'nombre_comercial': sub.empresa.nombre_comercial,
+            'razon_social': sub.empresa.razon_social,
+            'email': sub.empresa.email
+        }
     
-    return resultado, 200
+    # Agregar información de plan
+    if sub.plan:
+        sub_dict['plan'] = {
+            'nombre': sub.plan.nombre,
+            'precio_mensual': float(sub.plan.precio_mensual) if sub.plan.precio_mensual else 0
+        }
+    
+    return sub_dict
 
 def actualizar_suscripcion_service(id_suscripcion, data):
     sub = Suscripcion.query.get(id_suscripcion)
@@ -325,64 +368,136 @@ def actualizar_suscripcion_service(id_suscripcion, data):
 # ESTADÍSTICAS PARA DASHBOARD
 # ==========================================
 
+# Snapshot compartido por las peticiones del worker; lo renueva un hilo en segundo plano
+_snapshot_dashboard = {"datos": None, "generado": 0.0}
+_snapshot_lock = threading.Lock()
+
+def calcular_estadisticas_dashboard():
+    """Calcula las estadísticas con dos consultas agregadas (empresas y suscripciones x plan)."""
+    total_empresas, empresas_activas = db.session.query(
+        func.count(Empresa.id_empresa),
+        func.count(Empresa.id_empresa).filter(Empresa.activo == True)
+    ).one()
+
+    # Una sola pasada sobre suscripcion JOIN plan, agrupada por plan y estado
+    filas = db.session.query(
+        Suscripcion.id_plan,
+        Suscripcion.estado,
+        func.count(Suscripcion.id_suscripcion),
+        func.coalesce(func.sum(Plan.precio_mensual), 0)
+    ).outerjoin(Plan, Plan.id_plan == Suscripcion.id_plan) \
+     .group_by(Suscripcion.id_plan, Suscripcion.estado).all()
+
+    activas_por_plan = {}
+    ingresos = 0
+    pagos_pendientes = 0
+    for id_plan, estado, cantidad, suma_precios in filas:
+        if estado:
+            activas_por_plan[id_plan] = activas_por_plan.get(id_plan, 0) + cantidad
+            ingresos += float(suma_precios)
+        elif estado is False:
+            # Pagos pendientes (suscripciones con estado False)
+            pagos_pendientes += cantidad
+
+    return {
+        "empresas": {
+            "total": total_empresas,
+            "activas": empresas_activas,
+            "inactivas": total_empresas - empresas_activas
+        },
+        "suscripciones": {
+            "free": activas_por_plan.get('FREE', 0),
+            "basic": activas_por_plan.get('BASIC', 0),
+            "premium": activas_por_plan.get('PREMIUM', 0)
+        },
+        "ingresos": round(ingresos, 2),
+        "pagosPendientes": pagos_pendientes,
+        "actualizado": datetime.utcnow().isoformat()
+    }
+
+def refrescar_snapshot_dashboard():
+    datos = calcular_estadisticas_dashboard()
+    with _snapshot_lock:
+        _snapshot_dashboard["datos"] = datos
+        _snapshot_dashboard["generado"] = time.monotonic()
+    return datos
+
+def iniciar_refresco_dashboard(app):
+    """Arranca el hilo que recalcula el snapshot cada SAAS_DASHBOARD_REFRESH_SECONDS."""
+    intervalo = app.config.get('SAAS_DASHBOARD_REFRESH_SECONDS', 0)
+    return iniciar_tarea_periodica(app, 'refresco-dashboard-saas', intervalo, refrescar_snapshot_dashboard)
+
 def obtener_estadisticas_dashboard_service():
-    """Obtiene estadísticas generales para el dashboard del admin"""
+    """Obtiene estadísticas generales para el dashboard del admin (desde el snapshot)"""
     try:
-        # Total de empresas
-        total_empresas = Empresa.query.count()
-        empresas_activas = Empresa.query.filter_by(activo=True).count()
-        empresas_inactivas = total_empresas - empresas_activas
-        
-        # Suscripciones por plan
-        suscripciones_free = Suscripcion.query.filter_by(id_plan='FREE', estado=True).count()
-        suscripciones_basic = Suscripcion.query.filter_by(id_plan='BASIC', estado=True).count()
-        suscripciones_premium = Suscripcion.query.filter_by(id_plan='PREMIUM', estado=True).count()
-        
-        # Ingresos mensuales (suma de planes activos)
-        ingresos = 0
-        suscripciones_activas = Suscripcion.query.filter_by(estado=True).all()
-        for sub in suscripciones_activas:
-            plan = Plan.query.get(sub.id_plan)
-            if plan and plan.precio_mensual:
-                ingresos += float(plan.precio_mensual)
-        
-        # Pagos pendientes (suscripciones con estado False)
-        pagos_pendientes = Suscripcion.query.filter_by(estado=False).count()
-        
-        return {
-            "empresas": {
-                "total": total_empresas,
-                "activas": empresas_activas,
-                "inactivas": empresas_inactivas
-            },
-            "suscripciones": {
-                "free": suscripciones_free,
-                "basic": suscripciones_basic,
-                "premium": suscripciones_premium
-            },
-            "ingresos": round(ingresos, 2),
-            "pagosPendientes": pagos_pendientes
-        }, 200
+        intervalo = current_app.config.get('SAAS_DASHBOARD_REFRESH_SECONDS', 0)
+        with _snapshot_lock:
+            datos = _snapshot_dashboard["datos"]
+            edad = time.monotonic() - _snapshot_dashboard["generado"]
+
+        # Sin refresco en segundo plano, primera petición del worker o snapshot
+        # abandonado (el hilo dejó de actualizarlo): se calcula en línea.
+        if datos is None or intervalo <= 0 or edad > 2 * intervalo:
+            datos = refrescar_snapshot_dashboard()
+
+        return datos, 200
     except Exception as e:
         return {"error": str(e)}, 500
 
+# --- Consultas por lote para los listados del panel SaaS ---
+# Cada helper recibe los ids de la página actual y resuelve todas las empresas en UNA consulta.
+
+def _planes_activos_por_empresa(ids_empresa):
+    """{id_empresa: (Suscripcion, Plan | None)} con la suscripción activa de cada empresa."""
+    if not ids_empresa:
+        return {}
+    filas = db.session.query(Suscripcion, Plan) \
+        .outerjoin(Plan, Plan.id_plan == Suscripcion.id_plan) \
+        .filter(Suscripcion.id_empresa.in_(ids_empresa), Suscripcion.estado == True) \
+        .order_by(Suscripcion.id_empresa, Suscripcion.fecha_inicio.desc()).all()
+    resultado = {}
+    for suscripcion, plan in filas:
+        resultado.setdefault(suscripcion.id_empresa, (suscripcion, plan))
+    return resultado
+
+def _propietarios_por_empresa(ids_empresa):
+    """{id_empresa: Usuario} con el usuario PROPIETARIO de cada empresa."""
+    if not ids_empresa:
+        return {}
+    propietarios = Usuario.query.filter(
+        Usuario.id_empresa.in_(ids_empresa),
+        Usuario.id_rol == 'PROPIETARIO'
+    ).order_by(Usuario.id_empresa, Usuario.fecha_creacion).all()
+    resultado = {}
+    for propietario in propietarios:
+        resultado.setdefault(propietario.id_empresa, propietario)
+    return resultado
+
+def _conteo_usuarios_por_empresa(ids_empresa):
+    """{id_empresa: (total, activos)} con un único GROUP BY id_empresa."""
+    if not ids_empresa:
+        return {}
+    filas = db.session.query(
+        Usuario.id_empresa,
+        func.count(Usuario.id_usuario),
+        func.count(Usuario.id_usuario).filter(Usuario.activo == True)
+    ).filter(Usuario.id_empresa.in_(ids_empresa)).group_by(Usuario.id_empresa).all()
+    return {id_empresa: (total, activos) for id_empresa, total, activos in filas}
+
 def obtener_empresas_recientes_service(limit=10):
     """Obtiene las empresas registradas más recientemente"""
     try:
+        limit = normalizar_limite(limit)
         empresas = Empresa.query.order_by(Empresa.fecha_registro.desc()).limit(limit).all()
+        planes = _planes_activos_por_empresa([e.id_empresa for e in empresas])
         resultado = []
         
         for empresa in empresas:
             empresa_dict = empresa.to_dict()
             
-            # Obtener suscripción activa
-            suscripcion = Suscripcion.query.filter_by(
-                id_empresa=empresa.id_empresa,
-                estado=True
-            ).first()
-            
-            if suscripcion:
-                plan = Plan.query.get(suscripcion.id_plan)
+            # Suscripción activa (ya cargada por lote)
+            if empresa.id_empresa in planes:
+                _, plan = planes[empresa.id_empresa]
                 empresa_dict['plan'] = plan.nombre if plan else 'N/A'
             else:
                 empresa_dict['plan'] = 'Sin plan'
@@ -393,53 +508,54 @@ def obtener_empresas_recientes_service(limit=10):
     except Exception as e:
         return {"error": str(e)}, 500
 
-def obtener_pagos_pendientes_service():
+def _serializar_pago_pendiente(sub):
+    sub_dict = sub.to_dict()
+    
+    # Información de empresa
+    if sub.empresa:
+        sub_dict['empresa_nombre'] = sub.empresa.nombre_comercial
+    
+    # Información de plan
+    if sub.plan:
+        sub_dict['plan_nombre'] = sub.plan.nombre
+        sub_dict['monto'] = float(sub.plan.precio_mensual) if sub.plan.precio_mensual else 0
+    
+    return sub_dict
+
+def obtener_pagos_pendientes_service(limit=None, cursor=None):
     """Obtiene suscripciones pendientes de validación"""
     try:
-        suscripciones = Suscripcion.query.filter_by(estado=False).all()
-        resultado = []
-        
-        for sub in suscripciones:
-            sub_dict = sub.to_dict()
-            
-            # Información de empresa
-            empresa = Empresa.query.get(sub.id_empresa)
-            if empresa:
-                sub_dict['empresa_nombre'] = empresa.nombre_comercial
-            
-            # Información de plan
-            plan = Plan.query.get(sub.id_plan)
-            if plan:
-                sub_dict['plan_nombre'] = plan.nombre
-                sub_dict['monto'] = float(plan.precio_mensual) if plan.precio_mensual else 0
-            
-            resultado.append(sub_dict)
-        
-        return resultado, 200
+        query = Suscripcion.query.options(joinedload(Suscripcion.empresa), joinedload(Suscripcion.plan))
+        query = query.filter(Suscripcion.estado == False)
+        pagina = paginar_keyset(query, (Suscripcion.id_suscripcion,), limit, cursor,
+                                serializar=_serializar_pago_pendiente)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
     except Exception as e:
         return {"error": str(e)}, 500
-    
-# Agregar esta función al archivo saas_service.py existente
 
-def obtener_empresas_con_propietarios_service():
-    """Obtiene todas las empresas con información de su propietario"""
+def obtener_empresas_con_propietarios_service(limit=None, cursor=None):
+    """
+    Obtiene las empresas con información de su propietario, plan y usuarios.
+    Por página: 1 consulta de empresas + 3 consultas por lote, sin importar cuántas empresas haya.
+    """
     try:
-        from app.models.empresa import Empresa
-        from app.models.seguridad import Usuario
-        from app.models.saas import Suscripcion, Plan
-        
-        empresas = Empresa.query.all()
+        pagina = paginar_keyset(Empresa.query, (Empresa.fecha_registro, Empresa.id_empresa),
+                                limit, cursor, descendente=True, serializar=lambda e: e)
+        empresas = pagina['items']
+        ids_empresa = [e.id_empresa for e in empresas]
+
+        propietarios = _propietarios_por_empresa(ids_empresa)
+        planes = _planes_activos_por_empresa(ids_empresa)
+        conteos = _conteo_usuarios_por_empresa(ids_empresa)
+
         resultado = []
-        
         for empresa in empresas:
             empresa_dict = empresa.to_dict()
             
-            # Buscar el propietario de la empresa
-            propietario = Usuario.query.filter_by(
-                id_empresa=empresa.id_empresa,
-                id_rol='PROPIETARIO'
-            ).first()
-            
+            # Propietario de la empresa
+            propietario = propietarios.get(empresa.id_empresa)
             if propietario:
                 empresa_dict['propietario'] = {
                     'id': propietario.id_usuario,
@@ -451,14 +567,9 @@ def obtener_empresas_con_propietarios_service():
             else:
                 empresa_dict['propietario'] = None
             
-            # Obtener suscripción activa
-            suscripcion = Suscripcion.query.filter_by(
-                id_empresa=empresa.id_empresa,
-                estado=True
-            ).first()
-            
-            if suscripcion:
-                plan = Plan.query.get(suscripcion.id_plan)
+            # Suscripción activa
+            if empresa.id_empresa in planes:
+                suscripcion, plan = planes[empresa.id_empresa]
                 empresa_dict['plan_actual'] = {
                     'id_plan': suscripcion.id_plan,
                     'nombre': plan.nombre if plan else 'N/A',
@@ -468,17 +579,18 @@ def obtener_empresas_con_propietarios_service():
             else:
                 empresa_dict['plan_actual'] = None
             
-            # Contar usuarios de la empresa
-            total_usuarios = Usuario.query.filter_by(id_empresa=empresa.id_empresa).count()
-            usuarios_activos = Usuario.query.filter_by(id_empresa=empresa.id_empresa, activo=True).count()
-            
+            # Usuarios de la empresa
+            total_usuarios, usuarios_activos = conteos.get(empresa.id_empresa, (0, 0))
             empresa_dict['estadisticas'] = {
                 'total_usuarios': total_usuarios,
                 'usuarios_activos': usuarios_activos
             }
             
             resultado.append(empresa_dict)
-        
-        return resultado, 200
+
+        pagina['items'] = resultado
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
     except Exception as e:
-        return {"error": str(e)}, 500
\ No newline at end of file
+        return {"error": str(e)}, 500
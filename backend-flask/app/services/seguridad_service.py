@@ -3,7 +3,11 @@ from app.models.seguridad import Rol, Usuario
 from app.models.empresa import Empresa, ConfiguracionEmpresa
 from app.models.saas import Suscripcion
 from app.models.token_blocklist import TokenBlocklist
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.revocacion import cache_revocacion, expiracion_desde_claims
+from app.utils.pagination import paginar_keyset, CursorInvalidoError
+from app.utils.tenant import consulta_empresa, obtener_de_empresa, id_empresa_para_crear
+from app.utils.ultimo_acceso import buffer_ultimo_acceso
+from app.utils.hashing import generar_hash_password, verificar_hash_password, HashingSaturadoError
 from flask_jwt_extended import create_access_token, get_jwt
 from datetime import datetime
 import uuid
@@ -29,9 +33,12 @@ def crear_rol_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_roles_service():
-    roles = Rol.query.all()
-    return [r.to_dict() for r in roles], 200
+def obtener_roles_service(limit=None, cursor=None):
+    try:
+        pagina = paginar_keyset(Rol.query, (Rol.id_rol,), limit, cursor)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def obtener_rol_por_id_service(id_rol):
     rol = Rol.query.get(id_rol)
@@ -73,16 +80,21 @@ def crear_usuario_service(data):
             return {"error": "La contraseña es obligatoria"}, 400
         if not data.get('email'):
             return {"error": "El email es obligatorio"}, 400
+        if not data.get('id_rol'):
+            return {"error": "El rol es obligatorio"}, 400
+        id_empresa = id_empresa_para_crear(data)
+        if not id_empresa:
+            return {"error": "id_empresa es obligatorio"}, 400
         
         if Usuario.query.filter_by(email=data['email']).first():
             return {"error": "El email ya está registrado"}, 400
         
         nuevo_id = data.get('id_usuario', str(uuid.uuid4()))
-        pass_hash = generate_password_hash(data['password'])
+        pass_hash = generar_hash_password(data['password'])
         
         nuevo_usuario = Usuario(
             id_usuario=nuevo_id,
-            id_empresa=data['id_empresa'],
+            id_empresa=id_empresa,
             id_rol=data['id_rol'],
             nombres=data.get('nombres'),
             apellido_paterno=data.get('apellido_paterno'),
@@ -95,52 +107,49 @@ def crear_usuario_service(data):
         db.session.add(nuevo_usuario)
         db.session.commit()
         return {"message": "Usuario registrado", "usuario": nuevo_usuario.to_dict()}, 201
+    except HashingSaturadoError as e:
+        db.session.rollback()
+        return {"error": str(e)}, 503
     except Exception as e:
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_usuarios_service():
+def obtener_usuarios_service(limit=None, cursor=None):
     """Obtiene usuarios ACTIVOS filtrados por empresa del token JWT"""
     try:
-        claims = get_jwt()
-        id_empresa = claims.get('id_empresa')
-        
-        # Si es SUPER_ADMIN, mostrar todos los usuarios
-        if claims.get('rol') == 'SUPER_ADMIN':
-            usuarios = Usuario.query.filter_by(activo=True).all()
-        else:
-            # Filtrar por empresa y solo activos
-            usuarios = Usuario.query.filter_by(id_empresa=id_empresa, activo=True).all()
-        
-        return [u.to_dict() for u in usuarios], 200
+        # consulta_empresa filtra por la empresa del token (SUPER_ADMIN ve todos los usuarios)
+        query = consulta_empresa(Usuario).options(*Usuario.opciones_carga())
+        query = query.filter(Usuario.activo == True)
+        pagina = paginar_keyset(query, (Usuario.fecha_creacion, Usuario.id_usuario),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
     except Exception as e:
         return {"error": str(e)}, 500
 
-def obtener_usuarios_inactivos_service():
+def obtener_usuarios_inactivos_service(limit=None, cursor=None):
     """Obtiene usuarios INACTIVOS filtrados por empresa del token JWT"""
     try:
-        claims = get_jwt()
-        id_empresa = claims.get('id_empresa')
-        
-        # Si es SUPER_ADMIN, mostrar todos los usuarios inactivos
-        if claims.get('rol') == 'SUPER_ADMIN':
-            usuarios = Usuario.query.filter_by(activo=False).all()
-        else:
-            # Filtrar por empresa y solo inactivos
-            usuarios = Usuario.query.filter_by(id_empresa=id_empresa, activo=False).all()
-        
-        return [u.to_dict() for u in usuarios], 200
+        # consulta_empresa filtra por la empresa del token (SUPER_ADMIN ve todos los usuarios inactivos)
+        query = consulta_empresa(Usuario).options(*Usuario.opciones_carga())
+        query = query.filter(Usuario.activo == False)
+        pagina = paginar_keyset(query, (Usuario.fecha_creacion, Usuario.id_usuario),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
     except Exception as e:
         return {"error": str(e)}, 500
 
 def obtener_usuario_por_id_service(id_usuario):
-    usuario = Usuario.query.get(id_usuario)
+    usuario = obtener_de_empresa(Usuario, id_usuario, *Usuario.opciones_carga())
     if not usuario:
         return {"error": "Usuario no encontrado"}, 404
     return usuario.to_dict(), 200
 
 def actualizar_usuario_service(id_usuario, data):
-    usuario = Usuario.query.get(id_usuario)
+    usuario = obtener_de_empresa(Usuario, id_usuario, *Usuario.opciones_carga())
     if not usuario:
         return {"error": "Usuario no encontrado"}, 404
     try:
@@ -154,17 +163,20 @@ def actualizar_usuario_service(id_usuario, data):
         if 'activo' in data: usuario.activo = data['activo']
         
         if 'password' in data and data['password']:
-            usuario.password_hash = generate_password_hash(data['password'])
+            usuario.password_hash = generar_hash_password(data['password'])
         
         db.session.commit()
         return {"message": "Usuario actualizado", "usuario": usuario.to_dict()}, 200
+    except HashingSaturadoError as e:
+        db.session.rollback()
+        return {"error": str(e)}, 503
     except Exception as e:
         db.session.rollback()
         return {"error": str(e)}, 500
 
 def desactivar_usuario_service(id_usuario):
     """Desactiva un usuario (eliminación lógica)"""
-    usuario = Usuario.query.get(id_usuario)
+    usuario = obtener_de_empresa(Usuario, id_usuario)
     if not usuario:
         return {"error": "Usuario no encontrado"}, 404
     
@@ -182,7 +194,7 @@ def desactivar_usuario_service(id_usuario):
 
 def activar_usuario_service(id_usuario):
     """Reactiva un usuario desactivado"""
-    usuario = Usuario.query.get(id_usuario)
+    usuario = obtener_de_empresa(Usuario, id_usuario)
     if not usuario:
         return {"error": "Usuario no encontrado"}, 404
     
@@ -196,7 +208,7 @@ def activar_usuario_service(id_usuario):
 
 def eliminar_usuario_service(id_usuario):
     """Eliminación física del usuario (solo SUPER_ADMIN)"""
-    usuario = Usuario.query.get(id_usuario)
+    usuario = obtener_de_empresa(Usuario, id_usuario)
     if not usuario:
         return {"error": "Usuario no encontrado"}, 404
     try:
@@ -217,7 +229,12 @@ def login_usuario_service(data):
     
     usuario = Usuario.query.filter_by(email=email).first()
     
-    if usuario and check_password_hash(usuario.password_hash, password):
+    try:
+        password_valido = usuario is not None and verificar_hash_password(usuario.password_hash, password)
+    except HashingSaturadoError as e:
+        return {"error": str(e)}, 503
+    
+    if password_valido:
         if not usuario.activo:
             return {"error": "Usuario inactivo. Contacte al administrador."}, 401
         
@@ -227,8 +244,8 @@ def login_usuario_service(data):
         }
         token = create_access_token(identity=usuario.id_usuario, additional_claims=additional_claims)
         
-        usuario.ultimo_acceso = datetime.utcnow()
-        db.session.commit()
+        # Se persiste en lote desde el buffer (write-behind), sin transacción en el login
+        buffer_ultimo_acceso.registrar(usuario.id_usuario)
         
         nombre_visual = f"{usuario.nombres} {usuario.apellido_paterno}".strip()
         
@@ -251,10 +268,13 @@ def login_usuario_service(data):
 
 def logout_service():
     try:
-        jti = get_jwt()["jti"]
-        revoked_token = TokenBlocklist(jti=jti)
+        claims = get_jwt()
+        jti = claims["jti"]
+        revoked_token = TokenBlocklist(jti=jti, expires_at=expiracion_desde_claims(claims))
         db.session.add(revoked_token)
         db.session.commit()
+        # Este worker deja de aceptar el token de inmediato; los demás al próximo sondeo
+        cache_revocacion.revocar(jti, claims.get("exp"))
         
         return {"message": "Sesión cerrada exitosamente. Token invalidado."}, 200
     except Exception as e:
@@ -310,7 +330,7 @@ def registrar_empresa_y_dueno_service(data):
         
         # 5. Crear USUARIO DUEÑO
         rol_inicial = 'PROPIETARIO'
-        pass_hash = generate_password_hash(data['password'])
+        pass_hash = generar_hash_password(data['password'])
         
         nuevo_usuario = Usuario(
             id_usuario=id_usuario_new,
@@ -365,6 +385,9 @@ def registrar_empresa_y_dueno_service(data):
                 "plan": "FREE"
             }
         }, 201
+    except HashingSaturadoError as e:
+        db.session.rollback()
+        return {"error": str(e)}, 503
     except Exception as e:
         db.session.rollback()
         return {"error": "Error en el registro: " + str(e)}, 500
\ No newline at end of file
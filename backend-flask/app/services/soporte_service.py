@@ -1,19 +1,90 @@
 from app.extensions import db
-from app.models.soporte import Notificacion, Auditoria
+from app.models.soporte import Notificacion, ContadorNotificacion, Auditoria
+from app.models.seguridad import Usuario
+from app.utils.pagination import paginar_keyset, CursorInvalidoError
+from app.utils.streaming import ArrayJSONStream, ExportacionStream, rango_fechas, filtrar_rango
+from app.utils.tenant import consulta_empresa, obtener_de_empresa, id_empresa_para_crear
+from app.utils.auditoria_async import escritor_auditoria, AuditoriaSaturadaError
+from app.utils.notificaciones_push import (
+    hub_notificaciones, publicar_notificaciones, FlujoNotificaciones, ConexionesAgotadasError
+)
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from app.utils.background import iniciar_tarea_periodica
+from app.utils.jsonb import documentos_filtro, filtro_contencion
+from app.utils.auditoria_automatica import CLAVE_ADMIN_SAAS, COLUMNAS_NO_AUDITADAS, TABLAS_EXCLUIDAS
+from flask import current_app
+from sqlalchemy import update, insert, delete, case, select, func, text, tuple_, values, column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from collections import Counter
+import json
+import re
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+
+# ==================== CONTADOR DE NO LEÍDAS ====================
+def sumar_no_leidas(deltas):
+    """
+    Aplica {id_usuario: delta} al contador de no leídas, dentro de la transacción del
+    llamador (no hace commit). El contador nunca baja de 0:
+
+    - Los deltas positivos van en un INSERT ... ON CONFLICT DO UPDATE (crea el contador).
+    - Los negativos en un UPDATE ... FROM (VALUES ...) con tope en 0. Un usuario sin contador
+      (notificaciones anteriores al backfill) ya cuenta como 0 y no se le crea uno negativo.
+    """
+    deltas = sorted((id_usuario, delta) for id_usuario, delta in deltas.items() if id_usuario and delta)
+    sumas = [{'id_usuario': id_usuario, 'no_leidas': delta} for id_usuario, delta in deltas if delta > 0]
+    restas = [(id_usuario, delta) for id_usuario, delta in deltas if delta < 0]
+    if sumas:
+        stmt = pg_insert(ContadorNotificacion).values(sumas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ContadorNotificacion.id_usuario],
+            set_={'no_leidas': ContadorNotificacion.no_leidas + stmt.excluded.no_leidas}
+        )
+        db.session.execute(stmt)
+    if restas:
+        v = values(
+            column('id_usuario', ContadorNotificacion.id_usuario.type),
+            column('delta', ContadorNotificacion.no_leidas.type),
+            name='v'
+        ).data(restas)
+        nuevo = ContadorNotificacion.no_leidas + v.c.delta
+        db.session.execute(
+            update(ContadorNotificacion)
+            .where(ContadorNotificacion.id_usuario == v.c.id_usuario)
+            .values(no_leidas=case((nuevo < 0, 0), else_=nuevo))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def insertar_notificaciones(filas):
+    """
+    Alta en lote para productores internos (alertas, procesos): un INSERT multi-fila,
+    contadores de no leídas y aviso a los streams SSE, en la transacción del llamador.
+    Cada fila lleva las columnas de Notificacion; id_notificacion y fecha_creacion se completan.
+    """
+    if not filas:
+        return []
+    ahora = datetime.utcnow()
+    filas = [{'id_notificacion': str(uuid.uuid4()), 'fecha_creacion': ahora, 'leida': False, **fila} for fila in filas]
+    db.session.execute(insert(Notificacion), filas)
+    sumar_no_leidas(Counter(fila['id_usuario'] for fila in filas if not fila['leida']))
+    publicar_notificaciones([Notificacion(**fila).to_dict() for fila in filas])
+    return filas
 
 # ==================== CRUD NOTIFICACIONES ====================
 def crear_notificacion_service(data):
     try:
         # Validaciones de integridad (Evitar error 500 si faltan datos)
-        if 'id_empresa' not in data or 'id_usuario' not in data:
+        id_empresa = id_empresa_para_crear(data)
+        if not id_empresa or 'id_usuario' not in data:
             return {"error": "Faltan datos obligatorios (id_empresa, id_usuario)"}, 400
+        if not obtener_de_empresa(Usuario, data['id_usuario'], id_empresa=id_empresa):
+            return {"error": "Usuario no encontrado"}, 404
 
         nuevo_id = data.get('id_notificacion', str(uuid.uuid4()))
         noti = Notificacion(
             id_notificacion=nuevo_id,
-            id_empresa=data['id_empresa'],
+            id_empresa=id_empresa,
             id_usuario=data['id_usuario'],
             tipo=data.get('tipo', 'INFO'),
             categoria=data.get('categoria', 'GENERAL'),
@@ -22,34 +93,71 @@ def crear_notificacion_service(data):
             datos_adicionales_json=data.get('datos_adicionales_json', {})
         )
         db.session.add(noti)
+        db.session.flush()
+        sumar_no_leidas({noti.id_usuario: 1})
+        publicar_notificaciones([noti.to_dict()])
         db.session.commit()
         return {"message": "Notificación creada", "notificacion": noti.to_dict()}, 201
     except Exception as e:
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_notificaciones_service():
-    # Nota: En un futuro SaaS real, aquí deberías filtrar por id_empresa
-    notis = Notificacion.query.all()
-    return [n.to_dict() for n in notis], 200
+def obtener_notificaciones_service(limit=None, cursor=None):
+    # consulta_empresa filtra por el id_empresa del token JWT
+    try:
+        pagina = paginar_keyset(consulta_empresa(Notificacion),
+                                (Notificacion.fecha_creacion, Notificacion.id_notificacion),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
+
+def buscar_notificaciones_service(filtros, limit=None, cursor=None):
+    """
+    Notificaciones de la empresa filtradas por datos_adicionales_json ('contiene' y pares
+    'rutas'/'valores', ver app/utils/jsonb.py) y opcionalmente por categoria, tipo, id_usuario y leida.
+    """
+    try:
+        query = consulta_empresa(Notificacion)
+        for campo in ('categoria', 'tipo', 'id_usuario'):
+            if filtros.get(campo):
+                query = query.filter(getattr(Notificacion, campo) == filtros[campo])
+        if filtros.get('leida') in ('0', '1'):
+            query = query.filter(Notificacion.leida == (filtros['leida'] == '1'))
+        documentos = documentos_filtro(filtros.get('contiene'), filtros.get('rutas', ()), filtros.get('valores', ()),
+                                        filtros.get('valor_texto', False))
+        if documentos:
+            query = query.filter(filtro_contencion([Notificacion.datos_adicionales_json], documentos))
+        pagina = paginar_keyset(query, (Notificacion.fecha_creacion, Notificacion.id_notificacion),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except (ValueError, CursorInvalidoError) as e:
+        return {"error": str(e)}, 400
 
 def obtener_notificacion_id_service(id_noti):
-    noti = Notificacion.query.get(id_noti)
+    noti = obtener_de_empresa(Notificacion, id_noti)
     return (noti.to_dict(), 200) if noti else ({"error": "No encontrada"}, 404)
 
 def actualizar_notificacion_service(id_noti, data):
-    noti = Notificacion.query.get(id_noti)
+    noti = obtener_de_empresa(Notificacion, id_noti)
     if not noti: 
         return {"error": "Notificación no encontrada"}, 404
     
     try:
-        # 1. Lógica de "Leída" automática
-        if 'leida' in data: 
-            noti.leida = data['leida']
-            if data['leida']: 
-                noti.fecha_lectura = datetime.utcnow()
-            else:
-                noti.fecha_lectura = None
+        # 1. Lógica de "Leída" automática: UPDATE condicional, el contador se mueve solo si
+        # esta petición cambió la fila (dos cambios concurrentes no restan dos veces)
+        if 'leida' in data:
+            leida = bool(data['leida'])
+            resultado = db.session.execute(
+                update(Notificacion)
+                .where(Notificacion.id_notificacion == noti.id_notificacion,
+                       Notificacion.leida.is_distinct_from(leida))
+                .values(leida=leida, fecha_lectura=datetime.utcnow() if leida else None)
+                .execution_options(synchronize_session=False)
+            )
+            if resultado.rowcount:
+                sumar_no_leidas({noti.id_usuario: -1 if leida else 1})
+            db.session.expire(noti, ['leida', 'fecha_lectura'])
         
         # 2. Actualizar contenido
         if 'titulo' in data: noti.titulo = data['titulo']
@@ -68,57 +176,407 @@ def actualizar_notificacion_service(id_noti, data):
         return {"error": str(e)}, 500
 
 def eliminar_notificacion_service(id_noti):
-    noti = Notificacion.query.get(id_noti)
+    noti = obtener_de_empresa(Notificacion, id_noti)
     if not noti: return {"error": "No encontrada"}, 404
     try:
-        db.session.delete(noti)
+        # DELETE ... RETURNING leida: se resta según el estado de la fila al borrarla
+        borrada = db.session.execute(
+            delete(Notificacion).where(Notificacion.id_notificacion == noti.id_notificacion)
+            .returning(Notificacion.leida).execution_options(synchronize_session=False)
+        ).first()
+        if borrada and not borrada.leida:
+            sumar_no_leidas({noti.id_usuario: -1})
         db.session.commit()
         return {"message": "Notificación eliminada"}, 200
     except Exception as e:
         db.session.rollback()
         return {"error": str(e)}, 500
 
+def stream_notificaciones_service(ultimo_id=None):
+    """
+    Stream SSE con las notificaciones nuevas del usuario autenticado.
+    ultimo_id (cabecera Last-Event-ID al reconectar): se reenvían primero las creadas después de esa.
+    """
+    id_usuario = get_jwt_identity()
+    try:
+        # Se suscribe antes de leer las pendientes para no perder las que lleguen en medio
+        suscripcion = hub_notificaciones.suscribir(id_usuario)
+    except ConexionesAgotadasError as e:
+        return {"error": str(e)}, 503
+    try:
+        pendientes = []
+        if ultimo_id:
+            tope = db.session.query(Notificacion.fecha_creacion) \
+                .filter(Notificacion.id_notificacion == ultimo_id, Notificacion.id_usuario == id_usuario).scalar()
+            if tope is not None:
+                pendientes = [n.to_dict() for n in Notificacion.query
+                              .filter(Notificacion.id_usuario == id_usuario,
+                                      db.tuple_(Notificacion.fecha_creacion, Notificacion.id_notificacion)
+                                      > db.tuple_(db.literal(tope, type_=Notificacion.fecha_creacion.type),
+                                                  db.literal(ultimo_id, type_=Notificacion.id_notificacion.type)))
+                              .order_by(Notificacion.fecha_creacion.asc(), Notificacion.id_notificacion.asc())
+                              .limit(100)]
+    except Exception as e:
+        hub_notificaciones.cancelar(suscripcion)
+        return {"error": str(e)}, 500
+    finally:
+        # El stream no usa la BD: la conexión vuelve al pool antes de empezar a enviar
+        db.session.close()
+    return FlujoNotificaciones(suscripcion, pendientes), 200
+
+def contar_no_leidas_service():
+    """Notificaciones sin leer del usuario autenticado (lectura de una fila del contador)."""
+    contador = db.session.get(ContadorNotificacion, get_jwt_identity())
+    return {"no_leidas": contador.no_leidas if contador else 0}, 200
+
+def marcar_leidas_service(data):
+    """
+    Marca como leídas las notificaciones del usuario autenticado hasta un punto:
+    {"hasta_id": id_notificacion} (esa y las anteriores), {"hasta": fecha ISO} o nada (todas).
+    Un solo UPDATE sobre ix_notificacion_usuario_leida_fecha; el contador baja en las filas cambiadas.
+    """
+    data = data or {}
+    if not isinstance(data, dict):
+        return {"error": "El cuerpo debe ser un objeto JSON"}, 400
+    for campo in ('hasta_id', 'hasta'):
+        if data.get(campo) is not None and not isinstance(data[campo], str):
+            return {"error": f"'{campo}' debe ser texto"}, 400
+    id_usuario = get_jwt_identity()
+    try:
+        condiciones = [Notificacion.id_usuario == id_usuario, Notificacion.leida == False]
+        if data.get('hasta_id'):
+            tope = db.session.query(Notificacion.fecha_creacion) \
+                .filter(Notificacion.id_notificacion == data['hasta_id'], Notificacion.id_usuario == id_usuario) \
+                .scalar()
+            if tope is None:
+                return {"error": "Notificación no encontrada"}, 404
+            # Mismo orden que el listado: (fecha_creacion, id_notificacion)
+            condiciones.append(db.tuple_(Notificacion.fecha_creacion, Notificacion.id_notificacion)
+                               <= db.tuple_(db.literal(tope, type_=Notificacion.fecha_creacion.type),
+                                            db.literal(data['hasta_id'], type_=Notificacion.id_notificacion.type)))
+        elif data.get('hasta'):
+            condiciones.append(Notificacion.fecha_creacion <= datetime.fromisoformat(data['hasta']))
+
+        resultado = db.session.execute(
+            update(Notificacion).where(*condiciones)
+            .values(leida=True, fecha_lectura=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        marcadas = resultado.rowcount
+        sumar_no_leidas({id_usuario: -marcadas})
+        db.session.commit()
+        contador = db.session.get(ContadorNotificacion, id_usuario)
+        return {
+            "message": "Notificaciones marcadas como leídas",
+            "marcadas": marcadas,
+            "no_leidas": contador.no_leidas if contador else 0
+        }, 200
+    except ValueError:
+        db.session.rollback()
+        return {"error": "Fecha 'hasta' inválida (use ISO 8601)"}, 400
+    except Exception as e:
+        db.session.rollback()
+        return {"error": str(e)}, 500
+
 # ==================== CRUD AUDITORIA ====================
 def crear_auditoria_service(data):
     try:
         # Validar campos críticos para que el log sea útil
-        required = ['id_empresa', 'id_usuario', 'tabla_afectada', 'accion']
+        required = ['tabla_afectada', 'accion']
         for campo in required:
             if campo not in data: return {"error": f"Falta campo obligatorio: {campo}"}, 400
+        id_empresa = id_empresa_para_crear(data)
+        if not id_empresa: return {"error": "Falta campo obligatorio: id_empresa"}, 400
 
-        nuevo_id = data.get('id_auditoria', str(uuid.uuid4()))
-        audit = Auditoria(
-            id_auditoria=nuevo_id,
-            id_empresa=data['id_empresa'],
-            id_usuario=data['id_usuario'],
-            tabla_afectada=data['tabla_afectada'],
-            accion=data['accion'], # Ej: INSERT, UPDATE, DELETE
-            datos_anteriores_json=data.get('datos_anteriores_json', {}),
-            datos_nuevos_json=data.get('datos_nuevos_json', {})
-        )
-        db.session.add(audit)
-        db.session.commit()
-        return {"message": "Registro de auditoría creado", "auditoria": audit.to_dict()}, 201
+        # El registro queda a nombre del usuario del token. El SUPER_ADMIN no es un Usuario de la
+        # empresa: indica id_usuario y se valida aquí, porque la escritura en lote es posterior
+        # a la respuesta 202 y una FK inválida ya no se podría informar.
+        es_super_admin = get_jwt().get('rol') == 'SUPER_ADMIN'
+        id_usuario = data.get('id_usuario') if es_super_admin else get_jwt_identity()
+        if not id_usuario: return {"error": "Falta campo obligatorio: id_usuario"}, 400
+        if not obtener_de_empresa(Usuario, id_usuario, id_empresa=id_empresa):
+            return {"error": "Usuario no encontrado"}, 404
+
+        # Se encola y lo escribe en lote el escritor de auditoría (app/utils/auditoria_async.py).
+        # id_auditoria lo genera el servidor: uno repetido se descartaría en la escritura.
+        fila = escritor_auditoria.registrar({
+            'id_empresa': id_empresa,
+            'id_usuario': id_usuario,
+            'tabla_afectada': data['tabla_afectada'],
+            'accion': data['accion'], # Ej: INSERT, UPDATE, DELETE
+            'datos_anteriores_json': data.get('datos_anteriores_json', {}),
+            'datos_nuevos_json': data.get('datos_nuevos_json', {})
+        })
+        return {"message": "Registro de auditoría aceptado", "auditoria": Auditoria(**fila).to_dict()}, 202
+    except AuditoriaSaturadaError as e:
+        return {"error": str(e)}, 503
     except Exception as e:
-        db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_auditorias_service():
-    audits = Auditoria.query.all()
-    return [a.to_dict() for a in audits], 200
+def obtener_auditorias_service(limit=None, cursor=None, stream=False):
+    try:
+        if stream:
+            query = consulta_empresa(Auditoria).order_by(Auditoria.fecha_hora.desc(), Auditoria.id_auditoria.desc())
+            return ArrayJSONStream(query), 200
+        pagina = paginar_keyset(consulta_empresa(Auditoria), (Auditoria.fecha_hora, Auditoria.id_auditoria),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
+
+def exportar_auditoria_service(desde=None, hasta=None, formato='ndjson'):
+    """Exportación completa (NDJSON o CSV) de un rango de fechas, en streaming."""
+    try:
+        inicio, fin = rango_fechas(desde, hasta)
+        query = filtrar_rango(consulta_empresa(Auditoria), Auditoria.fecha_hora, inicio, fin)
+        query = query.order_by(Auditoria.fecha_hora.asc(), Auditoria.id_auditoria.asc())
+        return ExportacionStream(query, formato, f"auditoria_{desde or 'inicio'}_{hasta or 'hoy'}"), 200
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+def buscar_auditoria_service(filtros, limit=None, cursor=None):
+    """
+    Auditoría de un rango de fechas, opcionalmente filtrada por tabla_afectada, id_usuario y accion
+    (p. ej. cambios a 'producto' del usuario X la semana pasada). Sin 'desde' se usan los últimos
+    AUDITORIA_RANGO_DIAS días. El rango hace que PostgreSQL lea solo las particiones de esos meses.
+
+    Filtros sobre los datos (ver app/utils/jsonb.py): 'contiene' (objeto JSON) y pares 'rutas'/'valores',
+    buscados en datos_anteriores_json y/o datos_nuevos_json según 'en' (anteriores | nuevos | ambos).
+    """
+    try:
+        inicio, fin = rango_fechas(filtros.get('desde'), filtros.get('hasta'))
+        if inicio is None:
+            inicio = (fin or datetime.utcnow()) - timedelta(days=current_app.config.get('AUDITORIA_RANGO_DIAS', 30))
+        query = filtrar_rango(consulta_empresa(Auditoria), Auditoria.fecha_hora, inicio, fin)
+        if filtros.get('tabla'):
+            query = query.filter(Auditoria.tabla_afectada == filtros['tabla'])
+        if filtros.get('id_usuario'):
+            query = query.filter(Auditoria.id_usuario == filtros['id_usuario'])
+        if filtros.get('accion'):
+            query = query.filter(Auditoria.accion == filtros['accion'].upper())
+        documentos = documentos_filtro(filtros.get('contiene'), filtros.get('rutas', ()), filtros.get('valores', ()),
+                                        filtros.get('valor_texto', False))
+        if documentos:
+            columnas = {
+                'anteriores': [Auditoria.datos_anteriores_json],
+                'nuevos': [Auditoria.datos_nuevos_json],
+                'ambos': [Auditoria.datos_anteriores_json, Auditoria.datos_nuevos_json],
+            }.get(filtros.get('en') or 'ambos')
+            if columnas is None:
+                return {"error": "'en' debe ser anteriores, nuevos o ambos"}, 400
+            query = query.filter(filtro_contencion(columnas, documentos))
+        pagina = paginar_keyset(query, (Auditoria.fecha_hora, Auditoria.id_auditoria),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except (ValueError, CursorInvalidoError) as e:
+        return {"error": str(e)}, 400
+
+def _claves_pk_tabla(tabla):
+    """Nombres de las columnas PK del modelo mapeado a 'tabla' (None si no hay modelo o no se audita)."""
+    if tabla in TABLAS_EXCLUIDAS:
+        return None
+    for mapper in db.Model.registry.mappers:
+        if mapper.local_table.name == tabla:
+            return [mapper.get_property_by_column(col).key for col in mapper.primary_key]
+    return None
+
+def obtener_version_service(tabla, id_registro=None, pk=None, fecha=None):
+    """
+    Reconstruye un registro de 'tabla' tal como estaba en 'fecha' (por defecto, ahora) a partir
+    de la auditoría: parte del último snapshot (INSERT o snapshot periódico) anterior a esa fecha
+    y aplica en orden los diffs posteriores. El registro se identifica con 'id_registro' (PK de
+    una columna) o 'pk' (objeto JSON con todas las columnas de la PK).
+
+    Los registros se buscan por contención de la PK en los JSON (índices GIN) y el límite de
+    fecha deja fuera las particiones posteriores. 'completo' es False si no hay snapshot
+    (registro anterior a la auditoría automática) o si la tabla tiene columnas que se
+    escriben sin auditoría (COLUMNAS_NO_AUDITADAS): esas no se devuelven.
+    """
+    claves_pk = _claves_pk_tabla(tabla)
+    if not claves_pk:
+        return {"error": f"Tabla '{tabla}' desconocida"}, 404
+    try:
+        if pk:
+            documento_pk = json.loads(pk)
+            if not isinstance(documento_pk, dict) or set(documento_pk) != set(claves_pk):
+                raise ValueError(f"'pk' debe ser un objeto con {', '.join(claves_pk)}")
+        elif id_registro and len(claves_pk) == 1:
+            documento_pk = {claves_pk[0]: id_registro}
+        else:
+            raise ValueError(f"Indique 'id' o 'pk' ({', '.join(claves_pk)})")
+        _, fin = rango_fechas(None, fecha)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    query = consulta_empresa(Auditoria).filter(
+        Auditoria.tabla_afectada == tabla,
+        filtro_contencion([Auditoria.datos_anteriores_json, Auditoria.datos_nuevos_json], [documento_pk]),
+    )
+    if fin:
+        # Una fecha AAAA-MM-DD incluye el día completo; un instante incluye el cambio hecho en él
+        query = query.filter(Auditoria.fecha_hora < fin if len(fecha) == 10 else Auditoria.fecha_hora <= fin)
+    snapshot = (query.filter(Auditoria.es_snapshot.is_(True))
+                .order_by(Auditoria.fecha_hora.desc(), Auditoria.id_auditoria.desc())
+                .first())
+    if snapshot:
+        query = query.filter(tuple_(Auditoria.fecha_hora, Auditoria.id_auditoria)
+                             > tuple_(snapshot.fecha_hora, snapshot.id_auditoria))
+    cambios = query.order_by(Auditoria.fecha_hora, Auditoria.id_auditoria).all()
+    if not snapshot and not cambios:
+        return {"error": "Sin auditoría para ese registro"}, 404
+
+    version = dict(snapshot.datos_nuevos_json) if snapshot else {}
+    completo = snapshot is not None
+    for cambio in cambios:
+        if cambio.accion == 'DELETE':
+            version = None
+        elif cambio.es_snapshot:
+            version, completo = dict(cambio.datos_nuevos_json), True
+        else:
+            version = {**(version or {}), **cambio.datos_nuevos_json}
+    omitidas = sorted(COLUMNAS_NO_AUDITADAS.get(tabla, ()))
+    if version is not None:
+        version.pop(CLAVE_ADMIN_SAAS, None)
+        for columna in omitidas:
+            version.pop(columna, None)
+
+    ultimo = cambios[-1] if cambios else snapshot
+    return {
+        "tabla": tabla,
+        "pk": documento_pk,
+        "fecha": fecha or None,
+        "version": version,
+        "eliminado": version is None,
+        "completo": completo and not omitidas,
+        "columnas_omitidas": omitidas,
+        "snapshot": snapshot.id_auditoria if snapshot else None,
+        "cambios_aplicados": len(cambios),
+        "ultima_modificacion": ultimo.fecha_hora.isoformat(),
+    }, 200
 
 def obtener_auditoria_id_service(id_audit):
-    audit = Auditoria.query.get(id_audit)
+    audit = obtener_de_empresa(Auditoria, id_audit)
     return (audit.to_dict(), 200) if audit else ({"error": "No encontrada"}, 404)
 
 def eliminar_auditoria_service(id_audit):
     # Nota: Generalmente las auditorías NO deberían borrarse, pero lo dejamos por si acaso.
-    audit = Auditoria.query.get(id_audit)
+    audit = obtener_de_empresa(Auditoria, id_audit)
     if not audit: return {"error": "No encontrada"}, 404
+    if _claves_pk_tabla(audit.tabla_afectada):
+        # Snapshots y diffs forman la cadena de versiones del registro: sacar uno cambiaría
+        # las versiones reconstruidas. La retención se hace por particiones (AUDITORIA_RETENCION_MESES).
+        return {"error": "Los registros de auditoría de tablas versionadas no se eliminan"}, 409
     try:
         db.session.delete(audit)
         db.session.commit()
         return {"message": "Registro eliminado"}, 200
     except Exception as e:
         db.session.rollback()
-        return {"error": str(e)}, 500
\ No newline at end of file
+        return {"error": str(e)}, 500
+
+
+# ==================== PARTICIONES DE AUDITORÍA ====================
+# Clave de pg_try_advisory_xact_lock: un solo worker mantiene las particiones a la vez
+_LOCK_PARTICIONES = 0x41554449
+_PARTICION_MENSUAL = re.compile(r'auditoria_(\d{4})_(\d{2})')
+
+
+def _inicio_mes(fecha, desplazamiento=0):
+    indice = fecha.year * 12 + fecha.month - 1 + desplazamiento
+    return datetime(indice // 12, indice % 12 + 1, 1)
+
+
+def _crear_particion_mensual(inicio):
+    nombre = f"auditoria_{inicio:%Y_%m}"
+    db.session.execute(text(
+        f"CREATE TABLE {nombre} PARTITION OF auditoria "
+        f"FOR VALUES FROM ('{inicio:%Y-%m-%d}') TO ('{_inicio_mes(inicio, 1):%Y-%m-%d}')"
+    ))
+    return nombre
+
+
+def mantener_particiones_auditoria():
+    """
+    Mantenimiento de la tabla auditoria particionada por mes (solo PostgreSQL):
+
+    - Crea auditoria_AAAA_MM para el mes actual y los AUDITORIA_PARTICIONES_ADELANTE siguientes,
+      más auditoria_default para filas fuera de rango.
+    - Si auditoria_default tiene filas (meses sin partición o historial migrado), la desvincula,
+      crea las particiones de esos meses, mueve las filas y la vuelve a vincular vacía. PostgreSQL
+      no permite crear la partición de un mes que ya tiene filas en la DEFAULT.
+    - Con AUDITORIA_RETENCION_MESES > 0 elimina con DROP TABLE las particiones mensuales que
+      terminaron antes de ese período: borrar un mes entero no recorre filas ni deja la tabla
+      con espacio muerto, a diferencia de un DELETE. Las filas de la DEFAULT anteriores al
+      límite se descartan al moverlas.
+
+    Devuelve {"creadas": [...], "eliminadas": [...], "movidas": n}.
+    """
+    resultado = {"creadas": [], "eliminadas": [], "movidas": 0}
+    if db.engine.dialect.name != 'postgresql':
+        return resultado
+    if not db.session.execute(select(func.pg_try_advisory_xact_lock(_LOCK_PARTICIONES))).scalar():
+        return resultado
+
+    existentes = set(db.session.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'auditoria'::regclass"
+    )).scalars())
+
+    ahora = datetime.utcnow()
+    retencion = current_app.config.get('AUDITORIA_RETENCION_MESES', 0)
+    limite = _inicio_mes(ahora, -retencion) if retencion > 0 else None
+
+    meses = {_inicio_mes(ahora, desplazamiento)
+             for desplazamiento in range(current_app.config.get('AUDITORIA_PARTICIONES_ADELANTE', 2) + 1)}
+
+    con_default = 'auditoria_default' in existentes and db.session.execute(
+        text("SELECT EXISTS (SELECT 1 FROM auditoria_default)")).scalar()
+    if con_default:
+        meses_default = db.session.execute(text(
+            "SELECT DISTINCT date_trunc('month', fecha_hora) FROM auditoria_default"
+        )).scalars()
+        meses.update(mes for mes in meses_default if limite is None or mes >= limite)
+        # Desvinculada, la DEFAULT no impide crear las particiones de los meses que contiene
+        db.session.execute(text("ALTER TABLE auditoria DETACH PARTITION auditoria_default"))
+
+    for inicio in sorted(meses):
+        if f"auditoria_{inicio:%Y_%m}" not in existentes:
+            resultado["creadas"].append(_crear_particion_mensual(inicio))
+
+    if con_default:
+        filtro = " WHERE fecha_hora >= :limite" if limite else ""
+        resultado["movidas"] = db.session.execute(
+            text("INSERT INTO auditoria SELECT * FROM auditoria_default" + filtro),
+            {"limite": limite} if limite else {}
+        ).rowcount
+        db.session.execute(text("TRUNCATE auditoria_default"))
+        db.session.execute(text("ALTER TABLE auditoria ATTACH PARTITION auditoria_default DEFAULT"))
+    elif 'auditoria_default' not in existentes:
+        db.session.execute(text("CREATE TABLE auditoria_default PARTITION OF auditoria DEFAULT"))
+        resultado["creadas"].append('auditoria_default')
+
+    if limite:
+        for nombre in sorted(existentes):
+            mes = _PARTICION_MENSUAL.fullmatch(nombre)
+            if mes and _inicio_mes(datetime(int(mes.group(1)), int(mes.group(2)), 1), 1) <= limite:
+                db.session.execute(text(f"DROP TABLE {nombre}"))
+                resultado["eliminadas"].append(nombre)
+
+    db.session.commit()
+    if resultado["movidas"]:
+        print(f"⚠️ auditoria_default tenía filas: {resultado['movidas']} movidas a sus particiones mensuales")
+    return resultado
+
+
+def iniciar_mantenimiento_auditoria(app):
+    """Mantiene las particiones al arrancar el worker y luego cada AUDITORIA_PARTICIONES_SECONDS."""
+    with app.app_context():
+        try:
+            mantener_particiones_auditoria()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ No se pudieron preparar las particiones de auditoría: {e}")
+        finally:
+            db.session.remove()
+    intervalo = app.config.get('AUDITORIA_PARTICIONES_SECONDS', 0)
+    return iniciar_tarea_periodica(app, 'particiones-auditoria', intervalo, mantener_particiones_auditoria)
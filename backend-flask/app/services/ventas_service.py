@@ -1,12 +1,25 @@
 from app.extensions import db
 from app.models.ventas import Cliente, Venta, DetalleVenta, Pago
+from app.models.inventario import Producto, Inventario
+from app.models.empresa import ConfiguracionEmpresa
+from app.models.seguridad import Usuario
+from app.services.inventario_service import descontar_stock
+from app.utils.pagination import paginar_keyset, CursorInvalidoError
+from app.utils.streaming import ArrayJSONStream, ExportacionStream, rango_fechas, filtrar_rango
+from app.utils.tenant import consulta_empresa, obtener_de_empresa, id_empresa_para_crear
+from app.utils.auditoria_automatica import auditar_filas
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from sqlalchemy import insert
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from datetime import datetime
 import uuid
 
 # ==================== CRUD CLIENTE ====================
 def crear_cliente_service(data):
     try:
         # Validar empresa y nombre (razon_social)
-        if 'id_empresa' not in data:
+        id_empresa = id_empresa_para_crear(data)
+        if not id_empresa:
             return {"error": "id_empresa es obligatorio"}, 400
             
         nuevo_id = data.get('id_cliente', str(uuid.uuid4()))
@@ -14,7 +27,7 @@ def crear_cliente_service(data):
         # CAMBIO: nombre_completo -> razon_social
         cliente = Cliente(
             id_cliente=nuevo_id,
-            id_empresa=data['id_empresa'],
+            id_empresa=id_empresa,
             razon_social=data.get('razon_social'), 
             nit_ci=data.get('nit_ci'),
             telefono=data.get('telefono'),
@@ -29,16 +42,20 @@ def crear_cliente_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_clientes_service():
-    clientes = Cliente.query.all()
-    return [c.to_dict() for c in clientes], 200
+def obtener_clientes_service(limit=None, cursor=None):
+    try:
+        pagina = paginar_keyset(consulta_empresa(Cliente), (Cliente.fecha_registro, Cliente.id_cliente),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def obtener_cliente_id_service(id_cli):
-    cliente = Cliente.query.get(id_cli)
+    cliente = obtener_de_empresa(Cliente, id_cli)
     return (cliente.to_dict(), 200) if cliente else ({"error": "Cliente no encontrado"}, 404)
 
 def actualizar_cliente_service(id_cli, data):
-    cliente = Cliente.query.get(id_cli)
+    cliente = obtener_de_empresa(Cliente, id_cli)
     if not cliente: return {"error": "No encontrado"}, 404
     try:
         # CAMBIO: nombre_completo -> razon_social
@@ -55,7 +72,7 @@ def actualizar_cliente_service(id_cli, data):
         return {"error": str(e)}, 500
 
 def eliminar_cliente_service(id_cli):
-    cliente = Cliente.query.get(id_cli)
+    cliente = obtener_de_empresa(Cliente, id_cli)
     if not cliente: return {"error": "No encontrado"}, 404
     try:
         db.session.delete(cliente)
@@ -70,15 +87,22 @@ def eliminar_cliente_service(id_cli):
 def crear_venta_service(data):
     try:
         # id_usuario es requerido al crear, aunque luego la BD permita NULL si se borra el usuario
-        required = ['id_empresa', 'id_cliente', 'id_usuario', 'total']
+        required = ['id_cliente', 'id_usuario', 'total']
         for campo in required:
             if campo not in data:
                 return {"error": f"Falta el campo obligatorio: {campo}"}, 400
+        id_empresa = id_empresa_para_crear(data)
+        if not id_empresa:
+            return {"error": "Falta el campo obligatorio: id_empresa"}, 400
+        if not obtener_de_empresa(Cliente, data['id_cliente'], id_empresa=id_empresa):
+            return {"error": "Cliente no encontrado"}, 404
+        if not obtener_de_empresa(Usuario, data['id_usuario'], id_empresa=id_empresa):
+            return {"error": "Usuario no encontrado"}, 404
 
         nuevo_id = data.get('id_venta', str(uuid.uuid4()))
         venta = Venta(
             id_venta=nuevo_id,
-            id_empresa=data['id_empresa'],
+            id_empresa=id_empresa,
             id_cliente=data['id_cliente'],
             id_usuario=data['id_usuario'],
             numero_factura=data.get('numero_factura'),
@@ -97,16 +121,34 @@ def crear_venta_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_ventas_service():
-    ventas = Venta.query.all()
-    return [v.to_dict() for v in ventas], 200
+def obtener_ventas_service(limit=None, cursor=None, stream=False):
+    try:
+        query = consulta_empresa(Venta).options(*Venta.opciones_carga())
+        if stream:
+            # Todas las ventas en un solo array, codificadas a medida que llegan de la BD
+            return ArrayJSONStream(query.order_by(Venta.fecha_venta.desc(), Venta.id_venta.desc())), 200
+        pagina = paginar_keyset(query, (Venta.fecha_venta, Venta.id_venta),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
+
+def exportar_ventas_service(desde=None, hasta=None, formato='ndjson'):
+    """Exportación completa (NDJSON o CSV) de un rango de fechas, en streaming."""
+    try:
+        inicio, fin = rango_fechas(desde, hasta)
+        query = filtrar_rango(consulta_empresa(Venta).options(*Venta.opciones_carga()), Venta.fecha_venta, inicio, fin)
+        query = query.order_by(Venta.fecha_venta.asc(), Venta.id_venta.asc())
+        return ExportacionStream(query, formato, f"ventas_{desde or 'inicio'}_{hasta or 'hoy'}"), 200
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
 def obtener_venta_id_service(id_venta):
-    venta = Venta.query.get(id_venta)
+    venta = obtener_de_empresa(Venta, id_venta, *Venta.opciones_carga())
     return (venta.to_dict(), 200) if venta else ({"error": "Venta no encontrada"}, 404)
 
 def eliminar_venta_service(id_venta):
-    venta = Venta.query.get(id_venta)
+    venta = obtener_de_empresa(Venta, id_venta)
     if not venta: return {"error": "No encontrado"}, 404
     try:
         db.session.delete(venta)
@@ -116,11 +158,194 @@ def eliminar_venta_service(id_venta):
         db.session.rollback()
         return {"error": str(e)}, 500
 
+# ==================== CHECKOUT (VENTA COMPLETA) ====================
+_CENTAVOS = Decimal('0.01')
+
+
+def _monto(valor, campo):
+    try:
+        monto = Decimal(str(valor if valor is not None else 0))
+    except InvalidOperation:
+        raise ValueError(f"{campo} no es un número válido")
+    if monto < 0:
+        raise ValueError(f"{campo} no puede ser negativo")
+    return monto
+
+
+def registrar_checkout_service(data):
+    """
+    Registra en una sola transacción la venta, sus líneas, sus pagos y el descuento de stock.
+
+    Los precios salen del catálogo (Producto.precio_venta) y los importes se calculan aquí:
+      subtotal = Σ (precio_unitario * cantidad - descuento_linea)
+      impuesto = (subtotal - descuento) * ConfiguracionEmpresa.impuesto_iva / 100
+      total    = subtotal - descuento + impuesto
+    Los productos con Inventario se descuentan con un UPDATE condicional; si alguno no
+    tiene stock suficiente no se guarda nada (409).
+    """
+    data = data or {}
+    id_empresa = id_empresa_para_crear(data)
+    if not id_empresa:
+        return {"error": "Falta el campo obligatorio: id_empresa"}, 400
+    if not data.get('id_cliente'):
+        return {"error": "Falta el campo obligatorio: id_cliente"}, 400
+    lineas = data.get('detalles') or []
+    pagos = data.get('pagos') or []
+    if not isinstance(lineas, list) or not lineas:
+        return {"error": "La venta debe tener al menos un detalle"}, 400
+    if not isinstance(pagos, list):
+        return {"error": "pagos debe ser una lista"}, 400
+
+    # La venta queda a nombre de quien la registra. El SUPER_ADMIN no es un Usuario de la
+    # empresa: puede indicar el vendedor (id_usuario), que se valida contra la empresa más abajo
+    es_super_admin = get_jwt().get('rol') == 'SUPER_ADMIN'
+    id_usuario = data.get('id_usuario') if es_super_admin else get_jwt_identity()
+
+    try:
+        # 1. Validación de líneas y pagos (sin tocar la BD)
+        cantidades = {}
+        for i, linea in enumerate(lineas, start=1):
+            if not isinstance(linea, dict) or not linea.get('id_producto'):
+                return {"error": f"Detalle {i}: id_producto es obligatorio"}, 400
+            cantidad = linea.get('cantidad', 1)
+            if not isinstance(cantidad, int) or isinstance(cantidad, bool) or cantidad <= 0:
+                return {"error": f"Detalle {i}: cantidad debe ser un entero mayor a 0"}, 400
+            _monto(linea.get('descuento_linea'), f"Detalle {i}: descuento_linea")
+            cantidades[linea['id_producto']] = cantidades.get(linea['id_producto'], 0) + cantidad
+        for i, pago in enumerate(pagos, start=1):
+            if not isinstance(pago, dict):
+                return {"error": f"Pago {i}: formato inválido"}, 400
+            _monto(pago.get('monto_pagado'), f"Pago {i}: monto_pagado")
+        descuento = _monto(data.get('descuento'), "descuento")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        # 2. Cliente, productos (con marca de inventario) e IVA de la empresa
+        if not db.session.query(Cliente.id_cliente).filter(
+                Cliente.id_cliente == data['id_cliente'], Cliente.id_empresa == id_empresa).first():
+            return {"error": "Cliente no encontrado"}, 404
+        if id_usuario and not db.session.query(Usuario.id_usuario).filter(
+                Usuario.id_usuario == id_usuario, Usuario.id_empresa == id_empresa).first():
+            return {"error": "Usuario no encontrado"}, 404
+
+        con_inventario = db.exists().where(Inventario.id_producto == Producto.id_producto)
+        filas = db.session.query(Producto.id_producto, Producto.precio_venta, con_inventario.label('con_inventario')) \
+            .filter(Producto.id_empresa == id_empresa,
+                    Producto.id_producto.in_(list(cantidades)),
+                    Producto.activo == True) \
+            .all()
+        productos = {f.id_producto: f for f in filas}
+        faltantes = [p for p in cantidades if p not in productos]
+        if faltantes:
+            return {"error": "Productos no encontrados o inactivos", "productos": faltantes}, 404
+
+        iva = db.session.query(ConfiguracionEmpresa.impuesto_iva) \
+            .filter(ConfiguracionEmpresa.id_empresa == id_empresa).scalar() or Decimal('0')
+
+        # 3. Importes
+        id_venta = str(uuid.uuid4())
+        detalles = []
+        subtotal = Decimal('0')
+        for linea in lineas:
+            precio = productos[linea['id_producto']].precio_venta or Decimal('0')
+            descuento_linea = _monto(linea.get('descuento_linea'), 'descuento_linea')
+            importe = (precio * linea.get('cantidad', 1) - descuento_linea).quantize(_CENTAVOS, ROUND_HALF_UP)
+            if importe < 0:
+                return {"error": f"El descuento de {linea['id_producto']} supera el importe de la línea"}, 400
+            subtotal += importe
+            detalles.append({
+                'id_detalle_venta': str(uuid.uuid4()), 'id_venta': id_venta,
+                'id_producto': linea['id_producto'], 'cantidad': linea.get('cantidad', 1),
+                'precio_unitario': precio, 'subtotal': importe, 'descuento_linea': descuento_linea
+            })
+        base = subtotal - descuento
+        if base < 0:
+            return {"error": "El descuento supera el subtotal"}, 400
+        impuesto = (base * Decimal(iva) / 100).quantize(_CENTAVOS, ROUND_HALF_UP)
+        total = base + impuesto
+
+        # 4. Stock: un UPDATE condicional para todos los productos con inventario
+        a_descontar = {p: c for p, c in cantidades.items() if productos[p].con_inventario}
+        descontados = descontar_stock(a_descontar, referencia=id_venta)
+        sin_stock = sorted(set(a_descontar) - descontados)
+        if sin_stock:
+            db.session.rollback()
+            return {"error": "Stock insuficiente", "productos": sin_stock}, 409
+
+        # 5. Venta + detalles + pagos (inserts multi-fila)
+        fecha_venta = datetime.utcnow()
+        tipo_venta = data.get('tipo_venta', 'CONTADO')
+        venta = Venta(
+            id_venta=id_venta,
+            id_empresa=id_empresa,
+            id_cliente=data['id_cliente'],
+            id_usuario=id_usuario,
+            numero_factura=data.get('numero_factura'),
+            subtotal=subtotal,
+            impuesto=impuesto,
+            descuento=descuento,
+            total=total,
+            fecha_venta=fecha_venta,
+            tipo_venta=tipo_venta,
+            observaciones=data.get('observaciones'),
+            estado=True
+        )
+        db.session.add(venta)
+        db.session.flush()
+        db.session.execute(insert(DetalleVenta), detalles)
+        auditar_filas(DetalleVenta, 'INSERT', detalles, id_empresa)
+        filas_pago = [{
+            'id_pago': str(uuid.uuid4()), 'id_venta': id_venta,
+            'metodo_pago': pago.get('metodo_pago'),
+            'monto_pagado': _monto(pago.get('monto_pagado'), 'monto_pagado'),
+            'comprobante_url': pago.get('comprobante_url'),
+            'numero_transaccion': pago.get('numero_transaccion'),
+            'estado': pago.get('estado', 'PENDIENTE'),
+            'fecha_pago': fecha_venta
+        } for pago in pagos]
+        if filas_pago:
+            db.session.execute(insert(Pago), filas_pago)
+            auditar_filas(Pago, 'INSERT', filas_pago, id_empresa)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return {"error": str(e)}, 500
+
+    pagado = sum((p['monto_pagado'] for p in filas_pago), Decimal('0'))
+    return {
+        "message": "Venta registrada",
+        "venta": {
+            'id_venta': id_venta,
+            'id_empresa': id_empresa,
+            'id_cliente': data['id_cliente'],
+            'id_usuario': id_usuario,
+            'numero_factura': data.get('numero_factura'),
+            'subtotal': float(subtotal),
+            'impuesto': float(impuesto),
+            'descuento': float(descuento),
+            'total': float(total),
+            'fecha_venta': fecha_venta.isoformat(),
+            'tipo_venta': tipo_venta,
+            'estado': True
+        },
+        "detalles": [{**d, 'precio_unitario': float(d['precio_unitario']), 'subtotal': float(d['subtotal']),
+                      'descuento_linea': float(d['descuento_linea'])} for d in detalles],
+        "pagos": [{**p, 'monto_pagado': float(p['monto_pagado']), 'fecha_pago': p['fecha_pago'].isoformat()}
+                  for p in filas_pago],
+        "saldo_pendiente": float(max(total - pagado, Decimal('0')))
+    }, 201
+
 # ==================== CRUD DETALLE VENTA ====================
 def crear_detalle_venta_service(data):
     try:
         if 'id_venta' not in data or 'id_producto' not in data:
             return {"error": "Faltan datos (id_venta, id_producto)"}, 400
+        venta = obtener_de_empresa(Venta, data['id_venta'])
+        if not venta:
+            return {"error": "Venta no encontrada"}, 404
+        if not obtener_de_empresa(Producto, data['id_producto'], id_empresa=venta.id_empresa):
+            return {"error": "Producto no encontrado"}, 404
 
         nuevo_id = data.get('id_detalle_venta', str(uuid.uuid4()))
         detalle = DetalleVenta(
@@ -139,13 +364,18 @@ def crear_detalle_venta_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_detalles_por_venta_service(id_venta):
+def obtener_detalles_por_venta_service(id_venta, limit=None, cursor=None):
     # Función útil para listar items de una venta específica
-    detalles = DetalleVenta.query.filter_by(id_venta=id_venta).all()
-    return [d.to_dict() for d in detalles], 200
+    try:
+        query = consulta_empresa(DetalleVenta).options(*DetalleVenta.opciones_carga())
+        query = query.filter(DetalleVenta.id_venta == id_venta)
+        pagina = paginar_keyset(query, (DetalleVenta.id_detalle_venta,), limit, cursor)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def eliminar_detalle_venta_service(id_detalle):
-    detalle = DetalleVenta.query.get(id_detalle)
+    detalle = obtener_de_empresa(DetalleVenta, id_detalle)
     if not detalle: return {"error": "No encontrado"}, 404
     try:
         db.session.delete(detalle)
@@ -160,6 +390,8 @@ def eliminar_detalle_venta_service(id_detalle):
 def crear_pago_service(data):
     try:
         if 'id_venta' not in data: return {"error": "id_venta es obligatorio"}, 400
+        if not obtener_de_empresa(Venta, data['id_venta']):
+            return {"error": "Venta no encontrada"}, 404
 
         nuevo_id = data.get('id_pago', str(uuid.uuid4()))
         pago = Pago(
@@ -178,16 +410,20 @@ def crear_pago_service(data):
         db.session.rollback()
         return {"error": str(e)}, 500
 
-def obtener_pagos_service():
-    pagos = Pago.query.all()
-    return [p.to_dict() for p in pagos], 200
+def obtener_pagos_service(limit=None, cursor=None):
+    try:
+        pagina = paginar_keyset(consulta_empresa(Pago), (Pago.fecha_pago, Pago.id_pago),
+                                limit, cursor, descendente=True)
+        return pagina, 200
+    except CursorInvalidoError as e:
+        return {"error": str(e)}, 400
 
 def obtener_pago_id_service(id_pago):
-    pago = Pago.query.get(id_pago)
+    pago = obtener_de_empresa(Pago, id_pago)
     return (pago.to_dict(), 200) if pago else ({"error": "No encontrado"}, 404)
 
 def eliminar_pago_service(id_pago):
-    pago = Pago.query.get(id_pago)
+    pago = obtener_de_empresa(Pago, id_pago)
     if not pago: return {"error": "No encontrado"}, 404
     try:
         db.session.delete(pago)
@@ -0,0 +1,214 @@
+import atexit
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, DataError
+from app.extensions import db
+from app.models.soporte import Auditoria
+
+
+class AuditoriaSaturadaError(Exception):
+    """La cola de auditoría sigue llena tras AUDITORIA_ESPERA_MAX_MS; el servicio debe responder 503."""
+    pass
+
+
+class EscritorAuditoria:
+    """
+    Cola en memoria (por worker) de registros de auditoría que un hilo escribe en lotes.
+
+    registrar() no abre transacción: agrega el registro a la cola y vuelve. El hilo escritor
+    hace un INSERT multi-fila + commit cada AUDITORIA_FLUSH_MS o en cuanto hay AUDITORIA_BATCH
+    registros. Si la base de datos falla, el lote vuelve al frente de la cola y se reintenta.
+
+    Contrapresión: con AUDITORIA_MAX_COLA registros pendientes, registrar()/registrar_lote()
+    esperan hasta AUDITORIA_ESPERA_MAX_MS a que se libere lugar y si no lanzan AuditoriaSaturadaError.
+    Al terminar el proceso se escribe lo que quede en la cola.
+
+    Sin hilo escritor en el proceso (AUDITORIA_FLUSH_MS = 0, scripts) se escribe en el momento.
+    """
+
+    def __init__(self):
+        self._cola = deque()  # (monotonic al encolar, fila)
+        self._condicion = threading.Condition()
+        self._hay_lote = threading.Event()
+        self._pid = None
+        self._escribiendo = threading.Lock()
+        self._metricas = {
+            "encolados": 0,
+            "escritos": 0,
+            "lotes": 0,
+            "errores": 0,
+            "rechazados": 0,
+            "descartados": 0,
+            "esperas_contrapresion": 0,
+            "ultimo_lote_ms": 0.0,
+            "ultimo_error": None,
+        }
+
+    def _activo(self):
+        return self._pid == os.getpid()
+
+    def registrar(self, fila):
+        """
+        Encola un registro de auditoría (columnas de Auditoria). Completa id_auditoria y fecha_hora.
+        Devuelve la fila encolada.
+        """
+        return self.registrar_lote([fila])[0]
+
+    def registrar_lote(self, filas):
+        """
+        Encola varios registros de una vez (p. ej. todos los de una transacción). Con la cola
+        llena espera una sola vez, hasta AUDITORIA_ESPERA_MAX_MS, y luego encola el lote completo
+        o lo rechaza completo con AuditoriaSaturadaError. Devuelve las filas encoladas.
+        """
+        # Fechas crecientes dentro del lote: las versiones se reconstruyen en orden (fecha_hora, id_auditoria)
+        ahora = datetime.utcnow()
+        filas = [{'id_auditoria': str(uuid.uuid4()), 'fecha_hora': ahora + timedelta(microseconds=i),
+                  'es_snapshot': False, **fila}
+                 for i, fila in enumerate(filas)]
+        if not filas:
+            return filas
+        if not self._activo():
+            self._escribir(filas)
+            with self._condicion:
+                self._metricas["escritos"] += len(filas)
+                self._metricas["lotes"] += 1
+            return filas
+
+        max_cola = current_app.config.get('AUDITORIA_MAX_COLA', 20000)
+        espera_max = current_app.config.get('AUDITORIA_ESPERA_MAX_MS', 2000) / 1000
+        tamano_lote = current_app.config.get('AUDITORIA_BATCH', 500)
+        with self._condicion:
+            if len(self._cola) >= max_cola:
+                self._metricas["esperas_contrapresion"] += 1
+                self._hay_lote.set()
+                if not self._condicion.wait_for(lambda: len(self._cola) < max_cola, timeout=espera_max):
+                    self._metricas["rechazados"] += len(filas)
+                    raise AuditoriaSaturadaError("Auditoría saturada, intente nuevamente")
+            # El lote entra entero: la cola puede pasar AUDITORIA_MAX_COLA como mucho en un lote
+            momento = time.monotonic()
+            self._cola.extend((momento, fila) for fila in filas)
+            self._metricas["encolados"] += len(filas)
+            lleno = len(self._cola) >= tamano_lote
+        if lleno:
+            self._hay_lote.set()
+        return filas
+
+    def _escribir(self, filas):
+        # Transacción propia: nunca confirma ni revierte la sesión de la petición
+        with db.engine.begin() as conexion:
+            conexion.execute(insert(Auditoria), filas)
+
+    def _escribir_separado(self, lote):
+        """Escribe las filas de un lote rechazado de a una y descarta las que fallan."""
+        for _, fila in lote:
+            try:
+                self._escribir([fila])
+            except (IntegrityError, DataError) as e:
+                with self._condicion:
+                    self._metricas["descartados"] += 1
+                    self._metricas["ultimo_error"] = str(e.orig)
+                print(f"⚠️ Registro de auditoría descartado ({fila.get('tabla_afectada')}/{fila.get('accion')}): {e.orig}")
+
+    def vaciar(self, todo=False):
+        """
+        Escribe un lote (o toda la cola con todo=True). Devuelve la cantidad de registros escritos.
+        Un solo hilo escribe a la vez, así el orden de la cola se respeta.
+        """
+        tamano_lote = current_app.config.get('AUDITORIA_BATCH', 500)
+        escritos = 0
+        with self._escribiendo:
+            while True:
+                with self._condicion:
+                    lote = [self._cola.popleft() for _ in range(min(tamano_lote, len(self._cola)))]
+                if not lote:
+                    return escritos
+                inicio = time.perf_counter()
+                try:
+                    self._escribir([fila for _, fila in lote])
+                except (IntegrityError, DataError):
+                    # Alguna fila nunca va a entrar (p. ej. FK a un registro borrado): fila por fila
+                    self._escribir_separado(lote)
+                except Exception as e:
+                    with self._condicion:
+                        # Vuelven al frente de la cola, en el mismo orden
+                        self._cola.extendleft(reversed(lote))
+                        self._metricas["errores"] += 1
+                        self._metricas["ultimo_error"] = str(e)
+                    raise
+                with self._condicion:
+                    self._metricas["escritos"] += len(lote)
+                    self._metricas["lotes"] += 1
+                    self._metricas["ultimo_lote_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+                    # Hay lugar: despierta a los productores frenados por contrapresión
+                    self._condicion.notify_all()
+                escritos += len(lote)
+                if not todo and len(lote) < tamano_lote:
+                    return escritos
+
+    def iniciar(self, app):
+        """Hilo escritor del proceso actual. Devuelve el Event que lo detiene (o None si AUDITORIA_FLUSH_MS <= 0)."""
+        intervalo = app.config.get('AUDITORIA_FLUSH_MS', 200) / 1000
+        if intervalo <= 0:
+            return None
+
+        detener = threading.Event()
+
+        def ciclo():
+            while not detener.is_set():
+                self._hay_lote.wait(intervalo)
+                self._hay_lote.clear()
+                with app.app_context():
+                    try:
+                        self.vaciar()
+                    except Exception as e:
+                        print(f"⚠️ Escritura de auditoría falló, se reintenta: {e}")
+                        detener.wait(min(intervalo * 10, 5))
+
+        self._pid = os.getpid()
+        hilo = threading.Thread(target=ciclo, name='auditoria-escritor', daemon=True)
+        hilo.start()
+        return detener
+
+    def metricas(self):
+        with self._condicion:
+            datos = dict(self._metricas)
+            datos["en_cola"] = len(self._cola)
+            # Antigüedad del registro más viejo sin escribir (retraso de la auditoría)
+            datos["retraso_ms"] = round((time.monotonic() - self._cola[0][0]) * 1000, 2) if self._cola else 0.0
+        datos["pid"] = os.getpid()
+        datos["activo"] = self._activo()
+        return datos
+
+
+escritor_auditoria = EscritorAuditoria()
+
+
+def registrar_auditoria(id_empresa, id_usuario, tabla_afectada, accion, datos_anteriores=None, datos_nuevos=None):
+    """Atajo para que los servicios dejen un registro de auditoría sin esperar a la base de datos."""
+    return escritor_auditoria.registrar({
+        'id_empresa': id_empresa,
+        'id_usuario': id_usuario,
+        'tabla_afectada': tabla_afectada,
+        'accion': accion,
+        'datos_anteriores_json': datos_anteriores or {},
+        'datos_nuevos_json': datos_nuevos or {},
+    })
+
+
+def iniciar_escritor_auditoria(app):
+    """Arranca el hilo escritor y registra la escritura final de la cola al terminar el proceso."""
+    def vaciar_al_salir():
+        with app.app_context():
+            try:
+                escritor_auditoria.vaciar(todo=True)
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar la auditoría pendiente al apagar: {e}")
+
+    atexit.register(vaciar_al_salir)
+    return escritor_auditoria.iniciar(app)
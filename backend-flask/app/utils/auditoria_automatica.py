@@ -0,0 +1,227 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from flask import current_app, has_app_context, has_request_context
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.soporte import Auditoria
+from app.utils.auditoria_async import escritor_auditoria, AuditoriaSaturadaError
+
+# Tablas que no se auditan: la propia auditoría, contadores y libros que ya son un registro de cambios
+TABLAS_EXCLUIDAS = {
+    'auditoria', 'notificacion', 'contador_notificacion', 'movimiento_stock', 'checkpoint_stock', 'token_blocklist',
+}
+# Columnas cuyo valor no se guarda (solo se indica que cambiaron)
+_COLUMNAS_OCULTAS = {'password_hash', 'token_recuperacion'}
+# Columnas que se actualizan con sentencias set-based sin auditoría: no se registran y las
+# versiones reconstruidas no las incluyen (el stock tiene su historial en movimiento_stock)
+COLUMNAS_NO_AUDITADAS = {
+    'inventario': {'cantidad_actual', 'ultima_actualizacion'},
+    'usuario': {'ultimo_acceso'},
+}
+# Clave interna de datos_nuevos_json que no es una columna del registro
+CLAVE_ADMIN_SAAS = '_admin_saas'
+
+def _activa():
+    return has_app_context() and current_app.config.get('AUDITORIA_AUTOMATICA', True)
+
+
+def _a_json(columna, valor):
+    if columna in _COLUMNAS_OCULTAS and valor is not None:
+        return '***'
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _actor():
+    """(id_usuario, id_empresa, admin_saas) del token de la petición actual; None fuera de una petición autenticada."""
+    if not has_request_context():
+        return None, None, None
+    try:
+        claims = get_jwt()
+        identidad = get_jwt_identity()
+    except Exception:
+        return None, None, None
+    if claims.get('rol') == 'SUPER_ADMIN':
+        # El admin del SaaS no es un Usuario: no puede ir en la FK id_usuario
+        return None, None, identidad
+    return identidad, claims.get('id_empresa'), None
+
+
+def _toca_snapshot(conexion, tabla, pk):
+    """
+    True si entre los últimos AUDITORIA_SNAPSHOT_CADA registros del mismo registro (dentro de
+    AUDITORIA_SNAPSHOT_MAX_DIAS) no hay un snapshot: se decide con lo que ya está en la tabla
+    auditoria, igual para todos los workers y sin perderse al reciclarlos. 0 = nunca.
+    Los registros todavía en la cola del escritor no cuentan; eso solo adelanta el snapshot.
+    """
+    cada = current_app.config.get('AUDITORIA_SNAPSHOT_CADA', 20)
+    if cada <= 0:
+        return False
+    if conexion.dialect.name != 'postgresql':
+        # Sin @> sobre JSON (SQLite de desarrollo): siempre fila completa
+        return True
+    desde = datetime.utcnow() - timedelta(days=current_app.config.get('AUDITORIA_SNAPSHOT_MAX_DIAS', 30))
+    t = Auditoria.__table__
+    # (tabla_afectada, datos_nuevos_json @> pk) con índice GIN; el rango acota las particiones
+    ultimos = conexion.execute(
+        select(t.c.es_snapshot)
+        .where(t.c.tabla_afectada == tabla, t.c.datos_nuevos_json.contains(pk), t.c.fecha_hora >= desde)
+        .order_by(t.c.fecha_hora.desc())
+        .limit(cada)
+    ).scalars().all()
+    return not any(ultimos)
+
+
+def _registro(estado, accion):
+    """
+    Registro de auditoría de un objeto a partir de su estado en la sesión, sin consultar la BD.
+
+    INSERT guarda la fila (snapshot). UPDATE guarda un diff: en datos_nuevos_json solo las
+    columnas con historial de cambios; el valor anterior va en datos_anteriores_json salvo con
+    AUDITORIA_COMPACTA, porque se puede reconstruir de la versión previa. Cada
+    AUDITORIA_SNAPSHOT_CADA cambios de un registro (o si el último snapshot tiene más de
+    AUDITORIA_SNAPSHOT_MAX_DIAS) el UPDATE guarda la fila completa, si todas las columnas
+    están cargadas, para acotar la reconstrucción.
+    DELETE guarda los valores cargados. La PK va en ambos lados; en UPDATE datos_anteriores_json
+    lleva además las FK cargadas (salvo id_empresa), así ruta=id_producto&valor=P1 también
+    encuentra los cambios de inventario o detalle_venta de ese producto.
+    """
+    mapper = estado.mapper
+    tabla = mapper.local_table.name
+    if tabla in TABLAS_EXCLUIDAS:
+        return None
+
+    valores = estado.dict
+    claves_pk = [mapper.get_property_by_column(col).key for col in mapper.primary_key]
+    pk = {clave: _a_json(clave, valores.get(clave)) for clave in claves_pk}
+    anteriores, nuevos = {}, {}
+    no_auditadas = COLUMNAS_NO_AUDITADAS.get(tabla, ())
+
+    for atributo in mapper.column_attrs:
+        clave = atributo.key
+        if clave in no_auditadas:
+            continue
+        if accion == 'INSERT':
+            if valores.get(clave) is not None:
+                nuevos[clave] = _a_json(clave, valores[clave])
+        elif accion == 'DELETE':
+            if clave in valores:
+                anteriores[clave] = _a_json(clave, valores[clave])
+        else:
+            # history no dispara cargas perezosas: si el valor anterior no estaba cargado queda en None
+            historial = estado.attrs[clave].history
+            if historial.added:
+                nuevos[clave] = _a_json(clave, historial.added[0])
+                anteriores[clave] = _a_json(clave, historial.deleted[0]) if historial.deleted else None
+    if accion == 'UPDATE' and not nuevos:
+        return None
+
+    es_snapshot = accion == 'INSERT'
+    if accion == 'UPDATE':
+        if current_app.config.get('AUDITORIA_COMPACTA', True):
+            anteriores = {}
+        columnas = [atributo.key for atributo in mapper.column_attrs if atributo.key not in no_auditadas]
+        if all(clave in valores for clave in columnas) and _toca_snapshot(estado.session.connection(), tabla, pk):
+            # Mismo formato que el INSERT: las columnas en NULL no se guardan
+            nuevos = {clave: _a_json(clave, valores[clave]) for clave in columnas if valores[clave] is not None}
+            es_snapshot = True
+
+    if accion == 'UPDATE':
+        referencias = {}
+        for columna in mapper.local_table.columns:
+            clave = mapper.get_property_by_column(columna).key
+            if not columna.foreign_keys or columna.name == 'id_empresa' or clave not in valores:
+                continue
+            # Si la FK cambió, la referencia anterior (la nueva ya está en datos_nuevos_json)
+            historial = estado.attrs[clave].history
+            referencias[clave] = _a_json(clave, historial.deleted[0] if historial.deleted else valores[clave])
+        anteriores = {**pk, **referencias, **anteriores}
+    elif accion == 'DELETE':
+        anteriores = {**pk, **anteriores}
+    if accion != 'DELETE':
+        nuevos = {**pk, **nuevos}
+    return {
+        'tabla_afectada': tabla,
+        'accion': accion,
+        # Al borrar una empresa sus registros de auditoría se irían con ella (FK en cascada)
+        'id_empresa': None if tabla == 'empresa' and accion == 'DELETE' else valores.get('id_empresa'),
+        'datos_anteriores_json': anteriores,
+        'datos_nuevos_json': nuevos,
+        'es_snapshot': es_snapshot,
+    }
+
+
+def auditar_filas(modelo, accion, filas, id_empresa=None):
+    """
+    Auditoría de escrituras set-based (insert()/upsert de Core) que no pasan por after_flush.
+    Cada fila trae todas las columnas del registro (los valores insertados o el RETURNING
+    del upsert), así que se guarda como snapshot. Se encolan junto con los cambios del ORM
+    al confirmar la transacción (un rollback las descarta).
+    """
+    if not _activa() or not filas:
+        return
+    mapper = inspect(modelo)
+    tabla = mapper.local_table.name
+    claves_pk = [mapper.get_property_by_column(col).key for col in mapper.primary_key]
+    no_auditadas = COLUMNAS_NO_AUDITADAS.get(tabla, ())
+    registros = db.session.info.setdefault('auditoria_pendiente', [])
+    for fila in filas:
+        pk = {clave: _a_json(clave, fila.get(clave)) for clave in claves_pk}
+        registros.append({
+            'tabla_afectada': tabla,
+            'accion': accion,
+            'id_empresa': id_empresa or fila.get('id_empresa'),
+            'datos_anteriores_json': pk if accion == 'UPDATE' else {},
+            'datos_nuevos_json': {clave: _a_json(clave, valor) for clave, valor in fila.items()
+                                  if valor is not None and clave not in no_auditadas},
+            'es_snapshot': True,
+        })
+
+
+@event.listens_for(Session, 'after_flush')
+def _capturar_cambios(session, contexto):
+    """
+    Junta los cambios ORM del flush en session.info; se encolan al confirmar la transacción.
+    Las sentencias set-based (insert()/update() de Core) no pasan por aquí: las que crean o
+    reemplazan filas se auditan con auditar_filas(); el resto se declara en COLUMNAS_NO_AUDITADAS.
+    """
+    if not _activa():
+        return
+    registros = session.info.setdefault('auditoria_pendiente', [])
+    for objetos, accion in ((session.new, 'INSERT'), (session.dirty, 'UPDATE'), (session.deleted, 'DELETE')):
+        for obj in objetos:
+            if accion == 'UPDATE' and not session.is_modified(obj, include_collections=False):
+                continue
+            registro = _registro(inspect(obj), accion)
+            if registro:
+                registros.append(registro)
+
+
+@event.listens_for(Session, 'after_commit')
+def _encolar_tras_commit(session):
+    registros = session.info.pop('auditoria_pendiente', None)
+    if not registros:
+        return
+    id_usuario, id_empresa, admin_saas = _actor()
+    for registro in registros:
+        registro['id_usuario'] = id_usuario
+        if registro['id_empresa'] is None and registro['tabla_afectada'] != 'empresa':
+            registro['id_empresa'] = id_empresa
+        if admin_saas:
+            registro['datos_nuevos_json'][CLAVE_ADMIN_SAAS] = admin_saas
+    # Un solo encolado por transacción: con la cola llena se espera una vez, no una por registro
+    try:
+        escritor_auditoria.registrar_lote(registros)
+    except AuditoriaSaturadaError as e:
+        # La transacción de negocio ya se confirmó: no se puede revertir por la auditoría
+        print(f"⚠️ Auditoría automática perdida ({len(registros)} registros): {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_tras_rollback(session):
+    session.info.pop('auditoria_pendiente', None)
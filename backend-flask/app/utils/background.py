@@ -0,0 +1,29 @@
+import threading
+from app.extensions import db
+
+
+def iniciar_tarea_periodica(app, nombre, intervalo, funcion):
+    """
+    Ejecuta funcion() cada 'intervalo' segundos en un hilo daemon, dentro del app context.
+    Cada gunicorn/worker tiene su propio hilo. Si intervalo <= 0 la tarea no se inicia.
+    Devuelve el threading.Event que detiene la tarea (o None).
+    """
+    if not intervalo or intervalo <= 0:
+        return None
+
+    detener = threading.Event()
+
+    def ciclo():
+        while not detener.wait(intervalo):
+            with app.app_context():
+                try:
+                    funcion()
+                except Exception as e:
+                    print(f"⚠️ Tarea periódica '{nombre}' falló: {e}")
+                finally:
+                    # Devuelve la conexión al pool; el hilo no tiene petición que la cierre
+                    db.session.remove()
+
+    hilo = threading.Thread(target=ciclo, name=nombre, daemon=True)
+    hilo.start()
+    return detener
@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturoTimeoutError
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingSaturadoError(Exception):
+    """Hay demasiados hashes de contraseña en cola o no terminó a tiempo; el servicio debe responder 503."""
+    pass
+
+
+class EjecutorHashing:
+    """
+    Pool de procesos dedicado a generar/verificar hashes de contraseña.
+
+    El hash (pbkdf2/scrypt de werkzeug) consume decenas de ms de CPU; ejecutarlo en
+    procesos aparte evita que una ola de logins retenga el GIL del worker y lo reparte
+    entre núcleos. La cola está acotada por PASSWORD_HASH_MAX_PENDING: por encima se
+    rechaza con HashingSaturadoError en lugar de acumular peticiones.
+
+    Un cupo se libera cuando el hash termina de verdad, no cuando la petición deja de
+    esperarlo: si vence PASSWORD_HASH_TIMEOUT el proceso sigue ocupado y la cola lo cuenta.
+
+    Con PASSWORD_HASH_WORKERS = 0 se calcula en línea (útil en desarrollo).
+    """
+
+    def __init__(self):
+        self._pool = None
+        self._pid = None
+        self._cupos = None
+        self._lock = threading.Lock()
+        self._metricas = {
+            "enviados": 0,
+            "rechazados": 0,
+            "errores": 0,
+            "en_curso": 0,
+            "tiempo_total_ms": 0.0,
+            "tiempo_max_ms": 0.0,
+        }
+
+    def _obtener_pool(self):
+        # El pool se crea después del fork de cada worker (un pool heredado no funciona)
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    workers = current_app.config.get('PASSWORD_HASH_WORKERS', 2)
+                    max_pendientes = current_app.config.get('PASSWORD_HASH_MAX_PENDING', 32)
+                    # Sin fork: el worker gthread tiene hilos (y locks tomados) que un fork copiaría
+                    metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=workers, mp_context=multiprocessing.get_context(metodo))
+                    self._cupos = threading.BoundedSemaphore(max_pendientes)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _ejecutar(self, funcion, *args):
+        inicio = time.perf_counter()
+        if current_app.config.get('PASSWORD_HASH_WORKERS', 2) <= 0:
+            return funcion(*args)
+
+        pool = self._obtener_pool()
+        if not self._cupos.acquire(blocking=False):
+            with self._lock:
+                self._metricas["rechazados"] += 1
+            raise HashingSaturadoError("Servicio de autenticación saturado, intente nuevamente")
+
+        with self._lock:
+            self._metricas["enviados"] += 1
+            self._metricas["en_curso"] += 1
+        try:
+            futuro = pool.submit(funcion, *args)
+        except Exception:
+            self._terminar(inicio, error=True)
+            raise
+        futuro.add_done_callback(lambda f: self._terminar(inicio, error=f.cancelled() or f.exception() is not None))
+
+        try:
+            return futuro.result(timeout=current_app.config.get('PASSWORD_HASH_TIMEOUT', 10))
+        except FuturoTimeoutError:
+            # Si todavía no empezó se descarta; si está corriendo conserva su cupo hasta terminar
+            futuro.cancel()
+            raise HashingSaturadoError("Servicio de autenticación saturado, intente nuevamente")
+
+    def _terminar(self, inicio, error=False):
+        self._cupos.release()
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            if error:
+                self._metricas["errores"] += 1
+            self._metricas["en_curso"] -= 1
+            self._metricas["tiempo_total_ms"] += duracion_ms
+            self._metricas["tiempo_max_ms"] = max(self._metricas["tiempo_max_ms"], duracion_ms)
+
+    def generar(self, password):
+        return self._ejecutar(generate_password_hash, password)
+
+    def verificar(self, password_hash, password):
+        return self._ejecutar(check_password_hash, password_hash, password)
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._metricas)
+        completados = datos["enviados"] - datos["en_curso"]
+        datos["tiempo_promedio_ms"] = round(datos["tiempo_total_ms"] / completados, 2) if completados else 0.0
+        datos["tiempo_total_ms"] = round(datos["tiempo_total_ms"], 2)
+        datos["tiempo_max_ms"] = round(datos["tiempo_max_ms"], 2)
+        datos["pid"] = os.getpid()
+        return datos
+
+
+ejecutor_hashing = EjecutorHashing()
+
+
+def generar_hash_password(password):
+    return ejecutor_hashing.generar(password)
+
+
+def verificar_hash_password(password_hash, password):
+    return ejecutor_hashing.verificar(password_hash, password)
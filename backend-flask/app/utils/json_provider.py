@@ -0,0 +1,56 @@
+from decimal import Decimal
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el encoder estándar de Flask
+    orjson = None
+
+
+def _valor_por_defecto(valor):
+    # Mismo resultado que DefaultJSONProvider para los tipos que orjson no cubre
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, (set, frozenset)):
+        return list(valor)
+    if hasattr(valor, '__html__'):
+        return str(valor.__html__())
+    raise TypeError(f"Objeto de tipo {type(valor).__name__} no es serializable a JSON")
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Proveedor JSON de Flask basado en orjson (jsonify, request.get_json, app.json).
+
+    orjson codifica en C y maneja datetime/date/UUID de forma nativa (ISO 8601);
+    Decimal se envía como texto, igual que el proveedor por defecto.
+    No ordena las claves: el orden es el de cada to_dict().
+    """
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        return orjson.dumps(obj, default=_valor_por_defecto, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+def configurar_json(app):
+    """Usa orjson si está instalado (JSON_PROVIDER=orjson por defecto; 'default' lo desactiva)."""
+    if orjson is not None and app.config.get('JSON_PROVIDER', 'orjson') == 'orjson':
+        app.json = OrjsonProvider(app)
+
+
+def codificar_json(obj):
+    """bytes JSON de un objeto con el proveedor activo (para respuestas armadas a mano)."""
+    proveedor = current_app.json
+    if isinstance(proveedor, OrjsonProvider):
+        return proveedor.dumps_bytes(obj)
+    return proveedor.dumps(obj).encode('utf-8')
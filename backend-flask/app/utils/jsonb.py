@@ -0,0 +1,54 @@
+import json
+from sqlalchemy import and_, or_
+
+
+def _valor_json(texto):
+    """'5' -> 5, 'true' -> True, '"5"' -> '5'; lo que no es JSON válido se toma como texto."""
+    try:
+        return json.loads(texto)
+    except (TypeError, ValueError):
+        return texto
+
+
+def documento_ruta(ruta, valor, texto=False):
+    """
+    'cliente.id' + 'C1' -> {"cliente": {"id": "C1"}}: un filtro por ruta expresado como contención.
+    Con texto=True el valor se usa tal cual, como texto ('123' sigue siendo '123').
+    """
+    claves = [clave for clave in (ruta or '').split('.') if clave]
+    if not claves:
+        raise ValueError("Ruta JSON vacía")
+    documento = valor if texto else _valor_json(valor)
+    for clave in reversed(claves):
+        documento = {clave: documento}
+    return documento
+
+
+def documentos_filtro(contiene=None, rutas=(), valores=(), valores_texto=False):
+    """
+    Documentos JSON que la columna debe contener (todos), a partir de los parámetros de búsqueda:
+    contiene='{"id_producto": "P1"}' y/o pares ruta='cliente.id' / valor='C1'.
+    Con valores_texto=True los valores no se interpretan como JSON (códigos numéricos guardados como texto).
+    Lanza ValueError si no son válidos.
+    """
+    documentos = []
+    if contiene:
+        try:
+            documento = json.loads(contiene)
+        except ValueError:
+            raise ValueError("'contiene' no es JSON válido")
+        if not isinstance(documento, dict):
+            raise ValueError("'contiene' debe ser un objeto JSON")
+        documentos.append(documento)
+    if len(rutas) != len(valores):
+        raise ValueError("Cada 'ruta' necesita su 'valor'")
+    documentos.extend(documento_ruta(ruta, valor, valores_texto) for ruta, valor in zip(rutas, valores))
+    return documentos
+
+
+def filtro_contencion(columnas, documentos):
+    """
+    Condición "alguna de las columnas JSONB contiene todos los documentos" (columna @> documento).
+    El operador @> lo resuelven los índices GIN jsonb_path_ops de esas columnas.
+    """
+    return or_(*[and_(*[columna.contains(documento) for documento in documentos]) for columna in columnas])
@@ -0,0 +1,232 @@
+import json
+import queue
+import select
+import threading
+import time
+from flask import Response, current_app
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app.extensions import db
+
+# Canal de LISTEN/NOTIFY por el que se reparten las notificaciones entre workers
+CANAL = 'notificaciones'
+# NOTIFY admite hasta 8000 bytes de payload; por encima se envía solo el id
+_MAX_PAYLOAD = 7900
+
+
+class ConexionesAgotadasError(Exception):
+    """El worker ya tiene NOTIF_SSE_MAX_CONEXIONES streams abiertos; el servicio debe responder 503."""
+    pass
+
+
+class Suscripcion:
+    """Cola de eventos de un stream SSE abierto (un cliente / pestaña)."""
+
+    def __init__(self, id_usuario, max_pendientes):
+        self.id_usuario = id_usuario
+        self.cola = queue.Queue(maxsize=max_pendientes)
+        # El cliente no consumió a tiempo y se perdieron eventos: debe recargar la bandeja
+        self.desbordada = False
+
+
+class HubNotificaciones:
+    """
+    Pub/sub en memoria (por worker) entre los productores de notificaciones y los streams SSE.
+
+    Cada stream abierto es una Suscripcion con una cola acotada; publicar() solo hace
+    put_nowait en las colas del usuario, así un cliente lento nunca frena al productor.
+    Un stream inactivo es un hilo bloqueado en cola.get() y una entrada en un dict.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscripciones = {}  # id_usuario -> set(Suscripcion)
+        self._abiertas = 0
+        self._metricas = {"publicados": 0, "entregados": 0, "descartados": 0, "rechazadas": 0}
+
+    def suscribir(self, id_usuario):
+        max_conexiones = current_app.config.get('NOTIF_SSE_MAX_CONEXIONES', 2)
+        suscripcion = Suscripcion(id_usuario, current_app.config.get('NOTIF_SSE_MAX_PENDIENTES', 100))
+        with self._lock:
+            if self._abiertas >= max_conexiones:
+                self._metricas["rechazadas"] += 1
+                raise ConexionesAgotadasError("Demasiadas conexiones de notificaciones abiertas, intente más tarde")
+            self._suscripciones.setdefault(id_usuario, set()).add(suscripcion)
+            self._abiertas += 1
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            abiertas_usuario = self._suscripciones.get(suscripcion.id_usuario)
+            if abiertas_usuario and suscripcion in abiertas_usuario:
+                abiertas_usuario.discard(suscripcion)
+                self._abiertas -= 1
+                if not abiertas_usuario:
+                    del self._suscripciones[suscripcion.id_usuario]
+
+    def publicar(self, id_usuario, notificacion):
+        with self._lock:
+            destinos = list(self._suscripciones.get(id_usuario, ()))
+            self._metricas["publicados"] += 1
+        for suscripcion in destinos:
+            try:
+                suscripcion.cola.put_nowait(notificacion)
+                entregado = True
+            except queue.Full:
+                suscripcion.desbordada = True
+                entregado = False
+            with self._lock:
+                self._metricas["entregados" if entregado else "descartados"] += 1
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._metricas)
+            datos["conexiones_abiertas"] = self._abiertas
+            datos["usuarios_conectados"] = len(self._suscripciones)
+        return datos
+
+
+hub_notificaciones = HubNotificaciones()
+
+
+def _usa_listen_notify():
+    return current_app.config.get('NOTIF_PUSH_BACKEND') == 'postgres'
+
+
+def publicar_notificaciones(notificaciones):
+    """
+    Envía notificaciones recién creadas (dicts de Notificacion.to_dict()) a los streams SSE
+    de sus usuarios. Se llama dentro de la transacción que las inserta: solo se entregan si
+    esa transacción hace commit.
+
+    - NOTIF_PUSH_BACKEND=postgres: un SELECT pg_notify(...) por lote; PostgreSQL reparte el
+      aviso a todos los workers (cada uno tiene un hilo con LISTEN) al confirmar.
+    - local: se guardan en la sesión y se publican en el hub de este worker tras el commit.
+    """
+    notificaciones = [n for n in notificaciones if n.get('id_usuario')]
+    if not notificaciones:
+        return
+    if not _usa_listen_notify():
+        db.session.info.setdefault('notificaciones_push', []).extend(notificaciones)
+        return
+
+    payloads = []
+    for notificacion in notificaciones:
+        payload = current_app.json.dumps({"id_usuario": notificacion['id_usuario'], "notificacion": notificacion})
+        if len(payload.encode('utf-8')) > _MAX_PAYLOAD:
+            payload = current_app.json.dumps({
+                "id_usuario": notificacion['id_usuario'],
+                "notificacion": {"id_notificacion": notificacion['id_notificacion']}
+            })
+        payloads.append(payload)
+    db.session.execute(
+        text("SELECT pg_notify(:canal, p) FROM unnest(CAST(:payloads AS text[])) AS p"),
+        {"canal": CANAL, "payloads": payloads}
+    )
+
+
+@event.listens_for(Session, 'after_commit')
+def _publicar_tras_commit(session):
+    for notificacion in session.info.pop('notificaciones_push', ()):
+        hub_notificaciones.publicar(notificacion['id_usuario'], notificacion)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_tras_rollback(session):
+    session.info.pop('notificaciones_push', None)
+
+
+def _escuchar(app, detener):
+    """Bucle del hilo LISTEN: pasa cada NOTIFY del canal al hub local. Reconecta si se cae la conexión."""
+    while not detener.is_set():
+        conexion = None
+        try:
+            with app.app_context():
+                # Conexión propia, fuera del pool: queda abierta mientras viva el worker
+                conexion = db.engine.raw_connection()
+                conexion.detach()
+            dbapi = conexion.dbapi_connection
+            dbapi.autocommit = True
+            with dbapi.cursor() as cursor:
+                cursor.execute(f"LISTEN {CANAL}")
+            while not detener.is_set():
+                if select.select([dbapi], [], [], 5) == ([], [], []):
+                    continue
+                dbapi.poll()
+                while dbapi.notifies:
+                    aviso = dbapi.notifies.pop(0)
+                    datos = json.loads(aviso.payload)
+                    hub_notificaciones.publicar(datos['id_usuario'], datos['notificacion'])
+        except Exception as e:
+            print(f"⚠️ Escucha de notificaciones falló, reintentando: {e}")
+            detener.wait(5)
+        finally:
+            if conexion is not None:
+                try:
+                    conexion.close()
+                except Exception:
+                    pass
+
+
+def iniciar_escucha_notificaciones(app):
+    """Hilo LISTEN del worker actual (solo con NOTIF_PUSH_BACKEND=postgres). Devuelve el Event que lo detiene."""
+    if app.config.get('NOTIF_PUSH_BACKEND') != 'postgres':
+        return None
+    detener = threading.Event()
+    hilo = threading.Thread(target=_escuchar, args=(app, detener), name='notificaciones-listen', daemon=True)
+    hilo.start()
+    return detener
+
+
+class FlujoNotificaciones:
+    """
+    Respuesta text/event-stream de una Suscripcion.
+
+    Envía primero las notificaciones 'pendientes' (reconexión con Last-Event-ID), luego cada
+    notificación publicada como 'event: notificacion' con id = id_notificacion. Cada
+    NOTIF_SSE_HEARTBEAT_SECONDS manda un comentario para detectar clientes desconectados, y
+    cierra a los NOTIF_SSE_MAX_SECONDS (EventSource reconecta solo). No usa la base de datos
+    mientras está abierto.
+    """
+
+    def __init__(self, suscripcion, pendientes=()):
+        self.suscripcion = suscripcion
+        self.pendientes = list(pendientes)
+        self._json = current_app.json
+        self._heartbeat = current_app.config.get('NOTIF_SSE_HEARTBEAT_SECONDS', 15)
+        self._duracion = current_app.config.get('NOTIF_SSE_MAX_SECONDS', 300)
+
+    def _evento(self, notificacion, tipo='notificacion'):
+        datos = self._json.dumps(notificacion)
+        id_evento = notificacion.get('id_notificacion')
+        cabecera = f"id: {id_evento}\n" if id_evento else ""
+        return f"{cabecera}event: {tipo}\ndata: {datos}\n\n".encode('utf-8')
+
+    def _generar(self):
+        try:
+            yield b"retry: 3000\n\n"
+            for notificacion in self.pendientes:
+                yield self._evento(notificacion)
+            fin = time.monotonic() + self._duracion
+            while True:
+                restante = fin - time.monotonic()
+                if restante <= 0:
+                    return
+                try:
+                    notificacion = self.suscripcion.cola.get(timeout=min(self._heartbeat, restante))
+                except queue.Empty:
+                    notificacion = None
+                if self.suscripcion.desbordada:
+                    # Se perdieron eventos: el cliente debe volver a pedir la bandeja
+                    yield b"event: resync\ndata: {}\n\n"
+                    return
+                yield self._evento(notificacion) if notificacion is not None else b": ping\n\n"
+        finally:
+            hub_notificaciones.cancelar(self.suscripcion)
+
+    def respuesta(self, status=200):
+        respuesta = Response(self._generar(), status=status, mimetype='text/event-stream',
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        # Si el cliente se va antes de empezar el stream, el finally del generador no corre
+        respuesta.call_on_close(lambda: hub_notificaciones.cancelar(self.suscripcion))
+        return respuesta
@@ -0,0 +1,167 @@
+import base64
+import json
+import uuid
+from datetime import datetime, date
+from decimal import Decimal
+
+from sqlalchemy import and_, or_, false
+
+from app.extensions import db
+
+# Valores por defecto para todas las rutas de listado
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 500
+
+
+class CursorInvalidoError(ValueError):
+    """El cursor enviado por el cliente no se puede decodificar."""
+    pass
+
+
+def normalizar_limite(limit):
+    """Aplica el valor por defecto y el máximo permitido al parámetro 'limit'."""
+    if not limit or limit < 1:
+        return LIMITE_POR_DEFECTO
+    return min(limit, LIMITE_MAXIMO)
+
+
+def _valor_a_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, (uuid.UUID, Decimal)):
+        return str(valor)
+    return valor
+
+
+def _valor_desde_json(columna, valor):
+    """Valor del cursor con el tipo de la columna; TypeError si el JSON trae otro tipo."""
+    if valor is None:
+        return None
+    try:
+        tipo = columna.type.python_type
+    except NotImplementedError:
+        return valor
+    if tipo in (str, datetime, date, uuid.UUID, Decimal):
+        # codificar_cursor los guarda como texto
+        if not isinstance(valor, str):
+            raise TypeError(f"se esperaba texto, llegó {type(valor).__name__}")
+    elif tipo is bool:
+        if not isinstance(valor, bool):
+            raise TypeError(f"se esperaba booleano, llegó {type(valor).__name__}")
+    elif tipo in (int, float):
+        if isinstance(valor, bool) or not isinstance(valor, (int, float) if tipo is float else int):
+            raise TypeError(f"se esperaba número, llegó {type(valor).__name__}")
+    if tipo is datetime:
+        return datetime.fromisoformat(valor)
+    if tipo is date:
+        return date.fromisoformat(valor)
+    if tipo is uuid.UUID:
+        return uuid.UUID(valor)
+    if tipo is Decimal:
+        return Decimal(valor)
+    return valor
+
+
+def codificar_cursor(valores):
+    """Convierte los valores de la última fila en un cursor opaco (base64 url-safe)."""
+    crudo = json.dumps([_valor_a_json(v) for v in valores], separators=(',', ':'))
+    return base64.urlsafe_b64encode(crudo.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor, columnas):
+    """Inverso de codificar_cursor. Lanza CursorInvalidoError si el cursor no corresponde."""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode('utf-8'))
+        if not isinstance(valores, list) or len(valores) != len(columnas):
+            raise ValueError("Cantidad de valores incorrecta")
+        return [_valor_desde_json(col, v) for col, v in zip(columnas, valores)]
+    except (ValueError, TypeError, AttributeError) as e:
+        raise CursorInvalidoError(f"Cursor inválido: {e}")
+    except ArithmeticError:
+        # decimal.InvalidOperation de Decimal('abc')
+        raise CursorInvalidoError("Cursor inválido: número decimal mal formado")
+
+
+def _admite_null(columna):
+    expresion = getattr(columna, 'expression', columna)
+    return getattr(expresion, 'nullable', True) and not getattr(expresion, 'primary_key', False)
+
+
+def _orden(columna, descendente):
+    """
+    ORDER BY de una columna. Si admite NULL se fija el lugar de los NULL como en PostgreSQL
+    (NULL mayor que cualquier valor: al final en ASC, al principio en DESC), que es el
+    orden que recorre un índice B-tree sobre esa columna en cualquiera de los dos sentidos.
+    """
+    if not _admite_null(columna):
+        return columna.desc() if descendente else columna.asc()
+    return columna.desc().nulls_first() if descendente else columna.asc().nulls_last()
+
+
+def _despues_del_cursor(columnas, valores, descendente):
+    """
+    Filas posteriores al cursor en el orden de _orden(), expandido columna por columna:
+    (c1 sigue a v1) OR (c1 = v1 AND c2 sigue a v2) OR ...; con NULL tratado como el mayor valor.
+    """
+    condiciones = []
+    for i, (columna, valor) in enumerate(zip(columnas, valores)):
+        iguales = [c.is_(None) if v is None else c == v for c, v in zip(columnas[:i], valores[:i])]
+        if valor is None:
+            # Después de NULL: en DESC vienen los valores no nulos; en ASC no hay nada
+            if not descendente:
+                continue
+            sigue = columna.isnot(None)
+        elif descendente:
+            sigue = columna < valor
+        elif _admite_null(columna):
+            sigue = or_(columna > valor, columna.is_(None))
+        else:
+            sigue = columna > valor
+        condiciones.append(and_(*iguales, sigue))
+    return or_(*condiciones) if condiciones else false()
+
+
+def paginar_keyset(query, columnas, limit=None, cursor=None, descendente=False, serializar=None):
+    """
+    Pagina una consulta por keyset (cursor) en lugar de OFFSET.
+
+    'columnas' es la clave de orden estable; la combinación debe ser única,
+    por eso la última columna suele ser la PK. Ejemplo: (Venta.fecha_venta, Venta.id_venta).
+    Con cursor se agrega WHERE (col1, col2) < (:v1, :v2) (o '>' si es ascendente),
+    que PostgreSQL resuelve con un índice sobre las mismas columnas. Si alguna columna
+    admite NULL (p. ej. fecha_venta) la comparación de tuplas descartaría esas filas:
+    se usa la condición expandida de _despues_del_cursor y el orden de NULL de _orden.
+
+    Devuelve {"items": [...], "next_cursor": str | None, "limit": int}.
+    """
+    limit = normalizar_limite(limit)
+    columnas = tuple(columnas)
+
+    if cursor:
+        valores = decodificar_cursor(cursor, columnas)
+        if any(_admite_null(c) for c in columnas):
+            query = query.filter(_despues_del_cursor(columnas, valores, descendente))
+        else:
+            clave = db.tuple_(*columnas)
+            limite = db.tuple_(*[db.literal(v, type_=c.type) for c, v in zip(columnas, valores)])
+            query = query.filter(clave < limite if descendente else clave > limite)
+
+    orden = [_orden(c, descendente) for c in columnas]
+    # Se pide una fila extra para saber si existe una página siguiente
+    filas = query.order_by(*orden).limit(limit + 1).all()
+
+    hay_mas = len(filas) > limit
+    filas = filas[:limit]
+
+    next_cursor = None
+    if hay_mas and filas:
+        ultima = filas[-1]
+        next_cursor = codificar_cursor([getattr(ultima, c.key) for c in columnas])
+
+    serializar = serializar or (lambda fila: fila.to_dict())
+    return {
+        "items": [serializar(f) for f in filas],
+        "next_cursor": next_cursor,
+        "limit": limit
+    }
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Límites (ms) de los buckets del histograma de espera por conexión
+_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class MetricasPool:
+    """Contadores por worker de las esperas para obtener una conexión del pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._overflows = 0
+        self._timeouts = 0
+        self._espera_total_ms = 0.0
+        self._espera_max_ms = 0.0
+        self._histograma = [0] * (len(_BUCKETS_MS) + 1)
+
+    def registrar_espera(self, segundos, overflow=False, timeout=False):
+        ms = segundos * 1000
+        indice = next((i for i, limite in enumerate(_BUCKETS_MS) if ms <= limite), len(_BUCKETS_MS))
+        with self._lock:
+            if timeout:
+                self._timeouts += 1
+            else:
+                self._checkouts += 1
+            if overflow:
+                self._overflows += 1
+            self._espera_total_ms += ms
+            self._espera_max_ms = max(self._espera_max_ms, ms)
+            self._histograma[indice] += 1
+
+    def a_dict(self, pool=None):
+        with self._lock:
+            etiquetas = [f"<={b}ms" for b in _BUCKETS_MS] + [f">{_BUCKETS_MS[-1]}ms"]
+            esperas = self._checkouts + self._timeouts
+            datos = {
+                "pid": os.getpid(),
+                "checkouts": self._checkouts,
+                "overflows": self._overflows,
+                "timeouts": self._timeouts,
+                "espera_promedio_ms": round(self._espera_total_ms / esperas, 3) if esperas else 0.0,
+                "espera_max_ms": round(self._espera_max_ms, 3),
+                "histograma_espera": dict(zip(etiquetas, self._histograma)),
+            }
+        if isinstance(pool, QueuePool):
+            datos.update({
+                "tamano": pool.size(),
+                "en_uso": pool.checkedout(),
+                "disponibles": pool.checkedin(),
+                "overflow_actual": max(pool.overflow(), 0),
+            })
+        return datos
+
+
+metricas_pool = MetricasPool()
+
+
+class QueuePoolMedido(QueuePool):
+    """QueuePool que mide cuánto espera cada petición por una conexión y cuándo usa overflow."""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        overflow_antes = self._overflow
+        try:
+            conexion = super()._do_get()
+        except PoolTimeoutError:
+            metricas_pool.registrar_espera(time.perf_counter() - inicio, timeout=True)
+            raise
+        # _overflow crece cuando se abre una conexión por encima de pool_size
+        usa_overflow = self._overflow > overflow_antes and self._overflow > 0
+        metricas_pool.registrar_espera(time.perf_counter() - inicio, overflow=usa_overflow)
+        return conexion
+
+
+def opciones_engine(uri):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS a partir de variables de entorno.
+    Solo se aplican a PostgreSQL (sqlite y similares usan su propio pool).
+    """
+    if not uri or not uri.startswith('postgresql'):
+        return {}
+
+    opciones = {
+        "poolclass": QueuePoolMedido,
+        "pool_size": int(os.getenv('DB_POOL_SIZE', 10)),
+        "max_overflow": int(os.getenv('DB_MAX_OVERFLOW', 5)),
+        "pool_timeout": int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        "pool_recycle": int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        "pool_pre_ping": os.getenv('DB_POOL_PRE_PING', '1') == '1',
+    }
+    # Tiempo máximo por sentencia en el servidor (0 = sin límite)
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+    if statement_timeout > 0:
+        opciones["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+    return opciones
@@ -0,0 +1,138 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app.extensions import db
+from app.models.token_blocklist import TokenBlocklist
+from app.utils.background import iniciar_tarea_periodica
+
+# Margen para no perder filas de transacciones que hicieron commit tarde
+# (created_at se asigna al insertar, no al confirmar)
+_MARGEN_SINCRONIZACION = timedelta(seconds=30)
+
+
+def _a_epoch(fecha_utc):
+    return (fecha_utc - datetime(1970, 1, 1)).total_seconds()
+
+
+def expiracion_desde_claims(claims):
+    """datetime UTC (naive, como el resto de columnas) en que vence el token de estos claims."""
+    if claims.get("exp"):
+        return datetime.utcfromtimestamp(claims["exp"])
+    return datetime.utcnow() + timedelta(seconds=_vida_token_segundos())
+
+
+def _vida_token_segundos():
+    vida = current_app.config.get('JWT_ACCESS_TOKEN_EXPIRES', 3600 * 24)
+    return vida.total_seconds() if isinstance(vida, timedelta) else vida
+
+
+class CacheRevocacion:
+    """
+    Copia en memoria (por worker) de los jti revocados en TokenBlocklist.
+
+    - logout_service / logout_admin_saas_service la alimentan con revocar().
+    - Los demás workers se enteran con un sondeo incremental
+      (WHERE created_at >= última sincronización) como máximo cada
+      JWT_REVOCATION_POLL_SECONDS; el resto de peticiones no consulta la BD.
+    - Cada jti se guarda con la expiración de su token y se descarta al vencer,
+      así el tamaño queda acotado por los tokens todavía válidos.
+    """
+
+    def __init__(self):
+        self._revocados = {}  # jti -> expiración (epoch)
+        self._ultima_sincronizacion = None  # datetime UTC del último sondeo a la BD
+        self._proximo_sondeo = 0.0  # time.monotonic()
+        self._lock = threading.Lock()
+
+    def revocar(self, jti, expiracion=None):
+        """Marca un jti como revocado en este worker (la fila en BD la inserta el servicio)."""
+        if expiracion is None:
+            expiracion = time.time() + _vida_token_segundos()
+        self._revocados[jti] = expiracion
+
+    def esta_revocado(self, jti):
+        self._sincronizar_si_corresponde()
+        return jti in self._revocados
+
+    def _sincronizar_si_corresponde(self):
+        if time.monotonic() < self._proximo_sondeo:
+            return
+        # Si otro hilo ya está sincronizando, se responde con lo que hay en memoria
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() >= self._proximo_sondeo:
+                self._sincronizar()
+                intervalo = current_app.config.get('JWT_REVOCATION_POLL_SECONDS', 5)
+                self._proximo_sondeo = time.monotonic() + intervalo
+        finally:
+            self._lock.release()
+
+    def _sincronizar(self):
+        vida = _vida_token_segundos()
+        ahora = datetime.utcnow()
+        if self._ultima_sincronizacion is None:
+            # Primera carga del worker: solo los tokens que todavía pueden estar vigentes
+            desde = ahora - timedelta(seconds=vida)
+        else:
+            desde = self._ultima_sincronizacion - _MARGEN_SINCRONIZACION
+
+        filas = db.session.query(TokenBlocklist.jti, TokenBlocklist.created_at, TokenBlocklist.expires_at) \
+            .filter(TokenBlocklist.created_at >= desde).all()
+
+        for jti, creado, expira in filas:
+            if expira is not None:
+                expiracion = _a_epoch(expira)
+            else:
+                # Filas antiguas sin expires_at. Cota superior: el token no pudo emitirse después de ser revocado
+                expiracion = _a_epoch(creado) + vida
+            self._revocados.setdefault(jti, expiracion)
+
+        self._ultima_sincronizacion = ahora
+        self._purgar_expirados()
+
+    def _purgar_expirados(self):
+        ahora = time.time()
+        vencidos = [jti for jti, exp in list(self._revocados.items()) if exp < ahora]
+        for jti in vencidos:
+            self._revocados.pop(jti, None)
+
+
+cache_revocacion = CacheRevocacion()
+
+
+def purgar_blocklist_expirada(tamano_lote=None, max_lotes=None):
+    """
+    Borra de TokenBlocklist las filas cuyos tokens ya expiraron, en lotes acotados
+    (DELETE ... WHERE id IN (SELECT id ... LIMIT n)) para no bloquear la tabla con
+    una transacción larga. Devuelve la cantidad de filas borradas.
+    """
+    tamano_lote = tamano_lote or current_app.config.get('TOKEN_BLOCKLIST_PURGE_BATCH', 1000)
+    max_lotes = max_lotes or current_app.config.get('TOKEN_BLOCKLIST_PURGE_MAX_BATCHES', 50)
+    ahora = datetime.utcnow()
+
+    condiciones = (
+        TokenBlocklist.expires_at < ahora,
+        # Filas anteriores a la columna expires_at: vencen una vida de token después de creadas
+        db.and_(TokenBlocklist.expires_at.is_(None),
+                TokenBlocklist.created_at < ahora - timedelta(seconds=_vida_token_segundos())),
+    )
+
+    total = 0
+    for condicion in condiciones:
+        for _ in range(max_lotes):
+            ids = db.select(TokenBlocklist.id).where(condicion).limit(tamano_lote).scalar_subquery()
+            borrados = TokenBlocklist.query.filter(TokenBlocklist.id.in_(ids)) \
+                .delete(synchronize_session=False)
+            db.session.commit()
+            total += borrados
+            if borrados < tamano_lote:
+                break
+    return total
+
+
+def iniciar_purga_blocklist(app):
+    """Arranca la purga periódica cada TOKEN_BLOCKLIST_PURGE_SECONDS (0 = desactivada)."""
+    intervalo = app.config.get('TOKEN_BLOCKLIST_PURGE_SECONDS', 0)
+    return iniciar_tarea_periodica(app, 'purga-token-blocklist', intervalo, purgar_blocklist_expirada)
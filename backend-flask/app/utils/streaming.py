@@ -0,0 +1,133 @@
+import csv
+import io
+from datetime import datetime, timedelta
+from flask import Response, jsonify, stream_with_context
+from app.utils.json_provider import codificar_json
+
+# Tamaño aproximado (bytes) de cada fragmento enviado al cliente
+_TAMANO_FRAGMENTO = 64 * 1024
+
+
+class ArrayJSONStream:
+    """
+    Resultado de un servicio que se envía como array JSON codificado fila a fila.
+
+    La consulta se recorre con yield_per (cursor del lado del servidor en PostgreSQL),
+    así la memoria del worker no crece con la cantidad de filas. La conexión queda
+    ocupada mientras dura la descarga.
+    """
+
+    def __init__(self, query, serializar=None, yield_per=500):
+        self.query = query
+        self.serializar = serializar or (lambda fila: fila.to_dict())
+        self.yield_per = yield_per
+
+    def _generar(self):
+        buffer = bytearray(b'[')
+        primero = True
+        for fila in self.query.yield_per(self.yield_per):
+            if not primero:
+                buffer += b','
+            buffer += codificar_json(self.serializar(fila))
+            primero = False
+            if len(buffer) >= _TAMANO_FRAGMENTO:
+                yield bytes(buffer)
+                buffer.clear()
+        buffer += b']'
+        yield bytes(buffer)
+
+    def respuesta(self, status=200):
+        return Response(stream_with_context(self._generar()), status=status, mimetype='application/json')
+
+
+class ExportacionStream(ArrayJSONStream):
+    """
+    Exportación de una consulta como NDJSON (un objeto JSON por línea) o CSV, en streaming.
+    Las columnas del CSV son las claves del primer to_dict(); los valores anidados
+    (JSONB) se escriben como texto JSON.
+    """
+
+    FORMATOS = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+
+    def __init__(self, query, formato, nombre_archivo, serializar=None, yield_per=1000):
+        if formato not in self.FORMATOS:
+            raise ValueError(f"Formato no soportado: {formato}. Use 'ndjson' o 'csv'")
+        super().__init__(query, serializar, yield_per)
+        self.formato = formato
+        self.nombre_archivo = f"{nombre_archivo}.{formato}"
+
+    def _generar(self):
+        if self.formato == 'csv':
+            yield from self._generar_csv()
+            return
+        buffer = bytearray()
+        for fila in self.query.yield_per(self.yield_per):
+            buffer += codificar_json(self.serializar(fila))
+            buffer += b'\n'
+            if len(buffer) >= _TAMANO_FRAGMENTO:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    def _generar_csv(self):
+        texto = io.StringIO()
+        escritor = None
+        for fila in self.query.yield_per(self.yield_per):
+            datos = self.serializar(fila)
+            if escritor is None:
+                escritor = csv.DictWriter(texto, fieldnames=list(datos.keys()), extrasaction='ignore')
+                escritor.writeheader()
+            escritor.writerow({
+                clave: codificar_json(valor).decode('utf-8') if isinstance(valor, (dict, list)) else valor
+                for clave, valor in datos.items()
+            })
+            if texto.tell() >= _TAMANO_FRAGMENTO:
+                yield texto.getvalue().encode('utf-8')
+                texto.seek(0)
+                texto.truncate()
+        if texto.tell():
+            yield texto.getvalue().encode('utf-8')
+
+    def respuesta(self, status=200):
+        return Response(
+            stream_with_context(self._generar()), status=status,
+            mimetype=self.FORMATOS[self.formato],
+            headers={"Content-Disposition": f'attachment; filename="{self.nombre_archivo}"'}
+        )
+
+
+def rango_fechas(desde=None, hasta=None):
+    """
+    Convierte los parámetros ?desde=&hasta= (ISO 8601) en datetimes.
+    Si 'hasta' es solo una fecha (AAAA-MM-DD) se incluye el día completo.
+    Devuelve (desde, hasta_exclusivo); cualquiera puede ser None. Lanza ValueError si no son válidos.
+    """
+    inicio = datetime.fromisoformat(desde) if desde else None
+    fin = None
+    if hasta:
+        fin = datetime.fromisoformat(hasta)
+        if len(hasta) == 10:
+            fin += timedelta(days=1)
+    if inicio and fin and inicio >= fin:
+        raise ValueError("'desde' debe ser anterior a 'hasta'")
+    return inicio, fin
+
+
+def filtrar_rango(query, columna, desde, hasta):
+    """Aplica desde <= columna < hasta a la consulta (límites opcionales)."""
+    if desde:
+        query = query.filter(columna >= desde)
+    if hasta:
+        query = query.filter(columna < hasta)
+    return query
+
+
+def responder(response, status):
+    """Equivalente a jsonify(response), status que además acepta resultados en streaming (objetos con respuesta())."""
+    if hasattr(response, 'respuesta'):
+        return response.respuesta(status)
+    return jsonify(response), status
@@ -0,0 +1,70 @@
+from flask_jwt_extended import get_jwt
+from app.models.ventas import Venta, DetalleVenta, Pago
+from app.models.compras import Compra, DetalleCompra
+from app.models.inventario import Producto, ProductoProveedor, Inventario
+
+# Modelos que no tienen columna id_empresa propia: se filtran a través de su tabla padre.
+# modelo -> (modelo padre, condición de join)
+_PADRE_CON_EMPRESA = {
+    DetalleVenta: (Venta, DetalleVenta.id_venta == Venta.id_venta),
+    Pago: (Venta, Pago.id_venta == Venta.id_venta),
+    DetalleCompra: (Compra, DetalleCompra.id_compra == Compra.id_compra),
+    Inventario: (Producto, Inventario.id_producto == Producto.id_producto),
+    ProductoProveedor: (Producto, ProductoProveedor.id_producto == Producto.id_producto),
+}
+
+
+def id_empresa_actual():
+    """
+    Devuelve el id_empresa del token JWT de la petición actual.
+    Para SUPER_ADMIN devuelve None: el dueño del SaaS ve todas las empresas.
+    """
+    claims = get_jwt()
+    if claims.get('rol') == 'SUPER_ADMIN':
+        return None
+    return claims.get('id_empresa')
+
+
+def consulta_empresa(modelo, id_empresa=None):
+    """
+    Equivalente a modelo.query pero limitado a la empresa del usuario autenticado
+    (o a 'id_empresa' si se indica, p. ej. la empresa de un registro que se está creando).
+    Usa los índices compuestos (id_empresa, ...) definidos en los modelos.
+
+    Importante: para modelos hijos (Pago, DetalleVenta, Inventario...) la consulta
+    incluye un JOIN con la tabla padre, así que filtrar con filter(Modelo.col == x)
+    en lugar de filter_by().
+
+    Los modelos con relaciones en to_dict() exponen opciones_carga(): con
+    consulta_empresa(...).options(*Modelo.opciones_carga()) esas relaciones llegan en la
+    misma consulta, sin una consulta extra por fila (N+1) en los listados.
+    """
+    query = modelo.query
+    id_empresa = id_empresa or id_empresa_actual()
+    if id_empresa is None:
+        return query
+
+    if hasattr(modelo, 'id_empresa'):
+        return query.filter(modelo.id_empresa == id_empresa)
+
+    padre, condicion = _PADRE_CON_EMPRESA[modelo]
+    return query.join(padre, condicion).filter(padre.id_empresa == id_empresa)
+
+
+def obtener_de_empresa(modelo, id_registro, *opciones, id_empresa=None):
+    """
+    Busca un registro por PK solo dentro de la empresa actual (None si no existe o es de otra).
+    'opciones' son loader options de SQLAlchemy, p. ej. Venta.opciones_carga().
+    Al crear un registro, sus referencias (venta, cliente, producto...) se validan con
+    id_empresa=<empresa del registro nuevo>: así tampoco el SUPER_ADMIN mezcla empresas.
+    """
+    pk = modelo.__mapper__.primary_key[0]
+    return consulta_empresa(modelo, id_empresa).options(*opciones).filter(pk == id_registro).first()
+
+
+def id_empresa_para_crear(data):
+    """
+    Empresa a la que pertenece un registro nuevo: la del token, salvo para SUPER_ADMIN,
+    que debe indicarla en el cuerpo de la petición.
+    """
+    return id_empresa_actual() or data.get('id_empresa')
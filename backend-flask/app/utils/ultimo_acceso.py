@@ -0,0 +1,96 @@
+import atexit
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import values, column, update, or_
+from app.extensions import db
+from app.models.seguridad import Usuario
+from app.utils.background import iniciar_tarea_periodica
+
+
+class BufferUltimoAcceso:
+    """
+    Acumula en memoria (por worker) el último acceso de cada usuario y lo escribe en lotes.
+
+    El login ya no hace UPDATE + commit propio: registra la fecha aquí y una tarea periódica
+    la persiste cada ULTIMO_ACCESO_FLUSH_SECONDS con un único
+    UPDATE usuario SET ultimo_acceso = v.fecha FROM (VALUES ...) AS v por lote.
+    Ese intervalo es el retraso máximo del dato; al apagar el worker se vacía el buffer.
+    """
+
+    def __init__(self):
+        self._pendientes = {}  # id_usuario -> datetime del último acceso
+        self._lock = threading.Lock()
+
+    def registrar(self, id_usuario, fecha=None):
+        fecha = fecha or datetime.utcnow()
+        intervalo = current_app.config.get('ULTIMO_ACCESO_FLUSH_SECONDS', 10)
+        with self._lock:
+            anterior = self._pendientes.get(id_usuario)
+            if anterior is None or fecha > anterior:
+                self._pendientes[id_usuario] = fecha
+            lleno = len(self._pendientes) >= current_app.config.get('ULTIMO_ACCESO_MAX_BUFFER', 5000)
+        # Sin tarea periódica (intervalo 0) o buffer lleno: se escribe en el momento.
+        # Un fallo no debe tumbar el login: los accesos quedan en el buffer para el próximo intento.
+        if intervalo <= 0 or lleno:
+            try:
+                self.vaciar()
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar ultimo_acceso: {e}")
+
+    def vaciar(self):
+        """
+        Escribe los accesos pendientes en una transacción propia (db.engine.begin()), sin tocar
+        db.session: llamado desde una petición no confirma ni revierte el trabajo de esa petición.
+        Devuelve la cantidad de usuarios enviados a la BD.
+        """
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        if not pendientes:
+            return 0
+
+        tamano_lote = current_app.config.get('ULTIMO_ACCESO_BATCH', 500)
+        filas = list(pendientes.items())
+        try:
+            with db.engine.begin() as conexion:
+                for inicio in range(0, len(filas), tamano_lote):
+                    lote = values(
+                        column('id_usuario', Usuario.id_usuario.type),
+                        column('ultimo_acceso', Usuario.ultimo_acceso.type),
+                        name='v'
+                    ).data(filas[inicio:inicio + tamano_lote])
+                    conexion.execute(
+                        update(Usuario.__table__)
+                        .where(Usuario.id_usuario == lote.c.id_usuario)
+                        # Nunca retroceder la fecha si otro worker ya escribió una más reciente
+                        .where(or_(Usuario.ultimo_acceso.is_(None), Usuario.ultimo_acceso < lote.c.ultimo_acceso))
+                        .values(ultimo_acceso=lote.c.ultimo_acceso)
+                    )
+        except Exception:
+            # Se devuelven al buffer para el próximo intento, sin pisar accesos más nuevos
+            with self._lock:
+                for id_usuario, fecha in filas:
+                    actual = self._pendientes.get(id_usuario)
+                    if actual is None or fecha > actual:
+                        self._pendientes[id_usuario] = fecha
+            raise
+        return len(filas)
+
+
+buffer_ultimo_acceso = BufferUltimoAcceso()
+
+
+def iniciar_escritura_ultimo_acceso(app):
+    """Vacía el buffer cada ULTIMO_ACCESO_FLUSH_SECONDS y una última vez al terminar el proceso."""
+    def vaciar_al_salir():
+        with app.app_context():
+            try:
+                buffer_ultimo_acceso.vaciar()
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar ultimo_acceso al apagar: {e}")
+            finally:
+                db.session.remove()
+
+    atexit.register(vaciar_al_salir)
+    intervalo = app.config.get('ULTIMO_ACCESO_FLUSH_SECONDS', 0)
+    return iniciar_tarea_periodica(app, 'ultimo-acceso', intervalo, buffer_ultimo_acceso.vaciar)
@@ -0,0 +1,73 @@
+"""
+Configuración de gunicorn para producción:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Todos los valores se pueden cambiar con variables de entorno (ver .env).
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Procesos (uno por núcleo aprox.) x hilos por proceso = peticiones simultáneas
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# gthread. Los streams SSE (/api/notificaciones/stream) se sirven aparte con gunicorn_sse.conf.py (gevent)
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+# La app se importa una vez en el master y los workers la heredan con el fork
+preload_app = True
+
+# Reciclado de workers: se reemplazan tras N peticiones (con jitter para que no reinicien a la vez)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+
+
+def on_starting(server):
+    # En producción el esquema se gestiona con el SQL del README; create_all solo si se pide
+    if os.getenv('DB_CREATE_ALL', '0') == '1':
+        from app import crear_tablas
+        from wsgi import app
+        crear_tablas(app)
+
+
+def post_fork(server, worker):
+    from app import iniciar_tareas_segundo_plano
+    from app.extensions import db
+    from wsgi import app
+
+    # Las conexiones abiertas en el master no se comparten entre procesos
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    iniciar_tareas_segundo_plano(app)
+
+
+def worker_int(worker):
+    # Ctrl+C / SIGQUIT: salida inmediata del worker
+    _vaciar_pendientes()
+
+
+def worker_abort(worker):
+    # SIGABRT: el master lo envía al worker que superó timeout
+    _vaciar_pendientes()
+
+
+def worker_exit(server, worker):
+    # Salida normal (SIGTERM, max_requests), después de atender las peticiones en curso
+    _vaciar_pendientes()
+
+
+def _vaciar_pendientes():
+    from app import vaciar_pendientes
+    from wsgi import app
+
+    vaciar_pendientes(app)
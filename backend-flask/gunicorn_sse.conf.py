@@ -0,0 +1,69 @@
+"""
+Servidor aparte para los streams SSE de notificaciones (/api/notificaciones/stream):
+
+    gunicorn -c gunicorn_sse.conf.py wsgi:app
+
+Con workers gevent cada stream abierto es una greenlet y no un hilo, así un worker sostiene
+miles de clientes inactivos sin quitarle hilos a la API. El proxy envía
+/api/notificaciones/stream a este servidor y el resto de /api al de gunicorn.conf.py.
+Los eventos llegan a cualquier worker por LISTEN/NOTIFY (NOTIF_PUSH_BACKEND=postgres).
+
+Requiere gevent; con psycogreen instalado las consultas a PostgreSQL ceden el control
+en lugar de bloquear el worker.
+"""
+import os
+
+# Antes de cargar la app: create_app() calcula con esto el límite de streams por worker
+os.environ.setdefault('GUNICORN_WORKER_CLASS', 'gevent')
+
+bind = os.getenv('GUNICORN_SSE_BIND', '0.0.0.0:5001')
+workers = int(os.getenv('GUNICORN_SSE_WORKERS', 2))
+worker_class = 'gevent'
+worker_connections = int(os.getenv('GUNICORN_SSE_CONEXIONES', 1000))
+
+# La app se carga en cada worker, después del monkey-patching de gevent
+preload_app = False
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        server.log.warning("psycogreen no está instalado: las consultas bloquean el worker SSE mientras duran")
+
+
+def post_worker_init(worker):
+    from app import iniciar_tareas_segundo_plano
+    from wsgi import app
+
+    iniciar_tareas_segundo_plano(app)
+
+
+def worker_int(worker):
+    # Ctrl+C / SIGQUIT: salida inmediata del worker
+    _vaciar_pendientes()
+
+
+def worker_abort(worker):
+    # SIGABRT: el master lo envía al worker que superó timeout
+    _vaciar_pendientes()
+
+
+def worker_exit(server, worker):
+    # Salida normal (SIGTERM, max_requests), después de atender las peticiones en curso
+    _vaciar_pendientes()
+
+
+def _vaciar_pendientes():
+    from app import vaciar_pendientes
+    from wsgi import app
+
+    vaciar_pendientes(app)
@@ -1,26 +1,22 @@
-from app import create_app
-from app.extensions import db
+import os
+from app import create_app, crear_tablas, iniciar_tareas_segundo_plano
 
-# Crea la instancia de la aplicación usando la fábrica que definimos en __init__.py
-app = create_app()
+# Crea la instancia de la aplicación usando la fábrica que definimos en __init__.py.
+# Las tareas en segundo plano se arrancan abajo, solo en el proceso que atiende peticiones.
+app = create_app(iniciar_tareas=False)
 
 if __name__ == '__main__':
-    # Esto asegura que las tablas se creen en la BD si no existen
-    with app.app_context():
-        # --- IMPORTANTE: Importar TODOS los modelos aquí ---
-        # Si no los importas, SQLAlchemy no sabrá que existen y no creará las tablas.
-        
-        from app.models import saas        # <--- ¡CRÍTICO! Para las tablas nuevas
-        from app.models import empresa     # Configuración y Empresa
-        from app.models import seguridad   # Usuarios y Roles
-        from app.models import inventario  # Productos, Proveedores, Categorías
-        from app.models import ventas      # Clientes, Ventas, Pagos
-        from app.models import compras     # Compras
-        from app.models import soporte     # Notificaciones, Auditoría
+    # Servidor de DESARROLLO. En producción usar gunicorn (ver gunicorn.conf.py / README).
+    debug = os.getenv('FLASK_DEBUG', '1') == '1'
 
-        # Crea todas las tablas definidas en los modelos importados
-        db.create_all()
-        print(">>> Base de datos conectada. Tablas verificadas y creadas exitosamente.")
+    # Con debug el reloader ejecuta este archivo dos veces: un proceso que vigila los archivos y
+    # otro (WERKZEUG_RUN_MAIN=true) que sirve la app. Hilos, pools y LISTEN solo en el segundo.
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Esto asegura que las tablas se creen en la BD si no existen (DB_CREATE_ALL=0 para omitirlo)
+        if os.getenv('DB_CREATE_ALL', '1') == '1':
+            crear_tablas(app)
+            print(">>> Base de datos conectada. Tablas verificadas y creadas exitosamente.")
+        iniciar_tareas_segundo_plano(app)
 
     # Inicia el servidor de desarrollo
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=debug)
@@ -0,0 +1,5 @@
+from app import create_app
+
+# Punto de entrada para servidores WSGI de producción: gunicorn -c gunicorn.conf.py wsgi:app
+# Las tareas en segundo plano las arranca cada worker en post_fork (gunicorn.conf.py).
+app = create_app(iniciar_tareas=False)
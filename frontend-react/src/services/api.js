@@ -59,4 +59,16 @@ api.interceptors.response.use(
     }
 );
 
+// Listados paginados por cursor: pide páginas siguiendo next_cursor hasta traer todos los items
+export const obtenerTodos = async (url, params = {}) => {
+    const items = [];
+    let cursor = null;
+    do {
+        const response = await api.get(url, { params: { ...params, limit: 500, cursor: cursor || undefined } });
+        items.push(...response.data.items);
+        cursor = response.data.next_cursor;
+    } while (cursor);
+    return items;
+};
+
 export default api;
\ No newline at end of file
@@ -0,0 +1,82 @@
+// src/services/notificacionesStream.js
+import api from './api';
+
+// Stream SSE de notificaciones (GET /notificaciones/stream).
+// EventSource no permite enviar el header Authorization, así que se lee el stream con fetch
+// y se reconecta con Last-Event-ID como haría el navegador.
+export const abrirStreamNotificaciones = ({ onNotificacion, onResync, onError } = {}) => {
+    const controller = new AbortController();
+    let ultimoId = null;
+    let reintentoMs = 3000;
+    let cerrado = false;
+
+    const procesarBloque = (bloque) => {
+        let evento = 'message';
+        let datos = [];
+        for (const linea of bloque.split('\n')) {
+            if (!linea || linea.startsWith(':')) continue;  // ping / comentario
+            const sep = linea.indexOf(':');
+            const campo = sep === -1 ? linea : linea.slice(0, sep);
+            const valor = sep === -1 ? '' : linea.slice(sep + 1).replace(/^ /, '');
+            if (campo === 'event') evento = valor;
+            else if (campo === 'data') datos.push(valor);
+            else if (campo === 'id') ultimoId = valor;
+            else if (campo === 'retry' && /^\d+$/.test(valor)) reintentoMs = Number(valor);
+        }
+        if (evento === 'notificacion' && datos.length) {
+            onNotificacion?.(JSON.parse(datos.join('\n')));
+        } else if (evento === 'resync') {
+            onResync?.();
+        }
+    };
+
+    const conectar = async () => {
+        while (!cerrado) {
+            try {
+                const headers = { Accept: 'text/event-stream' };
+                const token = localStorage.getItem('token');
+                if (token) headers.Authorization = `Bearer ${token}`;
+                if (ultimoId) headers['Last-Event-ID'] = ultimoId;
+
+                const response = await fetch(`${api.defaults.baseURL}/notificaciones/stream`, {
+                    headers,
+                    signal: controller.signal,
+                });
+                // Token inválido o sin permiso: reconectar no sirve
+                if (response.status === 401 || response.status === 403) {
+                    onError?.({ status: response.status });
+                    return;
+                }
+                if (!response.ok) throw { status: response.status };
+
+                const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+                let buffer = '';
+                for (;;) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += value.replace(/\r\n?/g, '\n');
+                    let fin;
+                    while ((fin = buffer.indexOf('\n\n')) !== -1) {
+                        procesarBloque(buffer.slice(0, fin));
+                        buffer = buffer.slice(fin + 2);
+                    }
+                }
+            } catch (error) {
+                if (cerrado) return;
+                onError?.(error);
+            }
+            // El servidor cierra el stream cada NOTIF_SSE_MAX_SECONDS (o respondió 503): reconectar
+            await new Promise((resolve) => setTimeout(resolve, reintentoMs));
+        }
+    };
+
+    conectar();
+
+    // Cerrar el stream (p. ej. al desmontar el componente o al hacer logout)
+    return () => {
+        cerrado = true;
+        controller.abort();
+    };
+};
+
+export default abrirStreamNotificaciones;
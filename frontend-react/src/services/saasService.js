@@ -1,5 +1,5 @@
 // src/services/saasService.js
-import api from './api';
+import api, { obtenerTodos } from './api';
 
 const saasService = {
   // ==========================================
@@ -25,8 +25,7 @@ const saasService = {
 
   getPagosPendientes: async () => {
     try {
-      const response = await api.get('/saas/dashboard/pagos-pendientes');
-      return response.data;
+      return await obtenerTodos('/saas/dashboard/pagos-pendientes');
     } catch (error) {
       throw error.response?.data || { error: 'Error al obtener pagos pendientes' };
     }
@@ -37,8 +36,7 @@ const saasService = {
   // ==========================================
   getAdminsSaas: async () => {
     try {
-      const response = await api.get('/saas/admins');
-      return response.data;
+      return await obtenerTodos('/saas/admins');
     } catch (error) {
       throw error.response?.data || { error: 'Error al obtener administradores' };
     }
@@ -46,8 +44,7 @@ const saasService = {
 
   getAdminsSaasInactivos: async () => {
     try {
-      const response = await api.get('/saas/admins/inactivos');
-      return response.data;
+      return await obtenerTodos('/saas/admins/inactivos');
     } catch (error) {
       throw error.response?.data || { error: 'Error al obtener administradores inactivos' };
     }
@@ -103,8 +100,7 @@ const saasService = {
   // ==========================================
   getPlanes: async () => {
     try {
-      const response = await api.get('/planes');
-      return response.data;
+      return await obtenerTodos('/planes');
     } catch (error) {
       throw error.response?.data || { error: 'Error al obtener planes' };
     }
@@ -151,8 +147,7 @@ const saasService = {
   // ==========================================
   getSuscripciones: async () => {
     try {
-      const response = await api.get('/suscripciones');
-      return response.data;
+      return await obtenerTodos('/suscripciones');
     } catch (error) {
       throw error.response?.data || { error: 'Error al obtener suscripciones' };
     }
@@ -203,8 +198,7 @@ const saasService = {
   // ==========================================
   getEmpresas: async () => {
     try {
-      const response = await api.get('/empresas');
-      return response.data;
+      return await obtenerTodos('/empresas');
     } catch (error) {
       throw error.response?.data || { error: 'Error al obtener empresas' };
     }
@@ -216,8 +210,7 @@ const saasService = {
     // ==========================================
   getEmpresasConPropietarios: async () => {
     try {
-        const response = await api.get('/saas/empresas');
-        return response.data;
+        return await obtenerTodos('/saas/empresas');
     } catch (error) {
         throw error.response?.data || { error: 'Error al obtener empresas' };
     }
@@ -1,12 +1,11 @@
 // src/services/usuarioService.js
-import api from './api';
+import api, { obtenerTodos } from './api';
 
 const usuarioService = {
     // Obtener todos los usuarios activos de la empresa
     getUsuarios: async () => {
         try {
-            const response = await api.get('/usuarios');
-            return response.data;
+            return await obtenerTodos('/usuarios');
         } catch (error) {
             throw error.response?.data || { error: 'Error al obtener usuarios' };
         }
@@ -15,8 +14,7 @@ const usuarioService = {
     // Obtener usuarios inactivos de la empresa
     getUsuariosInactivos: async () => {
         try {
-            const response = await api.get('/usuarios/inactivos');
-            return response.data;
+            return await obtenerTodos('/usuarios/inactivos');
         } catch (error) {
             throw error.response?.data || { error: 'Error al obtener usuarios inactivos' };
         }
@@ -85,8 +83,7 @@ const usuarioService = {
     // Obtener roles disponibles
     getRoles: async () => {
         try {
-            const response = await api.get('/roles');
-            return response.data;
+            return await obtenerTodos('/roles');
         } catch (error) {
             throw error.response?.data || { error: 'Error al obtener roles' };
         }